@@ -1,58 +1,122 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 from langchain.agents import AgentExecutor
-from langchain.memory import ConversationBufferMemory
+from langchain.callbacks.base import AsyncCallbackHandler
 from langchain.schema import BaseMessage
 from langchain.tools import BaseTool
-from langchain_community.llms import Ollama
+from langchain_core.language_models import BaseLanguageModel
 from langchain.agents.openai_functions_agent.base import OpenAIFunctionsAgent
 from langchain.prompts import MessagesPlaceholder
+import asyncio
+import logging
 import os
+import time
+from uuid import UUID
 from dotenv import load_dotenv
+from .llm_gateway import GatewayLLM, get_llm_gateway
+from .session_memory import SessionMemoryStore, count_tokens
+from ..services.metrics import record, span
+from ..services.response_cache import SemanticResponseCache
+from ..tools.tool_output import TOOL_OUTPUT_MAX_TOKENS
 
 # 加載環境變量
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# 每輪送給 LLM 的 prompt token 上限（系統提示、歷史、輸入與工具結果合計）
+AGENT_PROMPT_MAX_TOKENS = int(os.getenv("AGENT_PROMPT_MAX_TOKENS", "3000"))
+# 每輪最多呼叫工具的次數，每次的結果不超過 TOOL_OUTPUT_MAX_TOKENS
+AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "3"))
+# AgentExecutor 達到迭代或時間上限時返回的固定文字
+EARLY_STOP_OUTPUTS = {
+    "Agent stopped due to iteration limit or time limit.",
+    "Agent stopped due to max iterations."
+}
+# handle_parsing_errors 把無法解析的 LLM 輸出記錄為這個工具的呼叫
+PARSING_ERROR_TOOL = "_Exception"
+
+class StreamingCallbackHandler(AsyncCallbackHandler):
+    """將 LLM token 與工具呼叫事件轉送到佇列"""
+
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        await self.queue.put({"type": "delta", "content": token})
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        await self.queue.put({"type": "tool_start", "tool": serialized.get("name"), "input": input_str})
+
+    async def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        await self.queue.put({"type": "tool_end", "tool": kwargs.get("name")})
+
+class MetricsCallbackHandler(AsyncCallbackHandler):
+    """記錄每次工具呼叫的耗時"""
+
+    def __init__(self):
+        self._started: Dict[UUID, Tuple[str, float]] = {}
+
+    async def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = (serialized.get("name") or "unknown", time.perf_counter())
+
+    def _finish(self, run_id: UUID, status: str):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            record("tool", time.perf_counter() - started[1], tool=started[0], status=status)
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "ok")
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, "error")
+
 class BaseAgent:
     def __init__(
         self,
         name: str,
         tools: List[BaseTool],
-        llm: Optional[Ollama] = None,
-        memory: Optional[ConversationBufferMemory] = None,
+        llm: Optional[BaseLanguageModel] = None,
+        sessions: Optional[SessionMemoryStore] = None,
+        response_cache: Optional[SemanticResponseCache] = None,
         verbose: bool = True
     ):
         self.name = name
         self.tools = tools
         
-        # 使用 Ollama 本地模型
-        self.llm = llm or Ollama(
+        # 使用 Ollama 本地模型（經由共用閘道：連線池、併發上限與請求期限）
+        self.llm = llm or GatewayLLM(
             model=os.getenv("MODEL_NAME", "mistral"),  # 使用 Mistral 模型
             temperature=float(os.getenv("TEMPERATURE", "0.7")),
+            gateway=get_llm_gateway()
         )
         
-        self.memory = memory or ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        # 每個對話（client_id）各自保留有上限的歷史
+        self.sessions = sessions or SessionMemoryStore()
+        # 可選的語意回應快取：相似的問題直接返回先前的回答，不呼叫 LLM
+        self.response_cache = response_cache
         self.verbose = verbose
         
         # 創建Agent
+        system_message = self._get_system_message()
+        self._system_tokens = count_tokens(system_message)
         self.agent = OpenAIFunctionsAgent.from_llm_and_tools(
             llm=self.llm,
             tools=self.tools,
-            system_message=self._get_system_message(),
+            system_message=system_message,
             extra_prompt_messages=[
                 MessagesPlaceholder(variable_name="chat_history")
             ]
         )
         
-        # 創建Agent執行器
+        # 創建Agent執行器（對話歷史由 sessions 在每次呼叫時提供）
         self.agent_executor = AgentExecutor.from_agent_and_tools(
             agent=self.agent,
             tools=self.tools,
-            memory=self.memory,
             verbose=self.verbose,
-            handle_parsing_errors=True
+            handle_parsing_errors=True,
+            max_iterations=AGENT_MAX_ITERATIONS,
+            # 用於判斷這一輪是否正常結束（只快取正常結束的回答）
+            return_intermediate_steps=True
         )
     
     def _get_system_message(self) -> str:
@@ -61,10 +125,66 @@ class BaseAgent:
         你的職責是幫助用戶解決關於3C產品的問題，包括產品諮詢、訂單查詢、售後服務等。
         請始終保持專業、友善的態度，並確保提供準確的信息。"""
     
-    async def run(self, input_text: str) -> Dict[str, Any]:
+    def _history_budget(self, input_text: str) -> int:
+        """扣除系統提示、本輪輸入與工具結果的預留量後，可用於歷史的 token 數"""
+        reserved = self._system_tokens + count_tokens(input_text) + AGENT_MAX_ITERATIONS * TOOL_OUTPUT_MAX_TOKENS
+        return max(0, AGENT_PROMPT_MAX_TOKENS - reserved)
+
+    def _build_input(self, input_text: str, session_id: str) -> Dict[str, Any]:
+        """組合本輪輸入與該對話在 prompt 預算內的歷史"""
+        return {
+            "input": input_text,
+            "chat_history": self.sessions.history(session_id, self._history_budget(input_text))
+        }
+    
+    async def _cache_lookup(self, input_text: str) -> Tuple[Optional[Dict[str, Any]], Optional[Any]]:
+        """查詢語意回應快取，返回 (命中的回答, 訊息向量)；無法使用快取時向量為 None"""
+        cache = self.response_cache
+        if cache is None:
+            return None, None
+        if not cache.cacheable(input_text):
+            cache.record_bypass()
+            return None, None
+        try:
+            vector = await asyncio.to_thread(cache.encode, input_text)
+        except Exception as e:
+            logger.warning(f"Response cache lookup skipped: {e}")
+            cache.record_bypass()
+            return None, None
+        return cache.lookup(input_text, vector), vector
+
+    @staticmethod
+    def _finished_normally(response: Dict[str, Any]) -> bool:
+        """Agent 自行給出回答，而非達到迭代上限或經過解析錯誤的重試"""
+        if response["output"] in EARLY_STOP_OUTPUTS:
+            return False
+        return all(action.tool != PARSING_ERROR_TOOL for action, _ in response.get("intermediate_steps", []))
+
+    def _cache_store(self, input_text: str, vector: Optional[Any], response: Dict[str, Any]):
+        if self.response_cache is None or vector is None:
+            return
+        if self._finished_normally(response):
+            self.response_cache.store(input_text, vector, response["output"])
+
+    async def run(self, input_text: str, session_id: str = "default") -> Dict[str, Any]:
         """運行Agent並返回結果"""
         try:
-            response = await self.agent_executor.ainvoke({"input": input_text})
+            cached, vector = await self._cache_lookup(input_text)
+            if cached is not None:
+                self.sessions.save_turn(session_id, input_text, cached["response"])
+                return {
+                    "status": "success",
+                    "response": cached["response"],
+                    "agent_name": self.name,
+                    "cached": True
+                }
+            with span("agent"):
+                response = await self.agent_executor.ainvoke(
+                    self._build_input(input_text, session_id),
+                    config={"callbacks": [MetricsCallbackHandler()]}
+                )
+            self.sessions.save_turn(session_id, input_text, response["output"])
+            self._cache_store(input_text, vector, response)
             return {
                 "status": "success",
                 "response": response["output"],
@@ -77,6 +197,67 @@ class BaseAgent:
                 "agent_name": self.name
             }
     
-    def get_memory(self) -> List[BaseMessage]:
+    async def astream(self, input_text: str, session_id: str = "default") -> AsyncIterator[Dict[str, Any]]:
+        """運行Agent並逐步產生事件
+
+        依序產生 tool_start / tool_end / delta 事件，最後一個事件的 type 為
+        "final"，內容與 run() 的返回值相同。中途停止迭代會取消 Agent 執行。
+        命中回應快取時只產生 "final" 事件（cached 為 True）。
+        """
+        cached, vector = await self._cache_lookup(input_text)
+        if cached is not None:
+            self.sessions.save_turn(session_id, input_text, cached["response"])
+            yield {
+                "type": "final",
+                "status": "success",
+                "response": cached["response"],
+                "agent_name": self.name,
+                "cached": True
+            }
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        handler = StreamingCallbackHandler(queue)
+
+        async def invoke() -> Dict[str, Any]:
+            try:
+                return await self.agent_executor.ainvoke(
+                    self._build_input(input_text, session_id),
+                    config={"callbacks": [handler, MetricsCallbackHandler()]}
+                )
+            finally:
+                record("agent", time.perf_counter() - start)
+                await queue.put(None)
+
+        start = time.perf_counter()
+        task = asyncio.create_task(invoke())
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+            try:
+                response = await task
+                self.sessions.save_turn(session_id, input_text, response["output"])
+                self._cache_store(input_text, vector, response)
+                yield {
+                    "type": "final",
+                    "status": "success",
+                    "response": response["output"],
+                    "agent_name": self.name
+                }
+            except Exception as e:
+                yield {
+                    "type": "final",
+                    "status": "error",
+                    "error": str(e),
+                    "agent_name": self.name
+                }
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    def get_memory(self, session_id: str = "default") -> List[BaseMessage]:
         """獲取對話歷史"""
-        return self.memory.chat_memory.messages 
\ No newline at end of file
+        return self.sessions.history(session_id) 
\ No newline at end of file
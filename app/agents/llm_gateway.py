@@ -0,0 +1,326 @@
+from typing import List, Dict, Any, Optional, AsyncIterator
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import httpx
+from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from pydantic import ConfigDict
+from ..services.metrics import record
+
+logger = logging.getLogger(__name__)
+
+# 以逗號分隔多個 Ollama 伺服器，請求會送到目前負載最低的伺服器
+OLLAMA_BASE_URLS = os.getenv("OLLAMA_BASE_URLS", os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# 單一請求（含排隊）的最長時間（秒）
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# 連線失敗的伺服器暫停分派的時間（秒）
+LLM_BACKEND_COOLDOWN = float(os.getenv("LLM_BACKEND_COOLDOWN", "10"))
+
+
+class LLMGatewayError(Exception):
+    """LLM 閘道錯誤"""
+
+
+class LLMTimeoutError(LLMGatewayError):
+    """超過請求期限"""
+
+
+class OllamaBackend:
+    """單一 Ollama 伺服器與其負載狀態"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.in_flight = 0
+        self.completed = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.base_url,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failures": self.failures,
+            "available": self.down_until <= time.monotonic()
+        }
+
+
+class OllamaGateway:
+    """Ollama 連線閘道
+
+    - 共用 httpx 連線池，重複使用 HTTP 連線
+    - 以 FIFO 的 asyncio.Semaphore 限制同時生成的數量，排隊公平
+    - 每個請求有期限（含排隊時間），逾時或呼叫端取消時關閉串流以中止生成
+    - 多個伺服器時送往進行中請求最少的伺服器，連線失敗的伺服器暫時略過
+    """
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        timeout: float = LLM_REQUEST_TIMEOUT,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT
+    ):
+        if not base_urls:
+            raise ValueError("At least one Ollama base URL is required")
+        self.backends = [OllamaBackend(url) for url in base_urls]
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._limits = httpx.Limits(
+            max_connections=self.max_concurrency * len(self.backends),
+            max_keepalive_connections=self.max_concurrency * len(self.backends)
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._stats = {"requests": 0, "timeouts": 0, "cancelled": 0, "errors": 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=self._limits,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout)
+            )
+        return self._client
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _pick_backend(self) -> OllamaBackend:
+        """選擇進行中請求最少的可用伺服器，平手時輪流"""
+        now = time.monotonic()
+        with self._lock:
+            available = [backend for backend in self.backends if backend.down_until <= now] or self.backends
+            offset = next(self._round_robin)
+            ordered = available[offset % len(available):] + available[:offset % len(available)]
+            backend = min(ordered, key=lambda b: b.in_flight)
+            backend.in_flight += 1
+            return backend
+
+    def _release_backend(self, backend: OllamaBackend, failed: bool):
+        with self._lock:
+            backend.in_flight -= 1
+            if failed:
+                backend.failures += 1
+                backend.down_until = time.monotonic() + LLM_BACKEND_COOLDOWN
+            else:
+                backend.completed += 1
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    @staticmethod
+    def _payload(model: str, prompt: str, options: Dict[str, Any], stop: Optional[List[str]], stream: bool) -> Dict[str, Any]:
+        payload_options = dict(options)
+        if stop:
+            payload_options["stop"] = stop
+        return {"model": model, "prompt": prompt, "options": payload_options, "stream": stream}
+
+    async def stream_generate(
+        self,
+        model: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        stop: Optional[List[str]] = None,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """串流生成文字片段"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        deadline = loop.time() + (timeout or self.timeout)
+        semaphore = self._get_semaphore()
+        self._count("requests")
+
+        # 排隊等待生成名額
+        with self._lock:
+            self._waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            raise LLMTimeoutError("Timed out waiting for an LLM slot")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        record("llm_queue", time.perf_counter() - started)
+
+        payload = self._payload(model, prompt, options or {}, stop, stream=True)
+        first_token = True
+        try:
+            for attempt in range(len(self.backends)):
+                backend = self._pick_backend()
+                failed = False
+                try:
+                    async with self._get_client().stream(
+                        "POST",
+                        f"{backend.base_url}/api/generate",
+                        json=payload,
+                        timeout=httpx.Timeout(max(0.1, deadline - loop.time()), connect=self.connect_timeout)
+                    ) as response:
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if loop.time() > deadline:
+                                self._count("timeouts")
+                                raise LLMTimeoutError("LLM generation exceeded its deadline")
+                            if not line:
+                                continue
+                            chunk = json.loads(line)
+                            if chunk.get("error"):
+                                raise LLMGatewayError(chunk["error"])
+                            if chunk.get("response"):
+                                if first_token:
+                                    # 首個 token 的延遲包含排隊時間
+                                    first_token = False
+                                    record("llm_first_token", time.perf_counter() - started, model=model)
+                                yield chunk["response"]
+                            if chunk.get("done"):
+                                break
+                    record("llm_completion", time.perf_counter() - started, model=model)
+                    return
+                except asyncio.CancelledError:
+                    # 呼叫端（例如 WebSocket 斷線）取消：離開 stream 區塊即關閉連線，伺服器停止生成
+                    self._count("cancelled")
+                    raise
+                except httpx.ConnectError as e:
+                    failed = True
+                    self._count("errors")
+                    # 尚未送出請求，改送到下一個伺服器
+                    if attempt + 1 < len(self.backends):
+                        logger.warning(f"Ollama backend {backend.base_url} unavailable, retrying on another backend: {e}")
+                        continue
+                    raise LLMGatewayError(f"Ollama backend {backend.base_url} unavailable: {e}")
+                except httpx.TimeoutException:
+                    self._count("timeouts")
+                    raise LLMTimeoutError("LLM request timed out")
+                except httpx.RemoteProtocolError as e:
+                    failed = True
+                    self._count("errors")
+                    raise LLMGatewayError(f"Ollama backend {backend.base_url} closed the connection: {e}")
+                except httpx.HTTPStatusError as e:
+                    self._count("errors")
+                    raise LLMGatewayError(f"Ollama backend {backend.base_url} returned {e.response.status_code}")
+                finally:
+                    self._release_backend(backend, failed)
+        finally:
+            semaphore.release()
+
+    async def generate(self, model: str, prompt: str, **kwargs: Any) -> str:
+        """生成完整文字"""
+        return "".join([chunk async for chunk in self.stream_generate(model, prompt, **kwargs)])
+
+    def generate_sync(
+        self,
+        model: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        stop: Optional[List[str]] = None
+    ) -> str:
+        """同步生成（連線池大小即為併發上限）"""
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(
+                limits=self._limits,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout)
+            )
+        backend = self._pick_backend()
+        failed = False
+        started = time.perf_counter()
+        try:
+            response = self._sync_client.post(
+                f"{backend.base_url}/api/generate",
+                json=self._payload(model, prompt, options or {}, stop, stream=False)
+            )
+            response.raise_for_status()
+            text = response.json().get("response", "")
+            record("llm_completion", time.perf_counter() - started, model=model)
+            return text
+        except httpx.ConnectError as e:
+            failed = True
+            raise LLMGatewayError(f"Ollama backend {backend.base_url} unavailable: {e}")
+        finally:
+            self._release_backend(backend, failed)
+
+    def stats(self) -> Dict[str, Any]:
+        """排隊數、各伺服器負載與逾時/取消計數"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["waiting"] = self._waiting
+            stats["max_concurrency"] = self.max_concurrency
+            stats["backends"] = [backend.stats() for backend in self.backends]
+        return stats
+
+    async def aclose(self):
+        """關閉連線池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+class GatewayLLM(LLM):
+    """透過 OllamaGateway 呼叫 Ollama 的 LangChain LLM"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    model: str = "mistral"
+    temperature: float = 0.7
+    gateway: OllamaGateway
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-gateway"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "temperature": self.temperature}
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        return self.gateway.generate_sync(self.model, prompt, {"temperature": self.temperature}, stop)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        chunks = []
+        async for chunk in self.gateway.stream_generate(self.model, prompt, {"temperature": self.temperature}, stop):
+            chunks.append(chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk)
+        return "".join(chunks)
+
+
+_gateway: Optional[OllamaGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> OllamaGateway:
+    """取得全域共用的 OllamaGateway"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = OllamaGateway([url.strip() for url in OLLAMA_BASE_URLS.split(",") if url.strip()])
+        return _gateway
@@ -1,6 +1,7 @@
 from typing import List
 from langchain.tools import BaseTool
 from .base_agent import BaseAgent
+from ..services.response_cache import RESPONSE_CACHE_ENABLED, get_response_cache
 from ..tools.product_tools import ProductSearchTool, ProductRecommendationTool
 
 class ProductAgent(BaseAgent):
@@ -15,6 +16,7 @@ class ProductAgent(BaseAgent):
         super().__init__(
             name="ProductConsultant",
             tools=tools,
+            response_cache=get_response_cache() if RESPONSE_CACHE_ENABLED else None,
             verbose=True
         )
     
@@ -0,0 +1,90 @@
+from typing import Dict, Any, Optional
+import threading
+from ..services.catalog import CatalogStore, find_category, format_specs, get_catalog_store
+from ..services.inventory import InventoryStore, get_inventory_store
+
+# 各意圖的觸發關鍵詞，依優先順序檢查
+INTENT_KEYWORDS = {
+    "stock": ("庫存", "剩下", "還有", "現貨"),
+    "spec": ("規格", "配備", "配置"),
+    "price": ("價格", "多少錢", "售價", "價錢"),
+}
+LISTING_KEYWORDS = ("有哪些", "列出", "所有")
+# 含有這些詞的訊息需要 LLM 推理，不走快速路徑
+OPEN_ENDED_KEYWORDS = ("推薦", "比較", "建議", "適合", "哪個", "差別", "為什麼")
+
+
+class IntentRouter:
+    """在 LLM Agent 之前處理可確定回答的意圖
+
+    針對目錄中的產品名稱辨識庫存、規格、價格與類別列表查詢，直接以固定
+    模板回答；其餘開放式問題返回 None，交由 Agent 處理。
+    """
+
+    def __init__(
+        self,
+        catalog_store: Optional[CatalogStore] = None,
+        inventory: Optional[InventoryStore] = None
+    ):
+        self.catalog_store = catalog_store or get_catalog_store()
+        self.inventory = inventory or get_inventory_store()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"total": 0, "fast_path": 0, "agent": 0}
+
+    def route(self, message: str) -> Optional[Dict[str, Any]]:
+        """返回 {"intent", "response"}，無法直接回答時返回 None"""
+        result = self._classify(message)
+        with self._lock:
+            self._stats["total"] += 1
+            if result is None:
+                self._stats["agent"] += 1
+            else:
+                self._stats["fast_path"] += 1
+                self._stats[f"intent:{result['intent']}"] = self._stats.get(f"intent:{result['intent']}", 0) + 1
+        return result
+
+    def _classify(self, message: str) -> Optional[Dict[str, Any]]:
+        if any(keyword in message for keyword in OPEN_ENDED_KEYWORDS):
+            return None
+        catalog = self.catalog_store.catalog
+
+        # 類別列表
+        if any(keyword in message for keyword in LISTING_KEYWORDS):
+            category = find_category(message)
+            products = catalog.in_category(category) if category else []
+            if not products:
+                return None
+            lines = [f"{category}目前有以下產品："]
+            for product in products:
+                lines.append(f"- {product['name']}：NT${self.inventory.price(product['id'])}")
+            return {"intent": "category_listing", "response": "\n".join(lines)}
+
+        products = catalog.find_products_in_text(message)
+        # 沒有提到產品或同時提到多個產品時交給 Agent
+        if len(products) != 1:
+            return None
+        product = products[0]
+
+        if any(keyword in message for keyword in INTENT_KEYWORDS["stock"]):
+            return {
+                "intent": "stock",
+                "response": f"{product['name']} 目前庫存還有 {self.inventory.stock(product['id'])} 台"
+            }
+        if any(keyword in message for keyword in INTENT_KEYWORDS["spec"]):
+            return {
+                "intent": "spec",
+                "response": f"{product['name']} 的規格如下：\n\n{format_specs(product)}"
+            }
+        if any(keyword in message for keyword in INTENT_KEYWORDS["price"]):
+            return {
+                "intent": "price",
+                "response": f"{product['name']} 的價格為 NT${self.inventory.price(product['id'])}"
+            }
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """快速路徑比例與各意圖計數"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["fast_path_ratio"] = stats["fast_path"] / stats["total"] if stats["total"] else 0.0
+        return stats
@@ -0,0 +1,158 @@
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict, deque
+from functools import lru_cache
+import logging
+import os
+import threading
+import time
+import tiktoken
+from langchain.schema import AIMessage, BaseMessage, HumanMessage
+
+logger = logging.getLogger(__name__)
+
+# 每個對話保留的歷史 token 上限（超過時丟棄最舊的一輪對話）
+SESSION_MEMORY_MAX_TOKENS = int(os.getenv("SESSION_MEMORY_MAX_TOKENS", "1000"))
+# 閒置多久（秒）後回收對話
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+# 同時保留的對話數與所有對話的 token 總上限
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_TOTAL_TOKENS = int(os.getenv("SESSION_MAX_TOTAL_TOKENS", "2000000"))
+
+
+@lru_cache(maxsize=1)
+def _get_encoding() -> Optional["tiktoken.Encoding"]:
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # 離線環境無法下載詞表時，改以字元數估算
+        logger.warning(f"tiktoken encoding unavailable, estimating tokens by characters: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """估算文字的 token 數"""
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class SessionMemory:
+    """單一對話的滑動 token 視窗
+
+    以一輪（使用者訊息 + 回覆）為單位保存與裁切，歷史不會以缺少提問的回覆開頭。
+    """
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self._turns: deque = deque()  # (該輪訊息, token 數)
+        self.tokens = 0
+        self.last_used = time.monotonic()
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return [message for turn, _ in self._turns for message in turn]
+
+    def recent(self, max_tokens: int) -> List[BaseMessage]:
+        """不超過 max_tokens 的最近幾輪訊息"""
+        turns = []
+        used = 0
+        for turn, tokens in reversed(self._turns):
+            if used + tokens > max_tokens:
+                break
+            turns.append(turn)
+            used += tokens
+        return [message for turn in reversed(turns) for message in turn]
+
+    def append(self, turn: List[BaseMessage], tokens: int):
+        self._turns.append((turn, tokens))
+        self.tokens += tokens
+        # 保留最新的幾輪，直到總數不超過上限
+        while self.tokens > self.max_tokens and self._turns:
+            _, dropped = self._turns.popleft()
+            self.tokens -= dropped
+
+
+class SessionMemoryStore:
+    """以 client_id 區分的對話記憶
+
+    每個對話只保留固定 token 數的最近歷史，因此每輪送給 LLM 的 prompt 大小
+    不隨伺服器運行時間增長。閒置超過 TTL 的對話會被回收，對話數或 token
+    總量超過上限時依 LRU 淘汰。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = SESSION_MEMORY_MAX_TOKENS,
+        ttl: float = SESSION_TTL,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        max_total_tokens: int = SESSION_MAX_TOTAL_TOKENS
+    ):
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+        self.max_sessions = max(1, max_sessions)
+        self.max_total_tokens = max_total_tokens
+        self._sessions: "OrderedDict[str, SessionMemory]" = OrderedDict()
+        self._total_tokens = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        """回收閒置或超出上限的對話（呼叫時需持有鎖）"""
+        while self._sessions:
+            session_id, memory = next(iter(self._sessions.items()))
+            expired = now - memory.last_used > self.ttl
+            over_limit = len(self._sessions) > self.max_sessions or self._total_tokens > self.max_total_tokens
+            if not expired and not over_limit:
+                break
+            del self._sessions[session_id]
+            self._total_tokens -= memory.tokens
+            self._evictions += 1
+
+    def history(self, session_id: str, max_tokens: Optional[int] = None) -> List[BaseMessage]:
+        """取得對話歷史，指定 max_tokens 時只返回預算內的最近訊息"""
+        with self._lock:
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                return []
+            memory.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return memory.messages if max_tokens is None else memory.recent(max_tokens)
+
+    def save_turn(self, session_id: str, user_input: str, output: str):
+        """記錄一輪對話"""
+        now = time.monotonic()
+        input_tokens = count_tokens(user_input)
+        output_tokens = count_tokens(output)
+        with self._lock:
+            memory = self._sessions.get(session_id)
+            if memory is None:
+                memory = SessionMemory(self.max_tokens)
+                self._sessions[session_id] = memory
+            before = memory.tokens
+            memory.append(
+                [HumanMessage(content=user_input), AIMessage(content=output)],
+                input_tokens + output_tokens
+            )
+            memory.last_used = now
+            self._sessions.move_to_end(session_id)
+            self._total_tokens += memory.tokens - before
+            self._evict(now)
+
+    def drop(self, session_id: str):
+        """清除對話"""
+        with self._lock:
+            memory = self._sessions.pop(session_id, None)
+            if memory is not None:
+                self._total_tokens -= memory.tokens
+
+    def stats(self) -> Dict[str, Any]:
+        """對話數、token 總量與淘汰次數"""
+        with self._lock:
+            self._evict(time.monotonic())
+            return {
+                "sessions": len(self._sessions),
+                "total_tokens": self._total_tokens,
+                "evictions": self._evictions,
+                "max_tokens_per_session": self.max_tokens
+            }
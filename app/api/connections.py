@@ -0,0 +1,236 @@
+from typing import Dict, Any, Optional, Callable, Awaitable
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from fastapi import WebSocket, WebSocketDisconnect
+from ..services.metrics import end_trace, record, start_trace
+
+logger = logging.getLogger(__name__)
+
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+# 每個連線排隊中的請求上限與同時處理的請求數
+WS_INBOUND_QUEUE_SIZE = int(os.getenv("WS_INBOUND_QUEUE_SIZE", "8"))
+WS_WORKERS_PER_CONNECTION = int(os.getenv("WS_WORKERS_PER_CONNECTION", "2"))
+# 待發送訊息上限，客戶端讀取太慢時等待最多 WS_SEND_TIMEOUT 秒後斷線
+WS_OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", "256"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# 心跳間隔與閒置回收時間（秒）
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "30"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "300"))
+
+# handler(連線, 請求ID, 訊息)
+MessageHandler = Callable[["Connection", str, Dict[str, Any]], Awaitable[None]]
+
+
+class Connection:
+    """單一 WebSocket 連線
+
+    讀取端把請求放入有界佇列，由最多 WS_WORKERS_PER_CONNECTION 個工作協程
+    並行處理，回覆帶有 request_id，因此可能不依請求順序到達。所有回覆經由
+    有界的發送佇列由單一寫入協程送出。閒置連線只保留讀取與寫入兩個協程。
+    """
+
+    def __init__(self, websocket: WebSocket, client_id: str):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.inbound: asyncio.Queue = asyncio.Queue(maxsize=WS_INBOUND_QUEUE_SIZE)
+        self.outbound: asyncio.Queue = asyncio.Queue(maxsize=WS_OUTBOUND_QUEUE_SIZE)
+        self.last_activity = time.monotonic()
+        self.last_ping = self.last_activity
+        self.closed = asyncio.Event()
+        self._workers: set = set()
+        self._handler: Optional[MessageHandler] = None
+
+    async def send(self, payload: Dict[str, Any]):
+        """排入發送佇列；佇列滿時等待（背壓），逾時則關閉連線"""
+        if self.closed.is_set():
+            raise WebSocketDisconnect()
+        try:
+            await asyncio.wait_for(self.outbound.put(json.dumps(payload)), WS_SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Client {self.client_id} is not reading, closing connection")
+            await self.close(code=1008)
+            raise WebSocketDisconnect()
+
+    def ping(self):
+        """送出心跳（佇列已滿時略過）"""
+        self.last_ping = time.monotonic()
+        try:
+            self.outbound.put_nowait(json.dumps({"type": "ping"}))
+        except asyncio.QueueFull:
+            pass
+
+    async def close(self, code: int = 1000):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _reader(self):
+        while True:
+            data = await self.websocket.receive_text()
+            received_at = time.perf_counter()
+            self.last_activity = time.monotonic()
+            try:
+                message = json.loads(data)
+            except json.JSONDecodeError as e:
+                logger.error(f"JSON decode error: {e}")
+                await self.send({"type": "error", "content": "Invalid message format", "status": "error"})
+                continue
+            if not isinstance(message, dict):
+                await self.send({"type": "error", "content": "Invalid message format", "status": "error"})
+                continue
+
+            message_type = message.get("type")
+            if message_type == "ping":
+                await self.send({"type": "pong"})
+                continue
+            if message_type == "pong":
+                continue
+
+            request_id = str(message.get("request_id") or uuid.uuid4().hex[:12])
+            try:
+                self.inbound.put_nowait((request_id, message, received_at))
+            except asyncio.QueueFull:
+                await self.send({
+                    "type": "error",
+                    "request_id": request_id,
+                    "content": "Too many pending requests",
+                    "status": "busy"
+                })
+                continue
+            # 按需啟動工作協程，閒置時不佔用資源
+            if len(self._workers) < WS_WORKERS_PER_CONNECTION:
+                self._workers.add(asyncio.create_task(self._worker()))
+
+    async def _worker(self):
+        try:
+            while True:
+                try:
+                    request_id, message, received_at = self.inbound.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                # 追蹤從收到訊息開始計時，ws_receive 包含解析與排隊等待的時間
+                trace_token = start_trace(request_id, received_at)
+                record("ws_receive", time.perf_counter() - received_at)
+                try:
+                    await self._handler(self, request_id, message)
+                except WebSocketDisconnect:
+                    return
+                except Exception as e:
+                    logger.error(f"Error processing message: {e}")
+                    try:
+                        await self.send({"type": "error", "request_id": request_id, "content": str(e), "status": "error"})
+                    except WebSocketDisconnect:
+                        return
+                finally:
+                    end_trace(trace_token)
+        finally:
+            # 與佇列檢查在同一步移除，讀取端不會誤以為仍有工作協程
+            self._workers.discard(asyncio.current_task())
+
+    async def _writer(self):
+        while True:
+            text = await self.outbound.get()
+            await self.websocket.send_text(text)
+
+    async def serve(self, handler: MessageHandler):
+        """處理連線直到斷線或被關閉"""
+        self._handler = handler
+        reader = asyncio.create_task(self._reader())
+        writer = asyncio.create_task(self._writer())
+        closed = asyncio.create_task(self.closed.wait())
+        try:
+            await asyncio.wait({reader, writer, closed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.closed.set()
+            # 取消進行中的請求（包含 LLM 生成）
+            for task in [reader, writer, closed, *self._workers]:
+                task.cancel()
+            await asyncio.gather(reader, writer, closed, *self._workers, return_exceptions=True)
+
+
+class ConnectionManager:
+    """管理所有 WebSocket 連線：連線上限、心跳與閒置回收"""
+
+    def __init__(self, max_connections: int = WS_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self.active_connections: Dict[str, Connection] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self._rejected = 0
+        self._reaped = 0
+
+    async def connect(self, websocket: WebSocket, client_id: str) -> Optional[Connection]:
+        """接受連線，超過上限時拒絕並返回 None"""
+        logger.info(f"Attempting to connect client {client_id}")
+        if len(self.active_connections) >= self.max_connections and client_id not in self.active_connections:
+            self._rejected += 1
+            logger.warning(f"Rejecting client {client_id}: connection limit {self.max_connections} reached")
+            await websocket.close(code=1013)
+            return None
+        try:
+            await websocket.accept()
+        except Exception as e:
+            logger.error(f"Failed to connect client {client_id}: {str(e)}")
+            raise
+        # 同一 client_id 重新連線時關閉舊連線
+        previous = self.active_connections.get(client_id)
+        if previous is not None:
+            await previous.close(code=1000)
+        connection = Connection(websocket, client_id)
+        self.active_connections[client_id] = connection
+        logger.info(f"Client {client_id} connected successfully")
+        return connection
+
+    def disconnect(self, client_id: str, connection: Optional[Connection] = None):
+        current = self.active_connections.get(client_id)
+        if current is not None and (connection is None or current is connection):
+            del self.active_connections[client_id]
+            logger.info(f"Client {client_id} disconnected")
+
+    async def send_message(self, message: Dict[str, Any], client_id: str):
+        connection = self.active_connections.get(client_id)
+        if connection is not None:
+            await connection.send(message)
+        else:
+            logger.warning(f"Client {client_id} not found when trying to send message")
+
+    async def _reap(self):
+        """定期送出心跳並回收閒置連線"""
+        interval = max(1.0, min(WS_PING_INTERVAL, WS_IDLE_TIMEOUT) / 2)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for connection in list(self.active_connections.values()):
+                if now - connection.last_activity > WS_IDLE_TIMEOUT:
+                    self._reaped += 1
+                    logger.info(f"Closing idle client {connection.client_id}")
+                    await connection.close(code=1001)
+                elif now - connection.last_ping >= WS_PING_INTERVAL:
+                    connection.ping()
+
+    def start(self):
+        """啟動心跳與回收協程"""
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for connection in list(self.active_connections.values()):
+            await connection.close(code=1001)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.active_connections),
+            "max_connections": self.max_connections,
+            "rejected": self._rejected,
+            "reaped": self._reaped
+        }
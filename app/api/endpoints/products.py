@@ -1,24 +1,119 @@
 from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
-from app.services.product_service import ProductService
+from typing import List, Dict, Any, Optional
+from pydantic import BaseModel
+from app.services.readiness import LazyComponent, ServiceNotReadyError, WARMUP_ON_STARTUP
 
 router = APIRouter()
-product_service = ProductService()
+
+def _build_catalog_store():
+    """載入產品目錄並建立詞彙索引與名稱比對器（在背景執行緒執行）"""
+    from app.services.catalog import get_catalog_store
+
+    return get_catalog_store()
+
+def _build_inventory_store():
+    """以目前的產品目錄建立即時庫存層（在背景執行緒執行）"""
+    from app.services.inventory import get_inventory_store
+
+    return get_inventory_store()
+
+# 目錄與庫存在匯入時不建立，大型目錄也不延遲存活檢查
+catalog_store: LazyComponent = LazyComponent("catalog_store", _build_catalog_store)
+inventory_store: LazyComponent = LazyComponent("inventory_store", _build_inventory_store)
+
+def _build_product_service():
+    """載入嵌入模型與向量索引（在背景執行緒執行）"""
+    from app.services.product_service import ProductService
+
+    service = ProductService()
+    if WARMUP_ON_STARTUP:
+        service.embeddings.warm_up()
+    return service
+
+product_service: LazyComponent = LazyComponent("product_service", _build_product_service)
+
+class InventoryUpdate(BaseModel):
+    """單一產品的價格或庫存更新"""
+    product_id: str
+    price: Optional[int] = None
+    stock: Optional[int] = None
+    stock_delta: Optional[int] = None
 
 @router.get("/search")
-async def search_products(query: str, k: int = 3) -> List[Dict[str, Any]]:
+async def search_products(
+    query: str,
+    k: int = 3,
+    category: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    in_stock: bool = False
+) -> List[Dict[str, Any]]:
     """
     使用 RAG 搜索產品
     
     Args:
         query: 搜索查詢
-        k: 返回結果數量
+        k: 返回的產品數量
+        category: 只搜索此類別
+        min_price: 最低價格
+        max_price: 最高價格
+        in_stock: 只搜索有庫存的產品
         
     Returns:
         相關產品列表
     """
     try:
-        results = product_service.search_products(query, k)
+        service = product_service.get()
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    # 服務就緒時模組已載入，這裡不會觸發匯入
+    from app.services.product_service import ServiceOverloadedError
+
+    try:
+        results = await service.asearch_products(query, k, category, min_price, max_price, in_stock)
         return results
+    except ServiceOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+@router.post("/inventory")
+async def update_inventory(updates: List[InventoryUpdate]) -> Dict[str, Any]:
+    """
+    批次更新即時價格與庫存，不需要重新嵌入或重啟
+    
+    Args:
+        updates: 更新列表，price/stock 為絕對值，stock_delta 為增減量
+        
+    Returns:
+        套用筆數、錯誤列表與庫存版本
+    """
+    try:
+        inventory = inventory_store.get()
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    # 庫存層就緒時模組已載入，這裡不會觸發匯入
+    from app.services.inventory import InventoryReadOnlyError
+
+    try:
+        return inventory.apply_updates([update.model_dump() for update in updates])
+    except InventoryReadOnlyError as e:
+        # 多工作程序部署只能透過產品檔案與索引建置程序更新，否則各工作程序的價格與庫存不一致
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/stats")
+async def search_stats() -> Dict[str, Any]:
+    """查詢快取、批次編碼、向量索引後端與共享索引世代的統計"""
+    try:
+        service = product_service.get()
+    except ServiceNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    stats = {
+        "query_cache": service.query_cache.stats(),
+        "query_batcher": service.query_batcher.stats()
+    }
+    if service.vector_backend is not None:
+        stats["vector_backend"] = service.vector_backend.stats()
+    if service.shared_index is not None:
+        stats["shared_index"] = service.shared_index.stats()
+    return stats
@@ -1,18 +1,22 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, List
-import json
+from typing import Dict, Any
+from contextlib import aclosing
 import logging
 import os
 from dotenv import load_dotenv
-from .agents.product_agent import ProductAgent
+from .api.connections import Connection, ConnectionManager
+from .services.metrics import current_trace, get_metrics, span, trace_summary
+from .services.readiness import LazyComponent, ServiceNotReadyError, readiness_report, start_all
+from .services.structured_logging import configure_logging, log_event
 from app.api.endpoints import products
 
 # 加載環境變量
 load_dotenv()
 
-# 配置日誌
-logging.basicConfig(level=logging.INFO)
+# 配置日誌（背景執行緒寫入，對話內容抽樣記錄）
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="3C產品電商 AI Agent API")
@@ -28,95 +32,101 @@ app.add_middleware(
 )
 
 # 存儲WebSocket連接
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-    
-    async def connect(self, websocket: WebSocket, client_id: str):
-        logger.info(f"Attempting to connect client {client_id}")
-        try:
-            await websocket.accept()
-            self.active_connections[client_id] = websocket
-            logger.info(f"Client {client_id} connected successfully")
-        except Exception as e:
-            logger.error(f"Failed to connect client {client_id}: {str(e)}")
-            raise
-    
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
-            logger.info(f"Client {client_id} disconnected")
-    
-    async def send_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(message)
-            logger.info(f"Message sent to client {client_id}: {message}")
-        else:
-            logger.warning(f"Client {client_id} not found when trying to send message")
-
 manager = ConnectionManager()
 
-# 創建Agent實例
-product_agent = ProductAgent()
-logger.info("ProductAgent initialized")
+def _build_product_agent():
+    """匯入 LangChain 並建立 Agent（在背景執行緒執行）"""
+    from .agents.product_agent import ProductAgent
+
+    return ProductAgent()
+
+# 創建Agent實例（啟動後在背景建立，不阻塞健康檢查）
+product_agent: LazyComponent = LazyComponent("product_agent", _build_product_agent)
+
+def _build_intent_router():
+    """以產品目錄與庫存層建立意圖路由（在背景執行緒執行）"""
+    from .agents.router import IntentRouter
+
+    return IntentRouter()
+
+# 可確定回答的意圖（庫存、規格、價格、類別列表）不經過 LLM；
+# 目錄在背景載入，就緒前所有訊息交給 Agent
+intent_router: LazyComponent = LazyComponent("intent_router", _build_intent_router)
 
 # 包含路由
 app.include_router(products.router, prefix="/api/products", tags=["products"])
 
+async def handle_message(connection: Connection, request_id: str, message: Dict[str, Any]):
+    """處理單一請求，所有回覆都帶有 request_id"""
+    if message.get("type") != "chat":
+        return
+    trace = current_trace()
+    # 先嘗試快速路徑，無法直接回答時才使用ProductAgent處理消息
+    fast_path = None
+    if intent_router.ready:
+        with span("router"):
+            fast_path = intent_router.get().route(message["content"])
+    if fast_path is not None:
+        response = {"status": "success", "response": fast_path["response"]}
+    else:
+        try:
+            agent = await product_agent.wait()
+        except ServiceNotReadyError as e:
+            await connection.send({"type": "error", "request_id": request_id, "content": str(e), "status": "not_ready"})
+            return
+        # 逐步轉送工具事件與 token（delta），最後再發送完整響應
+        response = None
+        # 發送失敗（連線已斷）時關閉串流，取消進行中的 LLM 生成
+        async with aclosing(agent.astream(message["content"], session_id=connection.client_id)) as events:
+            async for event in events:
+                if event["type"] == "final":
+                    response = event
+                    break
+                await connection.send({**event, "request_id": request_id})
+        if response is None:
+            # 串流未送出 final 事件就結束時仍回覆錯誤，而不是讓請求崩潰
+            response = {"status": "error", "error": "Agent stream ended without a final response"}
+
+    route = "fast_path" if fast_path is not None else ("cache" if response.get("cached") else "agent")
+    payload = {
+        "type": "response",
+        "request_id": request_id,
+        "content": response.get("response", response.get("error")),
+        "status": response["status"],
+        "route": route
+    }
+    # 客戶端要求時附上各階段耗時
+    if message.get("trace") and trace is not None:
+        payload["trace"] = trace_summary(trace)
+    if response["status"] != "success":
+        logger.error(f"Request {request_id} failed: {response.get('error')}")
+    log_event(
+        logger,
+        "chat_turn",
+        bodies={"message": message["content"], "response": payload["content"]},
+        sampled=trace["sampled"] if trace is not None else None,
+        request_id=request_id,
+        client_id=connection.client_id,
+        route=route,
+        intent=fast_path["intent"] if fast_path is not None else None,
+        status=response["status"],
+        trace=trace_summary(trace) if trace is not None else None
+    )
+
+    # 發送響應
+    await connection.send(payload)
+
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
+    connection = await manager.connect(websocket, client_id)
+    if connection is None:
+        return
     try:
-        while True:
-            # 接收消息
-            data = await websocket.receive_text()
-            logger.info(f"Received message from client {client_id}: {data}")
-            
-            try:
-                message = json.loads(data)
-                
-                # 處理消息
-                if message["type"] == "chat":
-                    logger.info(f"Processing chat message: {message['content']}")
-                    # 使用ProductAgent處理消息
-                    response = await product_agent.run(message["content"])
-                    logger.info(f"Agent response: {response}")
-                    
-                    # 發送響應
-                    await manager.send_message(
-                        json.dumps({
-                            "type": "response",
-                            "content": response["response"],
-                            "status": response["status"]
-                        }),
-                        client_id
-                    )
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error: {e}")
-                await manager.send_message(
-                    json.dumps({
-                        "type": "error",
-                        "content": "Invalid message format",
-                        "status": "error"
-                    }),
-                    client_id
-                )
-            except Exception as e:
-                logger.error(f"Error processing message: {e}")
-                await manager.send_message(
-                    json.dumps({
-                        "type": "error",
-                        "content": str(e),
-                        "status": "error"
-                    }),
-                    client_id
-                )
-            
-    except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        await connection.serve(handle_message)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        manager.disconnect(client_id)
+    finally:
+        manager.disconnect(client_id, connection)
 
 @app.get("/")
 async def root():
@@ -124,4 +134,72 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    """存活檢查，不等待模型與索引載入"""
+    return {"status": "healthy", "ready": readiness_report()["ready"]}
+
+@app.get("/ready")
+async def readiness_check():
+    """就緒檢查：所有元件載入完成前返回 503 與各元件進度"""
+    report = readiness_report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/router/stats")
+async def router_stats():
+    """快速路徑命中比例"""
+    try:
+        return intent_router.get().stats()
+    except ServiceNotReadyError as e:
+        return JSONResponse({"detail": str(e)}, status_code=503)
+
+@app.get("/sessions/stats")
+async def session_stats():
+    """對話記憶的數量與 token 總量"""
+    try:
+        return product_agent.get().sessions.stats()
+    except ServiceNotReadyError as e:
+        return JSONResponse({"detail": str(e)}, status_code=503)
+
+@app.get("/cache/stats")
+async def response_cache_stats():
+    """語意回應快取的命中率"""
+    from .services.response_cache import RESPONSE_CACHE_ENABLED, get_response_cache
+
+    if not RESPONSE_CACHE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **get_response_cache().stats()}
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """LLM 閘道的排隊數與各伺服器負載"""
+    from .agents.llm_gateway import get_llm_gateway
+
+    return get_llm_gateway().stats()
+
+@app.get("/metrics")
+async def metrics():
+    """各階段耗時直方圖（Prometheus 文字格式）"""
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/summary")
+async def metrics_summary():
+    """各階段的次數與平均耗時（毫秒）"""
+    return get_metrics().summary()
+
+@app.get("/ws/stats")
+async def websocket_stats():
+    """WebSocket 連線數與拒絕、回收計數"""
+    return manager.stats()
+
+@app.on_event("startup")
+async def start_connection_manager():
+    manager.start()
+    # 在背景載入 Agent、嵌入模型與向量索引
+    start_all()
+
+@app.on_event("shutdown")
+async def close_llm_gateway():
+    await manager.stop()
+    if product_agent.ready:
+        from .agents.llm_gateway import get_llm_gateway
+
+        await get_llm_gateway().aclose()
@@ -0,0 +1,376 @@
+from typing import List, Dict, Any, Optional, Set, Tuple, Iterable, Callable
+from collections import defaultdict, deque
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from .lexical_index import BM25Index, tokenize
+
+logger = logging.getLogger(__name__)
+
+# 產品檔案，可指向其他目錄檔（例如效能測試用的合成目錄）
+PRODUCTS_FILE = Path(os.getenv(
+    "PRODUCTS_FILE",
+    str(Path(__file__).resolve().parent.parent / "data" / "documents" / "products.json")
+))
+# 檢查產品檔案是否變動的間隔（秒），設為 0 則不監看
+CATALOG_POLL_INTERVAL = float(os.getenv("CATALOG_POLL_INTERVAL", "2"))
+# "local"：程序內開啟向量索引；"shared"：讀取建置程序發布的共享索引世代（多工作程序部署）
+# 定義在這裡而非 index_snapshot，讀取部署模式不必匯入 LangChain
+INDEX_MODE = os.getenv("INDEX_MODE", "local")
+
+# 類別關鍵詞 -> 目錄中的類別名稱
+CATEGORY_KEYWORDS = {
+    "耳機": "耳機",
+    "手機": "手機",
+    "筆記本": "筆記型電腦",
+    "筆電": "筆記型電腦",
+    "電腦": "筆記型電腦",
+    "筆記型電腦": "筆記型電腦"
+}
+
+# 定義規格項目的中文名稱映射
+SPEC_NAMES = {
+    "processor": "處理器",
+    "ram": "記憶體",
+    "storage": "儲存空間",
+    "display": "顯示器",
+    "battery": "電池",
+    "ports": "連接埠",
+    "noise_cancellation": "降噪功能",
+    "battery_life": "電池續航",
+    "bluetooth": "藍牙版本",
+    "weight": "重量",
+    "features": "特色功能"
+}
+
+# 欄位鍵：(產品ID, 欄位名稱)，規格欄位名稱為 "spec:<key>"
+FieldKey = Tuple[str, str]
+
+
+def normalize_name(text: str) -> str:
+    """正規化產品名稱與查詢，用於不分大小寫的比對"""
+    return text.lower()
+
+
+def find_category(text: str) -> Optional[str]:
+    """從文字中的類別關鍵詞找出類別"""
+    for keyword, category in CATEGORY_KEYWORDS.items():
+        if keyword in text:
+            return category
+    return None
+
+
+def format_specs(product: Dict[str, Any]) -> str:
+    """格式化產品規格"""
+    formatted_specs = []
+    for key, value in product['specs'].items():
+        # 獲取中文名稱，如果沒有對應的中文名稱則使用原始key
+        display_name = SPEC_NAMES.get(key, key)
+        
+        # 處理列表類型的值
+        if isinstance(value, list):
+            value = "、".join(value)
+        
+        formatted_specs.append(f"{display_name}: {value}")
+    
+    return "\n".join(formatted_specs)
+
+
+def char_ngrams(text: str, n: int) -> Set[str]:
+    """取得文字的字元 n-gram 集合"""
+    if len(text) < n:
+        return set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class NameMatcher:
+    """Aho–Corasick 自動機：單次掃描找出查詢中出現的所有產品名稱"""
+
+    def __init__(self, patterns: Dict[str, str]):
+        # patterns: 正規化名稱 -> 產品ID
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        self._patterns = patterns
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str):
+        node = 0
+        for char in pattern:
+            if char not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][char] = len(self._goto) - 1
+            node = self._goto[node][char]
+        self._output[node].append(pattern)
+
+    def _build(self):
+        """以廣度優先建立失敗連結"""
+        queue = deque()
+        for child in self._goto[0].values():
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text: str) -> List[Tuple[int, str]]:
+        """返回 (結束位置, 名稱) 列表"""
+        matches = []
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for pattern in self._output[node]:
+                matches.append((i, pattern))
+        return matches
+
+    def product_ids(self, text: str) -> List[str]:
+        """查詢中出現的產品ID，較長的名稱優先
+
+        被較長名稱完全涵蓋的匹配（例如 "iPhone 15 Pro" 中的 "iPhone 15"）會被略過。
+        """
+        spans = sorted(
+            ((end - len(pattern) + 1, end, pattern) for end, pattern in self.find_all(text)),
+            key=lambda span: (span[0], -len(span[2]))
+        )
+        found = []
+        covered_until = -1
+        for start, end, pattern in spans:
+            if end <= covered_until:
+                continue
+            covered_until = end
+            if pattern not in found:
+                found.append(pattern)
+        return [self._patterns[pattern] for pattern in sorted(found, key=len, reverse=True)]
+
+
+class ProductCatalog:
+    """產品目錄索引
+
+    載入時一次建立：
+    - by_id: 產品ID -> 產品
+    - by_category: 類別 -> 產品列表
+    - name_matcher: 產品名稱的 Aho–Corasick 自動機
+    - 描述、規格等欄位的字元 n-gram 倒排索引
+    - 產品層級的 BM25 索引（lexical_index）
+
+    建立後視為不可變的快照，更新時由 CatalogStore 整個替換。
+    """
+
+    def __init__(self, products: List[Dict[str, Any]], version: int = 0):
+        self.products = products
+        self.version = version
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_category: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._order: Dict[str, int] = {}
+        self._fields: Dict[FieldKey, str] = {}
+        self._postings: Dict[str, Set[FieldKey]] = defaultdict(set)
+
+        for position, product in enumerate(products):
+            self.by_id[product["id"]] = product
+            self.by_category[product["category"]].append(product)
+            self._order[product["id"]] = position
+            for field, text in self._searchable_fields(product):
+                key = (product["id"], field)
+                self._fields[key] = text
+                for gram in char_ngrams(text, 1) | char_ngrams(text, 2):
+                    self._postings[gram].add(key)
+
+        self.name_matcher = NameMatcher({
+            normalize_name(product["name"]): product["id"] for product in products
+        })
+        self.lexical_index = BM25Index(
+            (product["id"], self.lexical_tokens(product)) for product in products
+        )
+
+    @staticmethod
+    def _searchable_fields(product: Dict[str, Any]) -> Iterable[Tuple[str, str]]:
+        """可搜索的欄位（已轉小寫）"""
+        yield "name", product["name"].lower()
+        yield "category", product["category"].lower()
+        yield "description", product["description"].lower()
+        for spec_key, spec_value in product["specs"].items():
+            if isinstance(spec_value, str):
+                yield f"spec:{spec_key}", spec_value.lower()
+
+    @staticmethod
+    def lexical_tokens(product: Dict[str, Any]) -> List[str]:
+        """BM25 文件的詞：名稱重複一次以加重權重，規格包含中文名稱與數值"""
+        parts = [product["name"], product["name"], product["category"], product["description"]]
+        for spec_key, spec_value in product["specs"].items():
+            if isinstance(spec_value, list):
+                spec_value = " ".join(spec_value)
+            parts.append(f"{SPEC_NAMES.get(spec_key, spec_key)} {spec_value}")
+        return tokenize(" ".join(parts))
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        """依ID取得產品"""
+        return self.by_id.get(product_id)
+
+    def in_category(self, category: str) -> List[Dict[str, Any]]:
+        """取得類別下的所有產品"""
+        return self.by_category.get(category, [])
+
+    def find_products_in_text(self, text: str) -> List[Dict[str, Any]]:
+        """找出文字中提到的所有產品，較長的名稱優先"""
+        return [self.by_id[product_id] for product_id in self.name_matcher.product_ids(normalize_name(text))]
+
+    def find_product_in_text(self, text: str) -> Optional[Dict[str, Any]]:
+        """找出文字中提到的產品（最長名稱）"""
+        product_ids = self.name_matcher.product_ids(normalize_name(text))
+        return self.by_id[product_ids[0]] if product_ids else None
+
+    def find_field_matches(self, needle: str) -> Set[FieldKey]:
+        """找出包含 needle 子字串的所有 (產品ID, 欄位)"""
+        needle = needle.lower()
+        grams = char_ngrams(needle, 2) or char_ngrams(needle, 1)
+        if not grams:
+            return set(self._fields)
+        postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                return set()
+        # n-gram 交集只是候選，仍需確認是連續子字串
+        return {key for key in candidates if needle in self._fields[key]}
+
+    def lexical_search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """BM25 排名前 k 的 (產品ID, 分數)"""
+        return self.lexical_index.search(query, k)
+
+    def search(self, query: str) -> List[Dict[str, Any]]:
+        """名稱、類別、描述或規格包含查詢字串的產品，依目錄順序排列"""
+        product_ids = {product_id for product_id, _ in self.find_field_matches(query)}
+        return [self.by_id[product_id] for product_id in sorted(product_ids, key=self._order.__getitem__)]
+
+
+# listener(舊快照, 新快照, 變動的產品ID)
+CatalogListener = Callable[[ProductCatalog, ProductCatalog, Set[str]], None]
+
+
+class CatalogStore:
+    """共用的產品目錄
+
+    products.json 只載入一次，所有使用者以參照共享同一份 ProductCatalog。
+    背景執行緒輪詢檔案 mtime，變動時建立新快照並原子替換，再通知訂閱者
+    哪些產品有變動。
+    """
+
+    def __init__(self, path: Path = PRODUCTS_FILE, poll_interval: float = CATALOG_POLL_INTERVAL):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._listeners: List[CatalogListener] = []
+        self._file_state = self._stat()
+        self._catalog = ProductCatalog(self._read_products(), version=1)
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    @property
+    def catalog(self) -> ProductCatalog:
+        """目前的目錄快照"""
+        return self._catalog
+
+    def _stat(self) -> Optional[Tuple[float, int]]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_products(self) -> List[Dict[str, Any]]:
+        """讀取產品檔案"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)["products"]
+
+    def subscribe(self, listener: CatalogListener):
+        """註冊目錄變動通知"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def reload(self) -> Set[str]:
+        """重新載入產品檔案，返回有變動（新增、修改、刪除）的產品ID"""
+        with self._lock:
+            self._file_state = self._stat()
+            try:
+                products = self._read_products()
+            except (OSError, ValueError, KeyError) as e:
+                # 檔案可能正在寫入，保留舊快照等待下一次檢查
+                logger.warning(f"Failed to reload catalog from {self.path}: {e}")
+                return set()
+            old = self._catalog
+            new = ProductCatalog(products, version=old.version + 1)
+            changed = {
+                product_id for product_id in old.by_id.keys() | new.by_id.keys()
+                if old.by_id.get(product_id) != new.by_id.get(product_id)
+            }
+            if not changed:
+                return changed
+            self._catalog = new
+            listeners = list(self._listeners)
+
+        logger.info(f"Catalog reloaded (version {new.version}): {len(changed)} products changed")
+        for listener in listeners:
+            try:
+                listener(old, new, changed)
+            except Exception as e:
+                logger.error(f"Catalog listener failed: {e}")
+        return changed
+
+    def switch_source(self, path: Path) -> Set[str]:
+        """改從另一個產品檔案載入（例如共享索引世代中的目錄快照）"""
+        with self._lock:
+            self.path = Path(path)
+        return self.reload()
+
+    def check_for_updates(self) -> Set[str]:
+        """檔案 mtime 或大小有變動時重新載入"""
+        if self._stat() == self._file_state:
+            return set()
+        return self.reload()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check_for_updates()
+
+    def start_watching(self):
+        """啟動背景監看執行緒"""
+        if self.poll_interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        """停止背景監看"""
+        self._stop.set()
+
+
+_catalog_store: Optional[CatalogStore] = None
+_catalog_store_lock = threading.Lock()
+
+
+def get_catalog_store() -> CatalogStore:
+    """取得全域共用的 CatalogStore"""
+    global _catalog_store
+    with _catalog_store_lock:
+        if _catalog_store is None:
+            _catalog_store = CatalogStore()
+            _catalog_store.start_watching()
+        return _catalog_store
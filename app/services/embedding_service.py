@@ -0,0 +1,358 @@
+from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from pathlib import Path
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "chroma_db/embedding_cache")
+# 查詢向量只保存在記憶體的 LRU 中（筆數），磁碟快取只保存文檔向量
+EMBEDDING_QUERY_CACHE_SIZE = int(os.getenv("EMBEDDING_QUERY_CACHE_SIZE", "1024"))
+# 編碼後端："torch"（sentence-transformers）或 "onnx"（ONNX Runtime 執行 int8 量化模型）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+
+def normalize_text(text: str) -> str:
+    """正規化文字：統一全半形並壓縮空白，讓相同內容得到相同的快取鍵"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class EmbeddingCache:
+    """以記憶體映射的 float32 矩陣持久化保存向量
+
+    每個模型使用獨立目錄，包含：
+    - vectors.f32: 形狀為 (capacity, dim) 的 float32 矩陣
+    - keys.txt: 依列順序記錄每一列的文字雜湊（只追加）
+    - meta.json: 模型名稱與向量維度
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, initial_capacity: int = 1024):
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.directory = Path(cache_dir) / safe_name
+        self.model_name = model_name
+        self.initial_capacity = initial_capacity
+        self.dim: Optional[int] = None
+        self.matrix: Optional[np.memmap] = None
+        self.index: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def _vectors_file(self) -> Path:
+        return self.directory / "vectors.f32"
+
+    @property
+    def _keys_file(self) -> Path:
+        return self.directory / "keys.txt"
+
+    @property
+    def _meta_file(self) -> Path:
+        return self.directory / "meta.json"
+
+    def key(self, text: str) -> str:
+        """快取鍵：(模型名稱, 正規化文字) 的雜湊"""
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _load(self):
+        """載入既有快取"""
+        if not self._meta_file.exists() or not self._vectors_file.exists():
+            return
+        try:
+            with open(self._meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = int(meta["dim"])
+            capacity = self._vectors_file.stat().st_size // (4 * self.dim)
+            self.matrix = np.memmap(self._vectors_file, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+            with open(self._keys_file, "r", encoding="utf-8") as f:
+                keys = [line.strip() for line in f if line.strip()]
+            # 只信任已寫入矩陣範圍內的列
+            for row, key in enumerate(keys[:capacity]):
+                self.index[key] = row
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discarding unreadable embedding cache at {self.directory}: {e}")
+            self.dim = None
+            self.matrix = None
+            self.index = {}
+
+    def _ensure_capacity(self, rows: int):
+        """矩陣容量不足時以倍數擴充檔案並重新映射"""
+        capacity = 0 if self.matrix is None else self.matrix.shape[0]
+        if rows <= capacity:
+            return
+        new_capacity = max(self.initial_capacity, capacity)
+        while new_capacity < rows:
+            new_capacity *= 2
+        if self.matrix is not None:
+            self.matrix.flush()
+            del self.matrix
+        with open(self._vectors_file, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.matrix = np.memmap(self._vectors_file, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """批次讀取向量，未命中的位置為 None"""
+        with self._lock:
+            if self.matrix is None:
+                return [None] * len(keys)
+            return [
+                np.array(self.matrix[self.index[key]]) if key in self.index else None
+                for key in keys
+            ]
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        """批次寫入向量"""
+        if not keys:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self.directory.mkdir(parents=True, exist_ok=True)
+                with open(self._meta_file, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim}, f)
+            new_keys = []
+            new_rows = []
+            for key, vector in zip(keys, vectors):
+                if key in self.index or key in new_keys:
+                    continue
+                new_keys.append(key)
+                new_rows.append(vector)
+            if not new_keys:
+                return
+            start = len(self.index)
+            self._ensure_capacity(start + len(new_keys))
+            self.matrix[start:start + len(new_keys)] = np.asarray(new_rows, dtype=np.float32)
+            self.matrix.flush()
+            # 先寫入向量再追加鍵，崩潰時最多遺失未登記的列
+            with open(self._keys_file, "a", encoding="utf-8") as f:
+                f.write("".join(f"{key}\n" for key in new_keys))
+            for offset, key in enumerate(new_keys):
+                self.index[key] = start + offset
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+class CachedEmbeddings(Embeddings):
+    """帶批次、執行緒池與快取的嵌入層
+
+    自行決定批次大小與併發數，相同的文字直接從快取取得，不必再經過 transformer。
+    文檔向量（persist=True）寫入磁碟快取；查詢、推薦需求與對話訊息只進入有界的
+    記憶體 LRU，不會把使用者輸入寫入磁碟，也不在請求路徑上做磁碟 I/O。
+    模型在第一次需要編碼時才載入。
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_workers: int = EMBEDDING_WORKERS,
+        cache_dir: Optional[str] = EMBEDDING_CACHE_DIR,
+        encoder: Optional[Embeddings] = None,
+        backend: str = EMBEDDING_BACKEND,
+        query_cache_size: int = EMBEDDING_QUERY_CACHE_SIZE
+    ):
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown embedding backend: {backend!r} (expected 'torch' or 'onnx')")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self._encoder = encoder
+        self._encoder_lock = threading.Lock()
+        self.cache = EmbeddingCache(cache_dir, self.model_id) if cache_dir else None
+        self.query_cache_size = max(0, query_cache_size)
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embed")
+        self._stats_lock = threading.Lock()
+        self._stats = {"texts": 0, "cache_hits": 0, "encoded": 0, "encode_seconds": 0.0, "wall_seconds": 0.0}
+
+    @property
+    def model_id(self) -> str:
+        """模型識別：量化模型的向量與原模型略有差異，快取與索引清單分開記錄"""
+        return self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}-int8"
+
+    @property
+    def encoder(self) -> Embeddings:
+        """延遲載入編碼模型（onnx 後端不載入 torch）"""
+        if self._encoder is None:
+            with self._encoder_lock:
+                if self._encoder is None and self.backend == "onnx":
+                    from .onnx_embeddings import OnnxEmbeddings
+
+                    start = time.perf_counter()
+                    self._encoder = OnnxEmbeddings()
+                    logger.info(f"Loaded ONNX embedding model {self.model_name} in {time.perf_counter() - start:.2f}s")
+                elif self._encoder is None:
+                    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+                    start = time.perf_counter()
+                    self._encoder = HuggingFaceEmbeddings(
+                        model_name=self.model_name,
+                        model_kwargs={'device': 'cpu'},
+                        encode_kwargs={'normalize_embeddings': True, 'batch_size': self.batch_size}
+                    )
+                    logger.info(f"Loaded embedding model {self.model_name} in {time.perf_counter() - start:.2f}s")
+        return self._encoder
+
+    def warm_up(self) -> float:
+        """載入模型並編碼一次（不經過快取），返回耗時秒數"""
+        start = time.perf_counter()
+        self.encoder.embed_documents(["暖機 warm up"])
+        return time.perf_counter() - start
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """編碼單一批次並記錄耗時"""
+        start = time.perf_counter()
+        vectors = np.asarray(self.encoder.embed_documents(texts), dtype=np.float32)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats["encoded"] += len(texts)
+            self._stats["encode_seconds"] += elapsed
+        return vectors
+
+    def embed_array(self, texts: List[str], persist: bool = False) -> np.ndarray:
+        """將文字轉為向量矩陣，依序返回
+
+        persist=True 用於索引文檔：新向量寫入磁碟快取（每次呼叫寫入一次）。
+        """
+        with span("embed"):
+            return self._embed_array(texts, persist)
+
+    def _query_cache_get(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        with self._query_cache_lock:
+            results = []
+            for text in texts:
+                vector = self._query_cache.get(text)
+                if vector is not None:
+                    self._query_cache.move_to_end(text)
+                results.append(vector)
+            return results
+
+    def _query_cache_put(self, texts: List[str], vectors: np.ndarray):
+        if not self.query_cache_size:
+            return
+        with self._query_cache_lock:
+            for text, vector in zip(texts, vectors):
+                self._query_cache[text] = vector
+                self._query_cache.move_to_end(text)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+
+    def _embed_array(self, texts: List[str], persist: bool = False) -> np.ndarray:
+        start = time.perf_counter()
+        normalized = [normalize_text(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        # 先查磁碟快取（查詢與已索引的文檔相同時也會命中），查詢再查記憶體 LRU
+        if self.cache is not None:
+            results = self.cache.get_many([self.cache.key(text) for text in normalized])
+        if not persist:
+            missing = [i for i, vector in enumerate(results) if vector is None]
+            for i, vector in zip(missing, self._query_cache_get([normalized[i] for i in missing])):
+                results[i] = vector
+
+        # 同一次呼叫中的重複文字只編碼一次
+        pending: Dict[str, List[int]] = {}
+        for i, vector in enumerate(results):
+            if vector is None:
+                pending.setdefault(normalized[i], []).append(i)
+        unique_texts = list(pending.keys())
+
+        if unique_texts:
+            batches = [
+                unique_texts[i:i + self.batch_size]
+                for i in range(0, len(unique_texts), self.batch_size)
+            ]
+            if len(batches) == 1:
+                encoded = [self._encode_batch(batches[0])]
+            else:
+                encoded = list(self._executor.map(self._encode_batch, batches))
+            vectors = np.concatenate(encoded, axis=0)
+            for text, vector in zip(unique_texts, vectors):
+                for i in pending[text]:
+                    results[i] = vector
+            if persist and self.cache is not None:
+                self.cache.put_many([self.cache.key(text) for text in unique_texts], vectors)
+            elif not persist:
+                self._query_cache_put(unique_texts, vectors)
+
+        with self._stats_lock:
+            self._stats["texts"] += len(texts)
+            self._stats["cache_hits"] += len(texts) - sum(len(v) for v in pending.values())
+            self._stats["wall_seconds"] += time.perf_counter() - start
+
+        if not texts:
+            return np.zeros((0, self.cache.dim if self.cache is not None and self.cache.dim else 0), dtype=np.float32)
+        return np.vstack(results).astype(np.float32, copy=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts, persist=True).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_array([text])[0].tolist()
+
+    def throughput_report(self) -> Dict[str, Any]:
+        """返回吞吐量統計（docs/sec）"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["cache_hit_rate"] = stats["cache_hits"] / stats["texts"] if stats["texts"] else 0.0
+        stats["encode_docs_per_sec"] = stats["encoded"] / stats["encode_seconds"] if stats["encode_seconds"] else 0.0
+        stats["docs_per_sec"] = stats["texts"] / stats["wall_seconds"] if stats["wall_seconds"] else 0.0
+        stats["batch_size"] = self.batch_size
+        stats["workers"] = self.max_workers
+        stats["cached_vectors"] = len(self.cache) if self.cache is not None else 0
+        stats["cached_queries"] = len(self._query_cache)
+        return stats
+
+
+def main():
+    """量測目前主機的嵌入吞吐量，用於規劃匯入主機規格"""
+    from .catalog import PRODUCTS_FILE
+    from .product_service import EMBEDDING_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Embedding throughput report")
+    parser.add_argument("--products", default=str(PRODUCTS_FILE))
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=EMBEDDING_WORKERS)
+    parser.add_argument("--repeat", type=int, default=1, help="重複產品文字以放大樣本數")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default=EMBEDDING_BACKEND)
+    args = parser.parse_args()
+
+    with open(args.products, "r", encoding="utf-8") as f:
+        products = json.load(f)["products"]
+    texts = [
+        f"{product['name']} {product['category']} {product['description']} {json.dumps(product['specs'], ensure_ascii=False)} #{i}"
+        for i in range(args.repeat)
+        for product in products
+    ]
+
+    # 不使用快取，量測的是純編碼吞吐量
+    embeddings = CachedEmbeddings(
+        EMBEDDING_MODEL_NAME,
+        batch_size=args.batch_size,
+        max_workers=args.workers,
+        cache_dir=None,
+        backend=args.backend
+    )
+    embeddings.embed_array(texts)
+    print(json.dumps(embeddings.throughput_report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
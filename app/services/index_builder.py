@@ -0,0 +1,45 @@
+from typing import Set
+import argparse
+import logging
+import threading
+from .catalog import ProductCatalog
+from .index_snapshot import IndexPublisher, INDEX_SNAPSHOT_DIR
+from .product_service import ProductService
+
+logger = logging.getLogger(__name__)
+
+
+def publish_generation(service: ProductService, publisher: IndexPublisher) -> int:
+    """把向量索引中目前的所有向量與目錄快照發布為新世代"""
+    chunks, vectors = service.vector_backend.export()
+    return publisher.publish(service.catalog.products, chunks, vectors, service.embeddings.model_id)
+
+
+def main():
+    """索引建置程序：維護本地向量索引並發布工作程序共用的索引世代"""
+    parser = argparse.ArgumentParser(description="Build and publish shared index generations")
+    parser.add_argument("--output", default=INDEX_SNAPSHOT_DIR)
+    parser.add_argument("--watch", action="store_true", help="持續監看產品檔案，變動時發布新世代")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # 建置程序以本地模式開啟向量索引（VECTOR_BACKEND），只重新嵌入有變動的文檔
+    service = ProductService()
+    if service.shared_index is not None:
+        parser.error("The index builder must run with INDEX_MODE=local")
+    publisher = IndexPublisher(args.output)
+    publish_generation(service, publisher)
+    if not args.watch:
+        return
+
+    def on_catalog_change(old: ProductCatalog, new: ProductCatalog, changed: Set[str]):
+        # ProductService 先訂閱，執行到這裡時向量索引已同步完成
+        publish_generation(service, publisher)
+
+    service.catalog_store.subscribe(on_catalog_change)
+    logger.info(f"Watching {service.catalog_store.path} for catalog changes")
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+from typing import List, Dict, Any, Optional, Callable, Set, Tuple
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from langchain.schema import Document
+from .catalog import CatalogStore, get_catalog_store
+from .vector_backends import flat_search, squared_norms
+
+logger = logging.getLogger(__name__)
+
+# 建置程序發布索引世代的目錄，工作程序從這裡映射目前的世代
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "chroma_db/snapshots")
+# 工作程序檢查新世代的間隔（秒），設為 0 則不監看
+INDEX_SNAPSHOT_POLL_INTERVAL = float(os.getenv("INDEX_SNAPSHOT_POLL_INTERVAL", "2"))
+# 保留的世代數（較舊的世代在發布後刪除）
+INDEX_SNAPSHOT_KEEP = int(os.getenv("INDEX_SNAPSHOT_KEEP", "3"))
+CURRENT_FILENAME = "CURRENT"
+
+# listener(新世代)
+GenerationListener = Callable[["IndexGeneration"], None]
+
+
+class IndexModelMismatchError(Exception):
+    """索引世代與查詢使用不同的嵌入模型，距離不可比較"""
+
+
+class IndexGeneration:
+    """唯讀的索引世代
+
+    世代目錄包含：
+    - vectors.f32: 形狀為 (count, dim) 的 float32 矩陣，以唯讀方式記憶體映射，
+      多個工作程序共用作業系統的同一份頁面快取
+    - chunks.json: 每一列對應的文檔內容與元數據
+    - products.json: 建置時的產品目錄快照
+    - meta.json: 世代編號、模型、維度與列數
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        with open(self.directory / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.generation = int(self.meta["generation"])
+        count, dim = int(self.meta["count"]), int(self.meta["dim"])
+        if count:
+            self.vectors = np.memmap(self.directory / "vectors.f32", dtype=np.float32, mode="r", shape=(count, dim))
+        else:
+            self.vectors = np.zeros((0, dim), dtype=np.float32)
+        # 每列的平方範數，用於計算與 Chroma 相同的 L2 距離
+        self._norms = squared_norms(self.vectors)
+        with open(self.directory / "chunks.json", "r", encoding="utf-8") as f:
+            self.chunks: List[Dict[str, Any]] = json.load(f)
+        # 每列所屬的產品ID，用於把產品篩選下推到矩陣運算
+        self._row_products = np.array([chunk["metadata"].get("id", "") for chunk in self.chunks], dtype=object)
+
+    @property
+    def products_file(self) -> Path:
+        return self.directory / "products.json"
+
+    def search(
+        self,
+        query_vectors: np.ndarray,
+        k: int,
+        allowed: Optional[Set[str]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """批次最近鄰查詢，返回 (文檔, 平方 L2 距離)，距離由小到大
+
+        指定 allowed 時只在這些產品的文檔中查詢。
+        """
+        rows = None
+        if allowed is not None:
+            rows = np.flatnonzero(np.isin(self._row_products, list(allowed)))
+        top, distances = flat_search(self.vectors, self._norms, query_vectors, k, rows)
+        results = []
+        for indices, row_distances in zip(top, distances):
+            results.append([
+                (
+                    Document(page_content=self.chunks[i]["content"], metadata=self.chunks[i]["metadata"]),
+                    float(distance)
+                )
+                for i, distance in zip(indices, row_distances)
+            ])
+        return results
+
+
+class IndexPublisher:
+    """建置程序用來發布新的索引世代
+
+    世代先寫入暫存目錄再改名，最後以 os.replace 原子更新 CURRENT，
+    工作程序不會讀到寫到一半的世代。
+    """
+
+    def __init__(self, directory: str = INDEX_SNAPSHOT_DIR, keep: int = INDEX_SNAPSHOT_KEEP):
+        self.directory = Path(directory)
+        self.keep = max(1, keep)
+
+    def _generations(self) -> List[Path]:
+        if not self.directory.exists():
+            return []
+        return sorted(path for path in self.directory.glob("gen-*") if path.is_dir() and path.suffix != ".tmp")
+
+    def publish(
+        self,
+        products: List[Dict[str, Any]],
+        chunks: List[Dict[str, Any]],
+        vectors: np.ndarray,
+        model: str
+    ) -> int:
+        """寫入新世代並設為目前世代，返回世代編號"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(chunks) != len(vectors):
+            raise ValueError(f"Got {len(chunks)} chunks but {len(vectors)} vectors")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        existing = self._generations()
+        generation = int(existing[-1].name.split("-")[1]) + 1 if existing else 1
+        name = f"gen-{generation:06d}"
+        tmp_dir = self.directory / f"{name}.tmp"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir()
+
+        vectors.tofile(tmp_dir / "vectors.f32")
+        with open(tmp_dir / "chunks.json", "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        with open(tmp_dir / "products.json", "w", encoding="utf-8") as f:
+            json.dump({"products": products}, f, ensure_ascii=False)
+        with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "generation": generation,
+                "model": model,
+                "count": int(vectors.shape[0]),
+                "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+                "created_at": time.time()
+            }, f)
+        os.rename(tmp_dir, self.directory / name)
+
+        current_tmp = self.directory / f"{CURRENT_FILENAME}.tmp"
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(current_tmp, self.directory / CURRENT_FILENAME)
+        logger.info(f"Published index generation {generation}: {len(chunks)} chunks, {len(products)} products")
+
+        # 已映射舊世代的工作程序在檔案刪除後仍可繼續讀取，直到切換到新世代
+        for old in self._generations()[:-self.keep]:
+            shutil.rmtree(old, ignore_errors=True)
+        return generation
+
+
+class SharedIndex:
+    """工作程序端的共享索引
+
+    背景執行緒輪詢 CURRENT，有新世代時載入並原子替換目前的世代，
+    再通知訂閱者（例如切換產品目錄來源）。以 require_model() 指定查詢
+    使用的嵌入模型後，不會切換到以其他模型建置的世代。
+    """
+
+    def __init__(self, directory: str = INDEX_SNAPSHOT_DIR, poll_interval: float = INDEX_SNAPSHOT_POLL_INTERVAL):
+        self.directory = Path(directory)
+        self.poll_interval = poll_interval
+        self._current: Optional[IndexGeneration] = None
+        self._lock = threading.Lock()
+        self._listeners: List[GenerationListener] = []
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        # 查詢使用的嵌入模型，None 表示不檢查
+        self.model: Optional[str] = None
+        # 已拒絕的世代名稱，避免每次輪詢重複記錄
+        self._rejected: Optional[str] = None
+
+    def require_model(self, model: str):
+        """只接受以 model 建置的世代，目前的世代不符時拋出 IndexModelMismatchError"""
+        with self._lock:
+            self.model = model
+            generation = self._current
+        if generation is not None and generation.meta.get("model") != model:
+            raise IndexModelMismatchError(
+                f"Index generation {generation.generation} was built with {generation.meta.get('model')}, "
+                f"but queries are encoded with {model}; rebuild the index with the same embedding backend"
+            )
+
+    @property
+    def current(self) -> Optional[IndexGeneration]:
+        """目前的世代，尚未發布任何世代時為 None"""
+        return self._current
+
+    def subscribe(self, listener: GenerationListener):
+        """註冊世代切換通知"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def _read_current_name(self) -> Optional[str]:
+        try:
+            with open(self.directory / CURRENT_FILENAME, "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def refresh(self) -> bool:
+        """CURRENT 指向新世代時載入並切換，返回是否切換"""
+        name = self._read_current_name()
+        with self._lock:
+            if name is None or name == self._rejected or (self._current is not None and self._current.directory.name == name):
+                return False
+            try:
+                generation = IndexGeneration(self.directory / name)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Failed to load index generation {name}: {e}")
+                return False
+            if self.model is not None and generation.meta.get("model") != self.model:
+                # 保留目前的世代，等待以相同模型建置的新世代
+                logger.error(
+                    f"Ignoring index generation {generation.generation}: built with {generation.meta.get('model')}, "
+                    f"but queries are encoded with {self.model}"
+                )
+                self._rejected = name
+                return False
+            self._current = generation
+            listeners = list(self._listeners)
+
+        logger.info(f"Switched to index generation {generation.generation} ({len(generation.chunks)} chunks)")
+        for listener in listeners:
+            try:
+                listener(generation)
+            except Exception as e:
+                logger.error(f"Index generation listener failed: {e}")
+        return True
+
+    def search(
+        self,
+        query_vectors: np.ndarray,
+        k: int,
+        allowed: Optional[Set[str]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """在目前的世代上查詢"""
+        generation = self._current
+        if generation is None:
+            logger.warning(f"No index generation published in {self.directory} yet")
+            return [[] for _ in range(len(query_vectors))]
+        return generation.search(query_vectors, k, allowed)
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.refresh()
+
+    def start_watching(self):
+        """啟動背景監看執行緒"""
+        if self.poll_interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        """停止背景監看"""
+        self._stop.set()
+
+    def __len__(self) -> int:
+        generation = self._current
+        return 0 if generation is None else len(generation.chunks)
+
+    def stats(self) -> Dict[str, Any]:
+        generation = self._current
+        if generation is None:
+            return {"generation": None}
+        return {
+            "generation": generation.generation,
+            "chunks": len(generation.chunks),
+            "dim": int(generation.meta["dim"]),
+            "created_at": generation.meta["created_at"]
+        }
+
+
+_shared_index: Optional[SharedIndex] = None
+_shared_index_lock = threading.Lock()
+
+
+def get_shared_index(catalog_store: Optional[CatalogStore] = None) -> SharedIndex:
+    """取得全域共用的 SharedIndex，產品目錄改為跟隨目前世代的快照"""
+    global _shared_index
+    with _shared_index_lock:
+        if _shared_index is None:
+            catalog_store = catalog_store or get_catalog_store()
+            _shared_index = SharedIndex()
+            # 目錄與向量來自同一個世代，兩者保持一致
+            _shared_index.subscribe(lambda generation: catalog_store.switch_source(generation.products_file))
+            _shared_index.refresh()
+            _shared_index.start_watching()
+        return _shared_index
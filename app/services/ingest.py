@@ -0,0 +1,507 @@
+"""大量產品資料的串流匯入
+
+以串流方式讀取 JSONL/NDJSON 產品資料（可為 .gz），逐筆依 PRODUCT_SCHEMA 驗證，
+以與 ProductService 相同的方式建立文檔與切塊，分批嵌入後寫入向量索引。讀取、
+嵌入與寫入三個階段以有界佇列串接（嵌入下一批的同時寫入上一批），記憶體只與
+批次大小、佇列深度和已匯入的產品ID集合有關，不必把整個目錄載入記憶體。
+
+輸出：
+- 向量索引（--backend）與索引清單：服務啟動時比對雜湊即可，不會重新嵌入
+- 產品目錄檔（--catalog，預設 PRODUCTS_FILE）
+- 未通過驗證的記錄（--rejects，JSONL，含行號與錯誤訊息）
+
+每個批次寫入後更新檢查點（讀取位置與各輸出檔的大小），中斷後以相同命令重新
+執行即從檢查點續傳。匯入是整個目錄的重建，應在服務停止時執行：
+
+    python -m app.services.ingest feed.jsonl --batch-size 256 --rejects rejects.jsonl
+"""
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Set
+import argparse
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+import numpy as np
+from .catalog import PRODUCTS_FILE
+from .embedding_service import CachedEmbeddings
+from .product_service import (
+    EMBEDDING_MODEL_NAME,
+    MANIFEST_FILENAME,
+    MANIFEST_VERSION,
+    PERSIST_DIRECTORY,
+    ProductService,
+    build_product_documents,
+    create_text_splitter
+)
+from .vector_backends import (
+    ChromaBackend,
+    VECTOR_BACKEND,
+    VECTOR_FLAT_DIR,
+    new_flat_generation,
+    publish_flat_generation
+)
+
+logger = logging.getLogger(__name__)
+
+# 每個批次的產品數
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+# 階段之間最多排隊的批次數
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "2"))
+# 進度日誌的間隔（秒）
+INGEST_LOG_INTERVAL = float(os.getenv("INGEST_LOG_INTERVAL", "10"))
+
+# 產品欄位 -> 允許的型別（其他欄位原樣保留）
+PRODUCT_SCHEMA = {
+    "id": (str,),
+    "name": (str,),
+    "category": (str,),
+    "price": (int, float),
+    "stock": (int,),
+    "specs": (dict,),
+    "description": (str,),
+    "warranty": (str,)
+}
+
+
+def validate_product(record: Any) -> List[str]:
+    """依 PRODUCT_SCHEMA 檢查一筆記錄，返回錯誤訊息（空列表表示通過）"""
+    if not isinstance(record, dict):
+        return [f"expected an object, got {type(record).__name__}"]
+    errors = []
+    for field, types in PRODUCT_SCHEMA.items():
+        if field not in record:
+            errors.append(f"missing field {field!r}")
+        elif isinstance(record[field], bool) or not isinstance(record[field], types):
+            errors.append(f"{field!r} must be {' or '.join(t.__name__ for t in types)}")
+    if errors:
+        return errors
+    for field in ("id", "name", "category"):
+        if not record[field].strip():
+            errors.append(f"{field!r} must not be empty")
+    for field in ("price", "stock"):
+        if record[field] < 0:
+            errors.append(f"{field!r} must not be negative")
+    # format_specs 以「、」串接列表，其餘值直接轉為文字
+    for key, value in record["specs"].items():
+        if isinstance(value, list):
+            if not all(isinstance(item, str) for item in value):
+                errors.append(f"spec {key!r} must be a list of strings")
+        elif not isinstance(value, (str, int, float)):
+            errors.append(f"spec {key!r} must be a string, number or list of strings")
+    return errors
+
+
+def parse_record(raw: bytes) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """解析並驗證一行產品資料"""
+    try:
+        record = json.loads(raw)
+    except ValueError as e:
+        return None, [f"invalid JSON: {e}"]
+    return record, validate_product(record)
+
+
+def iter_feed(path: Path, offset: int = 0, line: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """從 offset 開始逐行讀取產品資料，返回 (行號, 該行結束的位元組位置, 內容)
+
+    .gz 檔案的位置是解壓縮後的位置。
+    """
+    with (gzip.open(path, "rb") if Path(path).suffix == ".gz" else open(path, "rb")) as f:
+        f.seek(offset)
+        for raw in f:
+            offset += len(raw)
+            line += 1
+            yield line, offset, raw
+
+
+class JsonStreamWriter:
+    """逐筆寫入 JSON 陣列或物件的暫存檔，完成時補上結尾並原子替換目標檔
+
+    進度以（檔案大小, 筆數）記錄在檢查點中，續傳時截斷到該大小再繼續追加。
+    """
+
+    def __init__(self, path: Path, head: str, state: Optional[Dict[str, int]] = None):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".ingest")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if state is None:
+            self._file = open(self.tmp_path, "wb")
+            self._file.write(head.encode("utf-8"))
+            self.items = 0
+        else:
+            self._file = open(self.tmp_path, "r+b")
+            self._file.truncate(state["size"])
+            self._file.seek(state["size"])
+            self.items = state["items"]
+
+    def append(self, text: str):
+        """追加一個已序列化的元素"""
+        self._file.write(((",\n" if self.items else "\n") + text).encode("utf-8"))
+        self.items += 1
+
+    def sync(self) -> Dict[str, int]:
+        """寫入磁碟並返回可存入檢查點的進度"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {"size": self._file.tell(), "items": self.items}
+
+    def commit(self, tail: str):
+        self._file.write(("\n" + tail).encode("utf-8"))
+        self.sync()
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def close(self):
+        self._file.close()
+
+
+class FlatIndexWriter:
+    """以 NumpyFlatBackend 的世代格式（vectors.f32 與 rows.json）追加寫入平面索引
+
+    寫入的是尚未發布的世代目錄，commit 時才切換，原有的索引在此之前保持不變。
+    """
+
+    def __init__(self, directory: str, state: Optional[Dict[str, Any]] = None):
+        self.directory = Path(directory)
+        self.generation_dir = Path(state["generation_dir"]) if state else new_flat_generation(self.directory)
+        self.rows = JsonStreamWriter(self.generation_dir / "rows.json", '{"rows": [', state and state["rows"])
+        self.dim = state["dim"] if state else 0
+        vectors_file = self.generation_dir / "vectors.f32"
+        if state is None:
+            self._vectors = open(vectors_file, "wb")
+        else:
+            self._vectors = open(vectors_file, "r+b")
+            self._vectors.truncate(self.rows.items * self.dim * 4)
+            self._vectors.seek(0, os.SEEK_END)
+
+    def add(self, ids: List[str], documents, vectors: np.ndarray):
+        for chunk_id, document in zip(ids, documents):
+            self.rows.append(json.dumps(
+                {"id": chunk_id, "content": document.page_content, "metadata": document.metadata},
+                ensure_ascii=False
+            ))
+        if len(ids):
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            self.dim = int(vectors.shape[1])
+            self._vectors.write(vectors.tobytes())
+
+    def sync(self) -> Dict[str, Any]:
+        self._vectors.flush()
+        os.fsync(self._vectors.fileno())
+        return {"generation_dir": str(self.generation_dir), "rows": self.rows.sync(), "dim": self.dim}
+
+    def commit(self):
+        self.sync()
+        self._vectors.close()
+        self.rows.commit(f'], "dim": {self.dim}}}')
+        publish_flat_generation(self.directory, self.generation_dir)
+
+    def close(self):
+        self._vectors.close()
+        self.rows.close()
+
+
+class ChromaIndexWriter:
+    """直接寫入 Chroma 集合
+
+    upsert 可重複執行，續傳時重寫中斷的批次不會產生重複的向量。
+    """
+
+    def __init__(self, backend: ChromaBackend, state: Optional[Dict[str, Any]] = None):
+        self.backend = backend
+        self.directory = backend.directory
+        if state is None:
+            # 先移除舊的索引清單，匯入中途啟動的服務不會誤信已清空的集合
+            (self.directory / MANIFEST_FILENAME).unlink(missing_ok=True)
+            self.backend.clear()
+
+    def add(self, ids: List[str], documents, vectors: np.ndarray):
+        if ids:
+            self.backend.add(ids, documents, vectors)
+
+    def sync(self) -> Dict[str, Any]:
+        return {}
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class CatalogIngestor:
+    """串流匯入產品資料：讀取與驗證 → 嵌入 → 寫入索引、清單與目錄"""
+
+    def __init__(
+        self,
+        embeddings: Optional[CachedEmbeddings] = None,
+        backend: str = VECTOR_BACKEND,
+        catalog_path: Path = PRODUCTS_FILE,
+        batch_size: int = INGEST_BATCH_SIZE,
+        queue_depth: int = INGEST_QUEUE_DEPTH,
+        log_interval: float = INGEST_LOG_INTERVAL
+    ):
+        if backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown vector backend: {backend!r} (expected 'chroma' or 'numpy')")
+        # 不使用磁碟嵌入快取：快取的鍵索引常駐記憶體，會隨產品數增長
+        self.embeddings = embeddings or CachedEmbeddings(EMBEDDING_MODEL_NAME, cache_dir=None)
+        self.backend = backend
+        self.catalog_path = Path(catalog_path)
+        self.batch_size = max(1, batch_size)
+        self.queue_depth = max(1, queue_depth)
+        self.log_interval = log_interval
+        self.text_splitter = create_text_splitter()
+        self._error: Optional[BaseException] = None
+
+    def _open_index_writer(self, state: Optional[Dict[str, Any]]):
+        if self.backend == "chroma":
+            return ChromaIndexWriter(ChromaBackend(PERSIST_DIRECTORY, self.embeddings), state)
+        return FlatIndexWriter(VECTOR_FLAT_DIR, state)
+
+    def _identity(self, feed: Path) -> Dict[str, Any]:
+        """檢查點所屬的資料檔與設定，續傳時必須相同"""
+        stat = feed.stat()
+        return {
+            "feed": {"path": str(feed.resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+            "model": self.embeddings.model_id,
+            "backend": self.backend,
+            "catalog": str(self.catalog_path.resolve())
+        }
+
+    def _load_checkpoint(self, checkpoint: Path, feed: Path) -> Optional[Dict[str, Any]]:
+        """讀取檢查點，與目前的資料檔或設定不符時拋出 ValueError"""
+        if not checkpoint.exists():
+            return None
+        with open(checkpoint, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        for key, value in self._identity(feed).items():
+            if state.get(key) != value:
+                raise ValueError(
+                    f"Checkpoint {checkpoint} was written for a different {key} "
+                    f"({state.get(key)!r} != {value!r}); rerun with --restart"
+                )
+        return state
+
+    @staticmethod
+    def _save_checkpoint(checkpoint: Path, state: Dict[str, Any]):
+        """以原子方式寫入檢查點"""
+        tmp_file = checkpoint.with_name(checkpoint.name + ".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_file, checkpoint)
+
+    def _new_batch(self) -> Dict[str, Any]:
+        return {"products": [], "chunks": [], "chunk_ids": [], "manifest": [], "rejects": [], "offset": 0, "line": 0}
+
+    def _add_product(self, batch: Dict[str, Any], product: Dict[str, Any]):
+        """建立產品的文檔與切塊（與 ProductService._sync_vector_store 相同的鍵與切塊 ID）"""
+        for document in build_product_documents(product):
+            key = f"{document.metadata['id']}:{document.metadata['type']}"
+            chunks = self.text_splitter.split_documents([document])
+            chunk_ids = [f"{key}:{i}" for i in range(len(chunks))]
+            batch["chunks"].extend(chunks)
+            batch["chunk_ids"].extend(chunk_ids)
+            batch["manifest"].append((key, {"hash": ProductService._fingerprint(document), "chunk_ids": chunk_ids}))
+        batch["products"].append(product)
+
+    def _stage(self, source: queue.Queue, sink: Optional[queue.Queue], handler):
+        """管線的一個階段；失敗後只消耗剩餘批次，上游不會因佇列已滿而卡住"""
+        while True:
+            batch = source.get()
+            if batch is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                handler(batch)
+            except BaseException as e:
+                logger.error(f"Ingestion stage {threading.current_thread().name} failed: {e}")
+                self._error = e
+                continue
+            if sink is not None:
+                sink.put(batch)
+        if sink is not None:
+            sink.put(None)
+
+    def _embed_batch(self, batch: Dict[str, Any]):
+        batch["vectors"] = self.embeddings.embed_array(
+            [chunk.page_content for chunk in batch["chunks"]], persist=True
+        )
+
+    def run(self, feed: Path, checkpoint: Optional[Path] = None, rejects: Optional[Path] = None,
+            restart: bool = False) -> Dict[str, Any]:
+        """匯入產品資料，返回統計；中斷後以相同參數再次呼叫即從檢查點續傳"""
+        feed = Path(feed)
+        checkpoint = Path(checkpoint) if checkpoint else feed.with_name(feed.name + ".checkpoint.json")
+        state = None if restart else self._load_checkpoint(checkpoint, feed)
+        outputs = state["outputs"] if state else {}
+        stats = dict(state["stats"]) if state else {"products": 0, "rejected": 0, "chunks": 0}
+
+        index_writer = self._open_index_writer(outputs.get("index"))
+        manifest = JsonStreamWriter(
+            index_writer.directory / MANIFEST_FILENAME,
+            f'{{"version": {MANIFEST_VERSION}, "model": {json.dumps(self.embeddings.model_id)}, "documents": {{',
+            outputs.get("manifest")
+        )
+        catalog = JsonStreamWriter(self.catalog_path, '{"products": [', outputs.get("catalog"))
+        rejects_file = None
+        if rejects:
+            rejects_file = open(rejects, "r+b" if state and Path(rejects).exists() else "wb")
+            rejects_file.truncate(outputs.get("rejects", 0))
+            rejects_file.seek(0, os.SEEK_END)
+
+        identity = self._identity(feed)
+        offset, line = (state["offset"], state["line"]) if state else (0, 0)
+        start = time.perf_counter()
+        progress = {"logged": start, "products": 0}
+
+        def write_batch(batch: Dict[str, Any]):
+            index_writer.add(batch["chunk_ids"], batch["chunks"], batch["vectors"])
+            for key, entry in batch["manifest"]:
+                manifest.append(f"{json.dumps(key, ensure_ascii=False)}: {json.dumps(entry, ensure_ascii=False)}")
+            for product in batch["products"]:
+                catalog.append(json.dumps(product, ensure_ascii=False))
+            if rejects_file is not None:
+                for reject in batch["rejects"]:
+                    rejects_file.write((json.dumps(reject, ensure_ascii=False) + "\n").encode("utf-8"))
+            stats["products"] += len(batch["products"])
+            stats["rejected"] += len(batch["rejects"])
+            stats["chunks"] += len(batch["chunk_ids"])
+
+            # 所有輸出寫入磁碟後才推進檢查點
+            written = {"index": index_writer.sync(), "manifest": manifest.sync(), "catalog": catalog.sync()}
+            if rejects_file is not None:
+                rejects_file.flush()
+                os.fsync(rejects_file.fileno())
+                written["rejects"] = rejects_file.tell()
+            self._save_checkpoint(checkpoint, {
+                **identity, "offset": batch["offset"], "line": batch["line"], "stats": stats, "outputs": written
+            })
+
+            progress["products"] += len(batch["products"])
+            now = time.perf_counter()
+            if now - progress["logged"] >= self.log_interval:
+                logger.info(
+                    f"Ingested {stats['products']} products ({stats['rejected']} rejected, {stats['chunks']} chunks) "
+                    f"through line {batch['line']}, {progress['products'] / (now - start):.1f} products/sec"
+                )
+                progress["logged"] = now
+
+        # 續傳時重新驗證已匯入的部分，只為了還原重複ID的檢查
+        seen: Set[str] = set()
+        if state:
+            logger.info(f"Resuming {feed} from line {line} ({stats['products']} products already ingested)")
+            for _, _, raw in iter_feed(feed):
+                if len(seen) >= stats["products"]:
+                    break
+                if raw.strip():
+                    record, errors = parse_record(raw)
+                    if not errors:
+                        seen.add(record["id"])
+
+        self._error = None
+        embed_queue: queue.Queue = queue.Queue(maxsize=self.queue_depth)
+        write_queue: queue.Queue = queue.Queue(maxsize=self.queue_depth)
+        threads = [
+            threading.Thread(target=self._stage, args=(embed_queue, write_queue, self._embed_batch), name="ingest-embed"),
+            threading.Thread(target=self._stage, args=(write_queue, None, write_batch), name="ingest-write")
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            batch = self._new_batch()
+            for line, offset, raw in iter_feed(feed, offset, line):
+                if self._error is not None:
+                    break
+                batch["offset"], batch["line"] = offset, line
+                if not raw.strip():
+                    continue
+                record, errors = parse_record(raw)
+                if not errors and record["id"] in seen:
+                    errors = [f"duplicate id {record['id']!r}"]
+                if errors:
+                    batch["rejects"].append({
+                        "line": line,
+                        "errors": errors,
+                        "record": raw.decode("utf-8", errors="replace").rstrip("\r\n")
+                    })
+                else:
+                    seen.add(record["id"])
+                    self._add_product(batch, record)
+                if len(batch["products"]) + len(batch["rejects"]) >= self.batch_size:
+                    embed_queue.put(batch)
+                    batch = self._new_batch()
+            if self._error is None and (batch["products"] or batch["rejects"] or batch["line"]):
+                embed_queue.put(batch)
+        finally:
+            # 中斷時已送出的批次仍會寫完並推進檢查點
+            embed_queue.put(None)
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            for output in (index_writer, manifest, catalog):
+                output.close()
+            if rejects_file is not None:
+                rejects_file.close()
+            raise RuntimeError(f"Ingestion of {feed} failed; rerun to resume from {checkpoint}") from self._error
+
+        # 目錄檔最後替換：服務看到新目錄時索引與清單已就緒
+        index_writer.commit()
+        manifest.commit("}}")
+        catalog.commit("]}")
+        if rejects_file is not None:
+            rejects_file.close()
+        checkpoint.unlink(missing_ok=True)
+
+        elapsed = time.perf_counter() - start
+        report = self.embeddings.throughput_report()
+        result = {
+            **stats,
+            "feed": str(feed),
+            "catalog": str(self.catalog_path),
+            "backend": self.backend,
+            "resumed": state is not None,
+            "elapsed_s": round(elapsed, 3),
+            "products_per_sec": round(progress["products"] / elapsed, 1) if elapsed else 0.0,
+            "embedding_docs_per_sec": round(report["docs_per_sec"], 1)
+        }
+        logger.info(
+            f"Ingested {stats['products']} products ({stats['rejected']} rejected, {stats['chunks']} chunks) "
+            f"into {self.catalog_path} and the {self.backend} index in {elapsed:.1f}s"
+        )
+        return result
+
+
+def main():
+    """離線匯入大型產品資料，完成後重新啟動服務（共享模式再執行索引建置程序）"""
+    parser = argparse.ArgumentParser(description="Stream a JSONL product feed into the catalog and vector index")
+    parser.add_argument("feed", help="JSONL/NDJSON 產品資料，每行一個產品（可為 .gz）")
+    parser.add_argument("--catalog", default=str(PRODUCTS_FILE), help="輸出的產品目錄檔")
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default=VECTOR_BACKEND)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="每批的產品數")
+    parser.add_argument("--queue-depth", type=int, default=INGEST_QUEUE_DEPTH, help="階段之間排隊的批次數")
+    parser.add_argument("--checkpoint", help="檢查點檔案（預設為 <feed>.checkpoint.json）")
+    parser.add_argument("--rejects", help="寫入未通過驗證的記錄（JSONL）")
+    parser.add_argument("--restart", action="store_true", help="忽略現有的檢查點，從頭匯入")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    ingestor = CatalogIngestor(
+        backend=args.backend,
+        catalog_path=Path(args.catalog),
+        batch_size=args.batch_size,
+        queue_depth=args.queue_depth
+    )
+    try:
+        result = ingestor.run(Path(args.feed), args.checkpoint, args.rejects, restart=args.restart)
+    except ValueError as e:
+        parser.error(str(e))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+from typing import List, Dict, Any, Optional, Set, Callable, Tuple
+import logging
+import threading
+import numpy as np
+from .catalog import INDEX_MODE, CatalogStore, ProductCatalog, get_catalog_store
+
+logger = logging.getLogger(__name__)
+
+# listener(變動的產品ID)
+InventoryListener = Callable[[Set[str]], None]
+
+
+class InventoryReadOnlyError(Exception):
+    """此程序的庫存層只跟隨產品檔案，不接受 API 更新"""
+
+
+class InventoryStore:
+    """即時價格與庫存
+
+    價格與庫存以產品ID對應到 int64 陣列中的列，更新不需要重新嵌入向量，
+    所有輸出在渲染時才讀取最新數值。目錄檔案中的價格或庫存被修改時，
+    以檔案中的新數值為準。
+    """
+
+    def __init__(self, catalog_store: Optional[CatalogStore] = None, read_only: bool = False):
+        self.catalog_store = catalog_store or get_catalog_store()
+        # 唯讀時只以目錄檔案的數值更新，apply_updates 拋出 InventoryReadOnlyError
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._listeners: List[InventoryListener] = []
+        self._rows: Dict[str, int] = {}
+        self._ids: List[str] = []
+        self._prices = np.zeros(0, dtype=np.int64)
+        self._stock = np.zeros(0, dtype=np.int64)
+        self.version = 0
+        self._seed(self.catalog_store.catalog.products)
+        self.catalog_store.subscribe(self._on_catalog_change)
+
+    def _seed(self, products: List[Dict[str, Any]]):
+        """以目錄中的數值寫入（新增或覆蓋）"""
+        new_ids = [product["id"] for product in products if product["id"] not in self._rows]
+        if new_ids:
+            start = len(self._rows)
+            self._prices = np.concatenate([self._prices, np.zeros(len(new_ids), dtype=np.int64)])
+            self._stock = np.concatenate([self._stock, np.zeros(len(new_ids), dtype=np.int64)])
+            for offset, product_id in enumerate(new_ids):
+                self._rows[product_id] = start + offset
+            self._ids.extend(new_ids)
+        for product in products:
+            row = self._rows[product["id"]]
+            self._prices[row] = product["price"]
+            self._stock[row] = product["stock"]
+
+    def _on_catalog_change(self, old: ProductCatalog, new: ProductCatalog, changed: Set[str]):
+        """目錄檔案更新時，只同步價格或庫存確實有變動的產品"""
+        seeded = []
+        for product_id in changed:
+            product = new.get(product_id)
+            previous = old.get(product_id)
+            if product is None:
+                continue
+            if previous is None or previous["price"] != product["price"] or previous["stock"] != product["stock"]:
+                seeded.append(product)
+        if not seeded:
+            return
+        with self._lock:
+            self._seed(seeded)
+            self.version += 1
+        self._notify({product["id"] for product in seeded})
+
+    def subscribe(self, listener: InventoryListener):
+        """註冊價格或庫存變動通知"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def _notify(self, product_ids: Set[str]):
+        for listener in list(self._listeners):
+            try:
+                listener(product_ids)
+            except Exception as e:
+                logger.error(f"Inventory listener failed: {e}")
+
+    def price(self, product_id: str) -> Optional[int]:
+        """即時價格"""
+        row = self._rows.get(product_id)
+        return None if row is None else int(self._prices[row])
+
+    def stock(self, product_id: str) -> Optional[int]:
+        """即時庫存"""
+        row = self._rows.get(product_id)
+        return None if row is None else int(self._stock[row])
+
+    def rows(self, product_ids: List[str]) -> np.ndarray:
+        """產品ID對應的陣列列號（找不到的產品為 -1）"""
+        with self._lock:
+            return np.array([self._rows.get(product_id, -1) for product_id in product_ids], dtype=np.int64)
+
+    def arrays(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """以列號一次取出 (價格, 庫存) 陣列；列號為 -1 的價格為最大值、庫存為 0"""
+        with self._lock:
+            missing = rows < 0
+            prices = self._prices[np.where(missing, 0, rows)] if len(self._prices) else np.zeros(len(rows), dtype=np.int64)
+            stock = self._stock[np.where(missing, 0, rows)] if len(self._stock) else np.zeros(len(rows), dtype=np.int64)
+            prices = np.where(missing, np.iinfo(np.int64).max, prices)
+            stock = np.where(missing, 0, stock)
+            return prices, stock
+
+    def select(
+        self,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        in_stock: bool = False
+    ) -> Set[str]:
+        """以價格區間與是否有庫存篩選產品（向量化比較）"""
+        with self._lock:
+            mask = np.ones(len(self._ids), dtype=bool)
+            if min_price is not None:
+                mask &= self._prices >= min_price
+            if max_price is not None:
+                mask &= self._prices <= max_price
+            if in_stock:
+                mask &= self._stock > 0
+            return {self._ids[row] for row in np.flatnonzero(mask)}
+
+    def apply_updates(self, updates: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """批次更新價格或庫存
+
+        每筆更新包含 product_id，以及 price（絕對值）、stock（絕對值）、
+        stock_delta（增減量）其中之一或多個。無效的項目不會套用，並在
+        errors 中返回原因。
+        """
+        if self.read_only:
+            raise InventoryReadOnlyError(
+                "Inventory updates are disabled with INDEX_MODE=shared: each worker holds its own copy. "
+                "Update prices and stock in the products file; the index builder publishes it to all workers."
+            )
+        applied = set()
+        errors = []
+        with self._lock:
+            for update in updates:
+                product_id = update.get("product_id")
+                row = self._rows.get(product_id)
+                if row is None:
+                    errors.append({"product_id": product_id, "error": "unknown product"})
+                    continue
+                price = update.get("price")
+                stock = update.get("stock")
+                stock_delta = update.get("stock_delta")
+                new_stock = int(self._stock[row]) if stock is None else stock
+                if stock_delta is not None:
+                    new_stock += stock_delta
+                if new_stock < 0:
+                    errors.append({"product_id": product_id, "error": "insufficient stock"})
+                    continue
+                if price is not None and price < 0:
+                    errors.append({"product_id": product_id, "error": "invalid price"})
+                    continue
+                if price is not None:
+                    self._prices[row] = price
+                self._stock[row] = new_stock
+                applied.add(product_id)
+            if applied:
+                self.version += 1
+            version = self.version
+        if applied:
+            self._notify(applied)
+        return {"applied": len(applied), "errors": errors, "version": version}
+
+
+_inventory_store: Optional[InventoryStore] = None
+_inventory_store_lock = threading.Lock()
+
+
+def get_inventory_store() -> InventoryStore:
+    """取得全域共用的 InventoryStore"""
+    global _inventory_store
+    with _inventory_store_lock:
+        if _inventory_store is None:
+            # 共享模式下每個工作程序各有一份庫存，API 更新只會改到收到請求的那一個
+            _inventory_store = InventoryStore(read_only=INDEX_MODE == "shared")
+        return _inventory_store
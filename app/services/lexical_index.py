@@ -0,0 +1,67 @@
+from typing import List, Dict, Tuple, Iterable
+from collections import Counter, defaultdict
+import heapq
+import math
+import re
+import unicodedata
+
+# 英數字（含型號常見的 - 與 .）為一個詞；其餘連續的非空白字元為 CJK 片段
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[\-.][a-z0-9]+)*|[^\sa-z0-9\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """CJK 感知的分詞：英數字詞整個保留，中文片段切成字元 bigram
+
+    中文沒有空白分隔，以重疊的 bigram 表示（單字片段保留單字），
+    讓「降噪耳機」能匹配「無線降噪耳機」而不需要斷詞詞典。
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        if token[0].isascii():
+            tokens.append(token)
+        elif len(token) == 1:
+            tokens.append(token)
+        else:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+class BM25Index:
+    """BM25 倒排索引
+
+    文件為 (文件ID, 詞列表)；建立後不可變，隨目錄快照一起替換。
+    """
+
+    def __init__(self, documents: Iterable[Tuple[str, List[str]]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._lengths: Dict[str, int] = {}
+        for doc_id, tokens in documents:
+            self._lengths[doc_id] = len(tokens)
+            for term, frequency in Counter(tokens).items():
+                self._postings[term][doc_id] = frequency
+        count = len(self._lengths)
+        self._average_length = sum(self._lengths.values()) / count if count else 0.0
+        self._idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """返回分數最高的 k 個 (文件ID, 分數)，只包含至少命中一個詞的文件"""
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / self._average_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
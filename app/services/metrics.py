@@ -0,0 +1,174 @@
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+import os
+import random
+import threading
+import time
+
+# 直方圖邊界（秒），涵蓋毫秒級的查詢到數十秒的 LLM 生成
+METRICS_BUCKETS = [
+    float(bound) for bound in
+    os.getenv("METRICS_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(",")
+]
+# 抽樣請求的比例：抽中的請求輸出對話日誌與各階段耗時
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+STAGE_METRIC = "agent_stage_duration_seconds"
+
+# 標籤以排序後的 (名稱, 值) 元組作為鍵
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(stage: str, labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted({"stage": stage, **{key: str(value) for key, value in labels.items()}}.items()))
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class MetricsRegistry:
+    """各階段耗時的直方圖與計數器，以 Prometheus 文字格式輸出
+
+    每次觀測只做一次二分搜尋與幾個整數加法，可以放在熱路徑上。
+    """
+
+    def __init__(self, buckets: List[float] = METRICS_BUCKETS):
+        self.buckets = sorted(buckets)
+        # 標籤 -> [各區間計數..., 總和, 次數]
+        self._histograms: Dict[Labels, List[float]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, **labels: Any):
+        key = _labels(stage, labels)
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0.0] * (len(self.buckets) + 3)
+            histogram[index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    def increment(self, name: str, amount: float = 1.0, **labels: Any):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def render(self) -> str:
+        """Prometheus 文字格式（0.0.4）"""
+        with self._lock:
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = [
+            f"# HELP {STAGE_METRIC} Latency of each request stage",
+            f"# TYPE {STAGE_METRIC} histogram"
+        ]
+        for labels in sorted(histograms):
+            values = histograms[labels]
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = 'le="%g"' % bound
+                lines.append(f"{STAGE_METRIC}_bucket{_format_labels(labels, le)} {cumulative:g}")
+            le = 'le="+Inf"'
+            lines.append(f"{STAGE_METRIC}_bucket{_format_labels(labels, le)} {values[-1]:g}")
+            lines.append(f"{STAGE_METRIC}_sum{_format_labels(labels)} {values[-2]:.6f}")
+            lines.append(f"{STAGE_METRIC}_count{_format_labels(labels)} {values[-1]:g}")
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """每個階段的次數與平均耗時（毫秒）"""
+        with self._lock:
+            histograms = {key: (values[-2], values[-1]) for key, values in self._histograms.items()}
+        summary = {}
+        for labels, (total, count) in sorted(histograms.items()):
+            labels = dict(labels)
+            stage = labels.pop("stage")
+            name = ",".join([stage] + [f"{key}={value}" for key, value in labels.items()])
+            summary[name] = {"count": count, "avg_ms": round(total / count * 1000, 3) if count else 0.0}
+        return summary
+
+
+# 目前請求的追蹤：{"request_id", "started", "sampled", "spans"}
+_current_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_trace", default=None)
+
+_registry: Optional[MetricsRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """取得全域共用的 MetricsRegistry"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
+
+
+def record(stage: str, seconds: float, **labels: Any):
+    """記錄一個階段的耗時，目前請求有追蹤時一併加入追蹤"""
+    get_metrics().observe(stage, seconds, **labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["spans"].append({
+            "stage": stage,
+            **labels,
+            "start_ms": round((time.perf_counter() - seconds - trace["started"]) * 1000, 3),
+            "ms": round(seconds * 1000, 3)
+        })
+
+
+@contextmanager
+def span(stage: str, **labels: Any) -> Iterator[None]:
+    """計時區塊（例外也會記錄）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, **labels)
+
+
+def start_trace(request_id: str, started: Optional[float] = None) -> Token:
+    """開始追蹤一個請求（之後建立的協程與 to_thread 執行緒共用同一份追蹤）
+
+    started 為請求到達的 time.perf_counter()，預設為現在。
+    """
+    return _current_trace.set({
+        "request_id": request_id,
+        "started": started if started is not None else time.perf_counter(),
+        "sampled": random.random() < TRACE_SAMPLE_RATE,
+        "spans": []
+    })
+
+
+def current_trace() -> Optional[Dict[str, Any]]:
+    return _current_trace.get()
+
+
+def end_trace(token: Token) -> Optional[Dict[str, Any]]:
+    """結束追蹤並記錄整個請求的耗時"""
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    if trace is not None:
+        get_metrics().observe("request", time.perf_counter() - trace["started"])
+    return trace
+
+
+def trace_summary(trace: Dict[str, Any]) -> Dict[str, Any]:
+    """回傳給客戶端或寫入日誌的追蹤內容"""
+    return {
+        "request_id": trace["request_id"],
+        "elapsed_ms": round((time.perf_counter() - trace["started"]) * 1000, 3),
+        "spans": list(trace["spans"])
+    }
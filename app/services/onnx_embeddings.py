@@ -0,0 +1,150 @@
+from typing import List, Dict, Any
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# 匯出的 ONNX 模型目錄（model_int8.onnx、tokenizer.json、onnx_config.json）
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "chroma_db/onnx")
+# 每個推論使用的執行緒數，0 表示依 CPU 核心數與 EMBEDDING_WORKERS 自動分配
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+# 與 sentence-transformers 模型的 max_seq_length 相同
+ONNX_MAX_LENGTH = int(os.getenv("ONNX_MAX_LENGTH", "128"))
+MODEL_FILENAME = "model_int8.onnx"
+CONFIG_FILENAME = "onnx_config.json"
+
+
+def default_intra_op_threads() -> int:
+    """CachedEmbeddings 以多個執行緒同時編碼，平分 CPU 核心避免過度訂閱"""
+    from .embedding_service import EMBEDDING_WORKERS
+
+    return max(1, (os.cpu_count() or 1) // max(1, EMBEDDING_WORKERS))
+
+
+class OnnxEmbeddings(Embeddings):
+    """以 ONNX Runtime 執行動態 int8 量化的 sentence-transformers 模型
+
+    與 HuggingFaceEmbeddings（normalize_embeddings=True）相同：以 attention mask
+    做平均池化再 L2 正規化。服務時只需要 onnxruntime 與 tokenizers，不載入 torch。
+    """
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, intra_op_threads: int = ONNX_INTRA_OP_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = Path(model_dir)
+        model_file = self.model_dir / MODEL_FILENAME
+        if not model_file.exists():
+            raise FileNotFoundError(
+                f"ONNX model not found at {model_file}; export it with `python -m app.services.onnx_embeddings`"
+            )
+        with open(self.model_dir / CONFIG_FILENAME, "r", encoding="utf-8") as f:
+            self.config: Dict[str, Any] = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(str(self.model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=int(self.config.get("max_length", ONNX_MAX_LENGTH)))
+        self.tokenizer.enable_padding(pad_id=int(self.config["pad_id"]), pad_token=self.config["pad_token"])
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads or default_intra_op_threads()
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # InferenceSession.run 可由多個執行緒同時呼叫
+        self.session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """編碼一個批次，返回正規化的 float32 矩陣"""
+        if not texts:
+            return np.zeros((0, int(self.config.get("dim", 0))), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self.session.run(None, feeds)[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32, copy=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+def export_model(model_name: str, output_dir: str = ONNX_MODEL_DIR, max_length: int = ONNX_MAX_LENGTH) -> Path:
+    """匯出 transformer 為 ONNX 並動態量化為 int8（只在建置時需要 torch 與 transformers）"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(repo_id)
+    model = AutoModel.from_pretrained(repo_id)
+    model.config.return_dict = False
+    model.eval()
+    tokenizer.save_pretrained(output)
+
+    sample = tokenizer(["匯出範例 export sample"], return_tensors="pt")
+    fp32_file = output / "model_fp32.onnx"
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ("input_ids", "attention_mask", "last_hidden_state")}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            str(fp32_file),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+    quantize_dynamic(str(fp32_file), str(output / MODEL_FILENAME), weight_type=QuantType.QInt8)
+    fp32_file.unlink()
+
+    with open(output / CONFIG_FILENAME, "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model_name,
+            "max_length": max_length,
+            "pad_token": tokenizer.pad_token,
+            "pad_id": tokenizer.pad_token_id,
+            "dim": model.config.hidden_size,
+            "quantization": "dynamic-int8",
+            "created_at": time.time()
+        }, f, ensure_ascii=False, indent=2)
+    return output
+
+
+def main():
+    """匯出 ONNX int8 嵌入模型，供 EMBEDDING_BACKEND=onnx 使用"""
+    from .product_service import EMBEDDING_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Export the embedding model to int8 ONNX")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    parser.add_argument("--output", default=ONNX_MODEL_DIR)
+    parser.add_argument("--max-length", type=int, default=ONNX_MAX_LENGTH)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    start = time.perf_counter()
+    output = export_model(args.model, args.output, args.max_length)
+    size_mb = (output / MODEL_FILENAME).stat().st_size / 1e6
+    logger.info(f"Exported {args.model} to {output / MODEL_FILENAME} ({size_mb:.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
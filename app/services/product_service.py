@@ -1,147 +1,350 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set, Tuple
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
+import logging
 import os
-from pathlib import Path
+import threading
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain.schema import Document
-from langchain.retrievers import ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import LLMChainExtractor
+from .catalog import INDEX_MODE, CatalogStore, ProductCatalog, format_specs, get_catalog_store
+from .embedding_service import CachedEmbeddings, EMBEDDING_CACHE_DIR
+from .index_snapshot import SharedIndex, get_shared_index
+from .inventory import InventoryStore, get_inventory_store
+from .metrics import span
+from .query_batcher import QueryBatcher, QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_SIZE
+from .query_cache import QueryCache, get_query_cache
+from .recommender import RecommendationEngine, get_recommender
+from .response_cache import RESPONSE_CACHE_ENABLED, get_response_cache
+from .retrieval import HybridRetriever, RETRIEVAL_AGGREGATION, get_retriever, group_by_product
+from .vector_backends import SharedIndexBackend, VectorBackend, VECTOR_BACKEND, create_vector_backend
 
-class ProductService:
-    def __init__(self):
-        # 使用多語言 sentence-transformers 模型
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name="paraphrase-multilingual-MiniLM-L12-v2",
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,  # 減小chunk大小以獲得更精確的匹配
-            chunk_overlap=100,
-            length_function=len,
-        )
-        self.vector_store = None
-        self.products_data = None
-        self._initialize_vector_store()
+logger = logging.getLogger(__name__)
 
-    def _initialize_vector_store(self):
-        """初始化向量存儲"""
-        # 讀取產品數據
-        products_file = Path("app/data/documents/products.json")
-        with open(products_file, "r", encoding="utf-8") as f:
-            self.products_data = json.load(f)
-
-        # 將產品數據轉換為文檔
-        documents = []
-        for product in self.products_data["products"]:
-            # 為每個產品創建多個不同角度的文檔
-            # 1. 基本信息文檔
-            basic_info = f"""
+EMBEDDING_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIR", "chroma_db/products")
+# 索引清單記錄每個產品文檔的內容雜湊與對應的向量 ID
+MANIFEST_FILENAME = "index_manifest.json"
+MANIFEST_VERSION = 2
+# 非同步搜索：同時執行的搜索數與允許排隊（含執行中）的最大請求數
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", str(os.cpu_count() or 4)))
+SEARCH_MAX_QUEUE_DEPTH = int(os.getenv("SEARCH_MAX_QUEUE_DEPTH", "256"))
+# 向量搜索單一查詢最多擷取的文檔數（超量擷取的上限）
+VECTOR_MAX_FETCH = int(os.getenv("VECTOR_MAX_FETCH", "256"))
+# 相似度閾值（距離，0.7 是一個較高的閾值，可以根據需要調整）
+SIMILARITY_THRESHOLD = 0.7
+
+def create_text_splitter() -> RecursiveCharacterTextSplitter:
+    """產品文檔的切塊設定（索引同步與大量匯入共用，切塊 ID 才會一致）"""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=500,  # 減小chunk大小以獲得更精確的匹配
+        chunk_overlap=100,
+        length_function=len,
+    )
+
+
+def build_product_documents(product: Dict[str, Any]) -> List[Document]:
+    """為單一產品建立不同角度的文檔"""
+    documents = []
+
+    # 1. 基本信息文檔（價格與庫存不嵌入向量，輸出時由 InventoryStore 即時渲染）
+    basic_info = f"""
             產品名稱: {product['name']}
             類別: {product['category']}
-            價格: {product['price']}元
-            庫存: {product['stock']}台
             """
-            documents.append(Document(
-                page_content=basic_info,
-                metadata={
-                    "id": product["id"],
-                    "name": product["name"],
-                    "type": "basic_info"
-                }
-            ))
+    documents.append(Document(
+        page_content=basic_info,
+        metadata={
+            "id": product["id"],
+            "name": product["name"],
+            "type": "basic_info"
+        }
+    ))
 
-            # 2. 完整規格文檔
-            specs_info = f"""
+    # 2. 完整規格文檔
+    specs_info = f"""
             產品名稱: {product['name']}
             完整規格:
-            {self._format_specs(product)}
+            {format_specs(product)}
             """
-            documents.append(Document(
-                page_content=specs_info,
-                metadata={
-                    "id": product["id"],
-                    "name": product["name"],
-                    "type": "specs"
-                }
-            ))
+    documents.append(Document(
+        page_content=specs_info,
+        metadata={
+            "id": product["id"],
+            "name": product["name"],
+            "type": "specs"
+        }
+    ))
 
-            # 3. 描述和保固文檔
-            desc_info = f"""
+    # 3. 描述和保固文檔
+    desc_info = f"""
             產品名稱: {product['name']}
             產品描述: {product['description']}
             保固信息: {product['warranty']}
             """
-            documents.append(Document(
-                page_content=desc_info,
-                metadata={
-                    "id": product["id"],
-                    "name": product["name"],
-                    "type": "description"
-                }
-            ))
+    documents.append(Document(
+        page_content=desc_info,
+        metadata={
+            "id": product["id"],
+            "name": product["name"],
+            "type": "description"
+        }
+    ))
+
+    return documents
+
+
+class ServiceOverloadedError(Exception):
+    """搜索請求超過佇列上限"""
+
+class ProductService:
+    def __init__(
+        self,
+        max_concurrency: int = SEARCH_MAX_CONCURRENCY,
+        max_queue_depth: int = SEARCH_MAX_QUEUE_DEPTH,
+        batch_window_ms: float = QUERY_BATCH_WINDOW_MS,
+        max_batch_size: int = QUERY_BATCH_MAX_SIZE,
+        catalog_store: Optional[CatalogStore] = None,
+        inventory: Optional[InventoryStore] = None,
+        query_cache: Optional[QueryCache] = None,
+        shared_index: Optional[SharedIndex] = None,
+        retriever: Optional[HybridRetriever] = None,
+        vector_backend: Optional[VectorBackend] = None,
+        recommender: Optional[RecommendationEngine] = None,
+        embeddings: Optional[CachedEmbeddings] = None
+    ):
+        # 與工具共用同一份產品目錄
+        self.catalog_store = catalog_store or get_catalog_store()
+        # 共享模式下向量索引由建置程序維護，本程序只映射唯讀的世代
+        if shared_index is None and INDEX_MODE == "shared":
+            shared_index = get_shared_index(self.catalog_store)
+        self.shared_index = shared_index
+        # 使用多語言 sentence-transformers 模型（批次編碼並快取於磁碟）
+        # 磁碟快取只允許單一程序寫入，共享模式的工作程序不使用
+        self.embeddings = embeddings or CachedEmbeddings(
+            EMBEDDING_MODEL_NAME,
+            cache_dir=None if self.shared_index is not None else EMBEDDING_CACHE_DIR
+        )
+        if self.shared_index is not None:
+            # 查詢向量與索引向量來自不同的編碼後端時距離不可比較，拒絕啟動（就緒檢查失敗）
+            self.shared_index.require_model(self.embeddings.model_id)
+        self.text_splitter = create_text_splitter()
+        # 向量索引後端（VECTOR_BACKEND 設定），共享模式下固定為唯讀的世代索引
+        if vector_backend is None and self.shared_index is not None:
+            vector_backend = SharedIndexBackend(self.shared_index)
+        self.vector_backend = vector_backend
+        self.inventory = inventory or get_inventory_store()
+        # 查詢結果快取，目錄或庫存版本變動時自動失效
+        self.query_cache = query_cache or get_query_cache()
+        self._indexed: Optional[Dict[str, Dict[str, Any]]] = None
+        self._sync_lock = threading.Lock()
+        # 同步檢索（編碼 + 向量查詢）在有界執行緒池中執行，避免阻塞事件迴圈
+        self.max_queue_depth = max_queue_depth
+        self._search_executor = ThreadPoolExecutor(
+            max_workers=max(1, max_concurrency),
+            thread_name_prefix="product-search"
+        )
+        self._pending_searches = 0
+        self._pending_lock = threading.Lock()
+        # 合併同時到達的查詢，一次批次編碼與最近鄰查詢
+        self.query_batcher = QueryBatcher(
+            self._product_search_batch,
+            executor=self._search_executor,
+            window_ms=batch_window_ms,
+            max_batch_size=max_batch_size
+        )
+        self._initialize_vector_store()
+        # 混合檢索：BM25 與向量結果以 RRF 融合，工具與 REST API 共用
+        self.retriever = retriever or get_retriever()
+        self.retriever.set_vector_search(self._product_search_batch)
+        # 推薦引擎使用同一個編碼器與每個產品的平均文檔向量
+        self.recommender = recommender or get_recommender()
+        self.recommender.set_encoder(self.embeddings.embed_array)
+        self.recommender.set_product_vectors(self._product_vectors)
+        # Agent 前的語意回應快取以同一個模型編碼訊息
+        if RESPONSE_CACHE_ENABLED:
+            get_response_cache().set_encoder(self.embeddings.embed_array)
+        # 目錄熱更新時只重新索引有變動的產品
+        self.catalog_store.subscribe(self._on_catalog_change)
+
+    @property
+    def catalog(self) -> ProductCatalog:
+        """目前的產品目錄快照"""
+        return self.catalog_store.catalog
+
+    def _initialize_vector_store(self):
+        """初始化向量存儲"""
+        if self.shared_index is not None:
+            return
+        # 重新開啟已持久化的向量索引，而不是每次啟動都重建
+        if self.vector_backend is None:
+            self.vector_backend = create_vector_backend(VECTOR_BACKEND, self.embeddings, PERSIST_DIRECTORY)
+        self._sync_vector_store()
+
+    def _on_catalog_change(self, old: ProductCatalog, new: ProductCatalog, changed: Set[str]):
+        """目錄快照替換後，增量更新向量索引"""
+        if self.shared_index is not None:
+            return
+        self._sync_vector_store(changed)
+        self.recommender.invalidate()
+
+    def _build_product_documents(self, product: Dict[str, Any]) -> List[Document]:
+        """為單一產品建立不同角度的文檔"""
+        return build_product_documents(product)
+
+    def _format_basic_info(self, product: Dict[str, Any]) -> str:
+        """以即時價格與庫存渲染基本信息"""
+        return f"""
+            產品名稱: {product['name']}
+            類別: {product['category']}
+            價格: {self.inventory.price(product['id'])}元
+            庫存: {self.inventory.stock(product['id'])}台
+            """
+
+    @staticmethod
+    def _fingerprint(document: Document) -> str:
+        """計算文檔內容與元數據的雜湊值"""
+        payload = json.dumps(
+            {"content": document.page_content, "metadata": document.metadata},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load_manifest(self) -> Optional[Dict[str, Any]]:
+        """讀取索引清單，清單不存在或與目前模型不符時返回 None"""
+        manifest_file = self.vector_backend.directory / MANIFEST_FILENAME
+        if not manifest_file.exists():
+            return None
+        try:
+            with open(manifest_file, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable index manifest: {e}")
+            return None
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("model") != self.embeddings.model_id:
+            return None
+        return manifest
+
+    def _save_manifest(self, documents: Dict[str, Dict[str, Any]]):
+        """以原子方式寫入索引清單"""
+        manifest_file = self.vector_backend.directory / MANIFEST_FILENAME
+        manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = manifest_file.with_suffix(".tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "model": self.embeddings.model_id, "documents": documents},
+                f,
+                ensure_ascii=False
+            )
+        os.replace(tmp_file, manifest_file)
+
+    def _sync_vector_store(self, product_ids: Optional[Set[str]] = None):
+        """比對內容雜湊清單，只嵌入、更新或刪除有變動的文檔
 
-        # 分割文檔
-        split_docs = self.text_splitter.split_documents(documents)
+        指定 product_ids 時只比對這些產品（目錄熱更新時使用）。
+        """
+        with self._sync_lock:
+            if self._indexed is None:
+                manifest = self._load_manifest()
+                if manifest is None:
+                    # 沒有可信的清單：清空集合，避免舊版本留下的重複向量
+                    self.vector_backend.clear()
+                    self._indexed = {}
+                else:
+                    self._indexed = manifest["documents"]
+            indexed = self._indexed
+
+            catalog = self.catalog
+            if product_ids is None:
+                products = catalog.products
+                scoped = indexed
+            else:
+                products = [catalog.by_id[product_id] for product_id in product_ids if product_id in catalog.by_id]
+                scoped = {key: entry for key, entry in indexed.items() if key.rsplit(":", 1)[0] in product_ids}
+
+            # 計算範圍內每個產品文檔的指紋
+            current = {}
+            for product in products:
+                for document in self._build_product_documents(product):
+                    key = f"{document.metadata['id']}:{document.metadata['type']}"
+                    current[key] = (document, self._fingerprint(document))
+
+            # 刪除已移除或內容有變動的文檔
+            stale_ids = []
+            for key, entry in scoped.items():
+                if key not in current or current[key][1] != entry["hash"]:
+                    stale_ids.extend(entry["chunk_ids"])
+            if stale_ids:
+                self.vector_backend.delete(stale_ids)
+
+            # 只為新增或變動的文檔產生向量
+            updated = {
+                key: entry for key, entry in indexed.items()
+                if key not in scoped or (key in current and current[key][1] == entry["hash"])
+            }
+            changed_keys = [key for key in current if key not in updated]
+            new_chunks = []
+            new_ids = []
+            for key in changed_keys:
+                document, fingerprint = current[key]
+                chunks = self.text_splitter.split_documents([document])
+                chunk_ids = [f"{key}:{i}" for i in range(len(chunks))]
+                new_chunks.extend(chunks)
+                new_ids.extend(chunk_ids)
+                updated[key] = {"hash": fingerprint, "chunk_ids": chunk_ids}
+            if new_chunks:
+                vectors = self.embeddings.embed_array([chunk.page_content for chunk in new_chunks], persist=True)
+                self.vector_backend.add(new_ids, new_chunks, vectors)
+
+            self._save_manifest(updated)
+            self._indexed = updated
 
-        # 創建向量存儲
-        self.vector_store = Chroma.from_documents(
-            documents=split_docs,
-            embedding=self.embeddings,
-            persist_directory="chroma_db/products"
+        logger.info(
+            f"Vector store synced: {len(current) - len(changed_keys)} documents unchanged, "
+            f"{len(changed_keys)} re-embedded ({len(new_chunks)} chunks), {len(stale_ids)} chunks removed"
         )
+        if new_chunks:
+            report = self.embeddings.throughput_report()
+            logger.info(
+                f"Embedding throughput: {report['docs_per_sec']:.1f} docs/sec "
+                f"(cache hit rate {report['cache_hit_rate']:.0%}, batch size {report['batch_size']}, workers {report['workers']})"
+            )
 
     def _format_specs(self, product: Dict[str, Any]) -> str:
         """格式化產品規格"""
-        specs = product['specs']
-        formatted_specs = []
-        
-        # 定義規格項目的中文名稱映射
-        spec_names = {
-            "processor": "處理器",
-            "ram": "記憶體",
-            "storage": "儲存空間",
-            "display": "顯示器",
-            "battery": "電池",
-            "ports": "連接埠",
-            "noise_cancellation": "降噪功能",
-            "battery_life": "電池續航",
-            "bluetooth": "藍牙版本",
-            "weight": "重量",
-            "features": "特色功能"
-        }
-        
-        for key, value in specs.items():
-            # 獲取中文名稱，如果沒有對應的中文名稱則使用原始key
-            display_name = spec_names.get(key, key)
-            
-            # 處理列表類型的值
-            if isinstance(value, list):
-                value = "、".join(value)
-            
-            formatted_specs.append(f"{display_name}: {value}")
-        
-        return "\n".join(formatted_specs)
-
-    def search_products(self, query: str, k: int = 3) -> List[Dict[str, Any]]:
-        """搜索產品"""
-        if not self.vector_store:
-            self._initialize_vector_store()
+        return format_specs(product)
+
+    def _shortcut_product(self, query: str, allowed: Optional[Set[str]]) -> Optional[Dict[str, Any]]:
+        """查詢中提到且符合篩選條件的第一個產品"""
+        for product in self.catalog.find_products_in_text(query):
+            if allowed is None or product["id"] in allowed:
+                return product
+        return None
+
+    def _answer_shortcut(self, query: str, allowed: Optional[Set[str]] = None) -> Optional[List[Dict[str, Any]]]:
+        """處理庫存與規格查詢，不屬於這兩類時返回 None
 
+        有篩選條件（allowed 不為 None）時只回答符合條件的產品；查詢提到的
+        產品都不符合時返回 None，改由帶篩選條件的檢索處理。
+        """
         # 檢查是否為庫存查詢
         if "庫存" in query or "剩下" in query or "還有" in query:
-            for product in self.products_data["products"]:
-                if product["name"] in query:
-                    return [{
-                        "content": f"{product['name']} 目前庫存還有 {product['stock']} 台",
-                        "metadata": {
-                            "id": product["id"],
-                            "name": product["name"],
-                            "stock": product["stock"]
-                        }
-                    }]
+            product = self._shortcut_product(query, allowed)
+            if product:
+                stock = self.inventory.stock(product["id"])
+                return [{
+                    "content": f"{product['name']} 目前庫存還有 {stock} 台",
+                    "metadata": {
+                        "id": product["id"],
+                        "name": product["name"],
+                        "stock": stock
+                    }
+                }]
+            if allowed is not None:
+                return None
             # 如果找不到產品，返回提示信息
             return [{
                 "content": "目前商店中沒有此商品",
@@ -152,20 +355,22 @@ class ProductService:
 
         # 檢查是否為規格查詢
         if "規格" in query:
-            for product in self.products_data["products"]:
-                if product["name"] in query:
-                    return [{
-                        "content": f"""
+            product = self._shortcut_product(query, allowed)
+            if product:
+                return [{
+                    "content": f"""
 {product['name']} 的規格如下：
 
 {self._format_specs(product)}
 """,
-                        "metadata": {
-                            "id": product["id"],
-                            "name": product["name"],
-                            "type": "specs"
-                        }
-                    }]
+                    "metadata": {
+                        "id": product["id"],
+                        "name": product["name"],
+                        "type": "specs"
+                    }
+                }]
+            if allowed is not None:
+                return None
             # 如果找不到產品，返回提示信息
             return [{
                 "content": "目前商店中沒有此商品",
@@ -174,54 +379,131 @@ class ProductService:
                 }
             }]
 
-        # 執行相似度搜索
-        docs = self.vector_store.similarity_search_with_score(query, k=k)
-        
-        # 如果沒有找到任何相關文檔，返回提示信息
-        if not docs:
-            return [{
-                "content": "目前商店中沒有此商品",
-                "metadata": {
-                    "type": "not_found"
-                }
-            }]
+        return None
+
+    def _vector_query(
+        self,
+        query_embeddings: np.ndarray,
+        n: int,
+        allowed: Optional[Set[str]] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """以單次批次最近鄰查詢取得每個查詢最近的 n 個文檔
+
+        allowed 限定產品範圍，直接下推到向量索引的查詢條件中。
+        """
+        with span("vector_query", backend=self.vector_backend.name):
+            return self.vector_backend.query(query_embeddings, n, allowed)
+
+    def _vector_count(self) -> int:
+        """向量索引中的文檔數"""
+        return self.vector_backend.count()
+
+    def _product_vectors(self) -> Tuple[List[str], np.ndarray]:
+        """每個產品的向量：該產品所有文檔向量的平均"""
+        chunks, vectors = self.vector_backend.export()
+        if not chunks:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        product_ids = sorted({chunk["metadata"].get("id", "") for chunk in chunks} - {""})
+        positions = {product_id: i for i, product_id in enumerate(product_ids)}
+        rows = np.array([positions.get(chunk["metadata"].get("id", ""), -1) for chunk in chunks])
+        valid = rows >= 0
+        sums = np.zeros((len(product_ids), vectors.shape[1]), dtype=np.float32)
+        np.add.at(sums, rows[valid], vectors[valid])
+        counts = np.bincount(rows[valid], minlength=len(product_ids)).astype(np.float32)
+        return product_ids, sums / np.maximum(counts, 1)[:, None]
+
+    def _product_search_batch(
+        self,
+        queries: List[str],
+        k: int,
+        allowed_list: Optional[List[Optional[Set[str]]]] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """產品層級的向量搜索：一次編碼所有查詢，超量擷取並依產品分組
 
-        # 設置相似度閾值（0.7 是一個較高的閾值，可以根據需要調整）
-        SIMILARITY_THRESHOLD = 0.7
-        
-        # 格式化結果並去重
-        seen_products = set()
+        每個產品有多個文檔，先擷取 k × (平均每產品文檔數) 個文檔；不同產品數
+        不足 k 且仍有未超過閾值的文檔時加倍擷取，直到 VECTOR_MAX_FETCH。
+        篩選條件相同的查詢合併成一次向量查詢。
+        """
+        allowed_list = allowed_list or [None] * len(queries)
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        total = self._vector_count()
+        if not queries or not total or k <= 0:
+            return results
+        query_embeddings = self.embeddings.embed_array(queries)
+        per_product = max(1, round(total / max(1, len(self.catalog))))
+        limit = min(total, max(k * per_product, VECTOR_MAX_FETCH))
+        n = min(k * per_product, limit)
+        pending = list(range(len(queries)))
+        while pending:
+            groups: Dict[Optional[frozenset], List[int]] = defaultdict(list)
+            for i in pending:
+                allowed = allowed_list[i]
+                groups[frozenset(allowed) if allowed is not None else None].append(i)
+            pending = []
+            for allowed, indices in groups.items():
+                if allowed is not None and not allowed:
+                    continue
+                for i, docs in zip(indices, self._vector_query(query_embeddings[indices], n, allowed)):
+                    results[i] = group_by_product(docs, SIMILARITY_THRESHOLD, RETRIEVAL_AGGREGATION)
+                    # 結果已全部取出，或最遠的文檔已超過閾值時，再擷取也不會有新產品
+                    exhausted = len(docs) < n or (docs and docs[-1][1] > SIMILARITY_THRESHOLD)
+                    if len(results[i]) < k and not exhausted and n < limit:
+                        pending.append(i)
+            n = min(n * 2, limit)
+        return [hits[:k] for hits in results]
+
+    def _format_hits(self, query: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """將混合檢索結果格式化
+
+        relevance_score 維持向量距離（越低越相關，只由詞彙索引命中時為 None），
+        fusion_score 為排序所用的融合分數（越高越相關）。
+        """
         results = []
-        
-        for doc, score in docs:
-            # 檢查相似度是否達到閾值
-            if score > SIMILARITY_THRESHOLD:
+        for hit in hits:
+            product = self.get_product_details(hit["product_id"])
+            doc = hit["document"]
+            if doc is not None:
+                metadata = doc.metadata
+            elif product is not None:
+                # 只由詞彙索引命中的產品沒有對應文檔，依查詢選擇輸出
+                metadata = {
+                    "id": product["id"],
+                    "name": product["name"],
+                    "type": "specs" if "規格" in query else "basic_info"
+                }
+            else:
                 continue
-                
-            product_id = doc.metadata["id"]
-            if product_id not in seen_products:
-                seen_products.add(product_id)
-                # 如果是規格相關的查詢，返回完整規格
-                if "規格" in query and doc.metadata["type"] == "specs":
-                    product = self.get_product_details(product_id)
-                    if product:
-                        results.append({
-                            "content": f"""
-{doc.metadata['name']} 的規格如下：
+
+            # 如果是規格相關的查詢，返回完整規格
+            if "規格" in query and metadata["type"] == "specs":
+                if product:
+                    results.append({
+                        "content": f"""
+{metadata['name']} 的規格如下：
 
 {self._format_specs(product)}
 """,
-                            "metadata": doc.metadata,
-                            "relevance_score": score
-                        })
-                else:
-                    results.append({
-                        "content": doc.page_content,
-                        "metadata": doc.metadata,
-                        "relevance_score": score
+                        "metadata": metadata,
+                        "relevance_score": hit["distance"],
+                        "fusion_score": hit["score"]
                     })
-        
-        # 如果沒有找到任何符合閾值的結果，返回提示信息
+            elif metadata["type"] == "basic_info" and product:
+                # 價格與庫存從即時庫存層讀取
+                results.append({
+                    "content": self._format_basic_info(product),
+                    "metadata": metadata,
+                    "relevance_score": hit["distance"],
+                    "fusion_score": hit["score"]
+                })
+            elif doc is not None:
+                results.append({
+                    "content": doc.page_content,
+                    "metadata": metadata,
+                    "relevance_score": hit["distance"],
+                    "fusion_score": hit["score"]
+                })
+
+        # 如果沒有找到任何相關結果，返回提示信息
         if not results:
             return [{
                 "content": "目前商店中沒有此商品",
@@ -229,12 +511,111 @@ class ProductService:
                     "type": "not_found"
                 }
             }]
-        
+
         return results
 
+    def _allowed_products(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        in_stock: bool = False
+    ) -> Optional[Set[str]]:
+        """將篩選條件轉為允許的產品ID集合，沒有篩選條件時返回 None"""
+        if category is None and min_price is None and max_price is None and not in_stock:
+            return None
+        catalog = self.catalog
+        if category is None:
+            allowed = set(catalog.by_id)
+        else:
+            allowed = {product["id"] for product in catalog.in_category(category)}
+        if min_price is not None or max_price is not None or in_stock:
+            # 價格與庫存以即時庫存層的陣列向量化篩選
+            allowed &= self.inventory.select(min_price, max_price, in_stock)
+        return allowed
+
+    @staticmethod
+    def _cache_namespace(
+        category: Optional[str],
+        min_price: Optional[int],
+        max_price: Optional[int],
+        in_stock: bool
+    ) -> str:
+        """快取命名空間包含篩選條件"""
+        if category is None and min_price is None and max_price is None and not in_stock:
+            return "search"
+        return f"search:{category}:{min_price}:{max_price}:{int(in_stock)}"
+
+    def search_products(
+        self,
+        query: str,
+        k: int = 3,
+        category: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        in_stock: bool = False
+    ) -> List[Dict[str, Any]]:
+        """搜索產品，返回最多 k 個不同的產品
+
+        category、價格區間與 in_stock 在向量查詢時下推為產品範圍條件。
+        """
+        if self.vector_backend is None:
+            self._initialize_vector_store()
+
+        cache_key = self.query_cache.make_key(self._cache_namespace(category, min_price, max_price, in_stock), query, k)
+        cached = self.query_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # 庫存與規格捷徑同樣受篩選條件限制，結果才能以篩選條件為命名空間快取
+        allowed = self._allowed_products(category, min_price, max_price, in_stock)
+        results = self._answer_shortcut(query, allowed)
+        if results is None:
+            # 混合檢索：名稱或型號精確命中時不需要編碼查詢
+            results = self._format_hits(query, self.retriever.search(query, k, allowed=allowed))
+        self.query_cache.set(cache_key, results)
+        return results
+
+    async def asearch_products(
+        self,
+        query: str,
+        k: int = 3,
+        category: Optional[str] = None,
+        min_price: Optional[int] = None,
+        max_price: Optional[int] = None,
+        in_stock: bool = False
+    ) -> List[Dict[str, Any]]:
+        """非同步搜索產品，超過佇列上限時拋出 ServiceOverloadedError
+
+        名稱或型號精確命中時只查詞彙索引；其餘查詢的向量搜索交給 QueryBatcher，
+        與同時到達的其他查詢合併成一次批次編碼，再與 BM25 排名融合。
+        """
+        with self._pending_lock:
+            if self._pending_searches >= self.max_queue_depth:
+                raise ServiceOverloadedError(
+                    f"Too many pending searches ({self._pending_searches}/{self.max_queue_depth})"
+                )
+            self._pending_searches += 1
+        try:
+            cache_key = self.query_cache.make_key(self._cache_namespace(category, min_price, max_price, in_stock), query, k)
+            cached = self.query_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            allowed = self._allowed_products(category, min_price, max_price, in_stock)
+            results = self._answer_shortcut(query, allowed)
+            if results is None:
+                catalog = self.catalog
+                hits = self.retriever.exact_hits(query, catalog, k, allowed)
+                if hits is None:
+                    vector_hits = await self.query_batcher.submit(query, k, allowed)
+                    hits = self.retriever.fuse(self.retriever.lexical_ranking(query, catalog, allowed), vector_hits, k)
+                results = self._format_hits(query, hits)
+            self.query_cache.set(cache_key, results)
+            return results
+        finally:
+            with self._pending_lock:
+                self._pending_searches -= 1
+
     def get_product_details(self, product_id: str) -> Dict[str, Any]:
         """獲取產品詳細信息"""
-        for product in self.products_data["products"]:
-            if product["id"] == product_id:
-                return product
-        return None 
\ No newline at end of file
+        return self.catalog.get(product_id) 
\ No newline at end of file
@@ -0,0 +1,103 @@
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from concurrent.futures import Executor
+import asyncio
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+
+# batch_fn(queries, k, options) -> 每個查詢各自的結果列表；options 為各查詢的附加參數（例如篩選條件）
+BatchFunction = Callable[[List[str], int, List[Any]], List[List[Any]]]
+
+
+class QueryBatcher:
+    """將短時間內到達的查詢合併為一次批次編碼與最近鄰查詢
+
+    第一個查詢到達時開始計時，時間窗（window_ms）結束或累積到 max_batch_size
+    時送出整批，再把結果分發給各自的呼叫者。
+    """
+
+    def __init__(
+        self,
+        batch_fn: BatchFunction,
+        executor: Optional[Executor] = None,
+        window_ms: float = QUERY_BATCH_WINDOW_MS,
+        max_batch_size: int = QUERY_BATCH_MAX_SIZE
+    ):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.window = max(0.0, window_ms) / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: List[Tuple[str, int, Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self._stats_lock = threading.Lock()
+        self._stats = {"batches": 0, "queries": 0, "full_batches": 0, "timer_flushes": 0, "max_batch": 0}
+
+    async def submit(self, query: str, k: int, options: Any = None) -> List[Any]:
+        """加入一個查詢並等待其結果"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, k, options, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush, True)
+        return await future
+
+    def _flush(self, by_timer: bool = False):
+        """送出目前累積的查詢"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        # 呼叫者已取消的查詢不必再計算
+        batch = [item for item in batch if not item[3].cancelled()]
+        if not batch:
+            return
+
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["queries"] += len(batch)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+            if len(batch) >= self.max_batch_size:
+                self._stats["full_batches"] += 1
+            if by_timer:
+                self._stats["timer_flushes"] += 1
+
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, int, Any, asyncio.Future]]):
+        """在執行緒池中執行批次查詢並分發結果"""
+        loop = asyncio.get_running_loop()
+        queries = [query for query, _, _, _ in batch]
+        options = [option for _, _, option, _ in batch]
+        max_k = max(k for _, k, _, _ in batch)
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, queries, max_k, options)
+        except Exception as e:
+            logger.error(f"Batched query failed: {e}")
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, k, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result[:k])
+
+    def stats(self) -> Dict[str, Any]:
+        """批次統計，fill_rate 為平均批次大小相對於 max_batch_size 的比例"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        batches = stats["batches"]
+        stats["avg_batch_size"] = stats["queries"] / batches if batches else 0.0
+        stats["fill_rate"] = stats["avg_batch_size"] / self.max_batch_size if batches else 0.0
+        stats["window_ms"] = self.window * 1000
+        stats["max_batch_size"] = self.max_batch_size
+        return stats
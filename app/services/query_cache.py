@@ -0,0 +1,166 @@
+from typing import Dict, Any, Optional, Callable, Tuple
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import threading
+import time
+from .catalog import get_catalog_store
+from .embedding_service import normalize_text
+from .inventory import get_inventory_store
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))
+# 第二層共享快取："local" 使用程序內替身，"none" 停用
+QUERY_CACHE_BACKEND = os.getenv("QUERY_CACHE_BACKEND", "none")
+
+
+class CacheBackend(ABC):
+    """第二層共享快取介面（例如跨程序的 Redis），值需可序列化"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """讀取快取，不存在或已過期時返回 None"""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float):
+        """寫入快取，ttl 秒後過期"""
+
+
+class LocalCacheBackend(CacheBackend):
+    """程序內的共享快取替身，用於開發與測試"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+
+
+class QueryCache:
+    """兩層查詢結果快取
+
+    第一層為程序內 LRU/TTL，第二層為可選的共享後端。快取鍵包含目錄版本，
+    產品或庫存更新後舊的結果不會再被命中；版本變動時同時清空第一層。
+    """
+
+    def __init__(
+        self,
+        version_fn: Callable[[], str],
+        max_entries: int = QUERY_CACHE_SIZE,
+        ttl: float = QUERY_CACHE_TTL,
+        backend: Optional[CacheBackend] = None
+    ):
+        self.version_fn = version_fn
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.backend = backend
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "backend_hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def make_key(self, namespace: str, query: str, k: int = 0) -> str:
+        """以正規化查詢、k 與目錄版本組成快取鍵"""
+        digest = hashlib.sha1(normalize_text(query).lower().encode("utf-8")).hexdigest()
+        return f"{namespace}:{self.version_fn()}:{k}:{digest}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """讀取快取，第一層未命中時查詢共享後端"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._stats["expirations"] += 1
+
+        value = self.backend.get(key) if self.backend is not None else None
+        with self._lock:
+            if value is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["backend_hits"] += 1
+        self._store_local(key, value)
+        return value
+
+    def set(self, key: str, value: Any):
+        """寫入兩層快取"""
+        self._store_local(key, value)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value, self.ttl)
+            except Exception as e:
+                logger.warning(f"Shared query cache write failed: {e}")
+
+    def _store_local(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_compute(self, namespace: str, query: str, k: int, compute: Callable[[], Any]) -> Any:
+        """命中時返回快取結果，否則計算後寫入"""
+        key = self.make_key(namespace, query, k)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, *_):
+        """清空第一層（共享後端依靠鍵中的版本失效）"""
+        with self._lock:
+            self._entries.clear()
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """命中、未命中與淘汰計數"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["backend_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["backend_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+_query_cache: Optional[QueryCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryCache:
+    """取得全域共用的 QueryCache，版本由目錄與庫存版本組成"""
+    global _query_cache
+    with _query_cache_lock:
+        if _query_cache is None:
+            catalog_store = get_catalog_store()
+            inventory = get_inventory_store()
+            backend = LocalCacheBackend() if QUERY_CACHE_BACKEND == "local" else None
+            _query_cache = QueryCache(
+                lambda: f"{catalog_store.catalog.version}.{inventory.version}",
+                backend=backend
+            )
+            catalog_store.subscribe(_query_cache.invalidate)
+            inventory.subscribe(_query_cache.invalidate)
+        return _query_cache
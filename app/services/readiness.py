@@ -0,0 +1,109 @@
+from typing import Dict, Any, Optional, Callable, Generic, TypeVar
+import asyncio
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 啟動時是否先執行一次編碼，讓第一個查詢不必等待模型載入
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+# WebSocket 請求等待元件就緒的最長時間（秒）
+READINESS_WAIT_TIMEOUT = float(os.getenv("READINESS_WAIT_TIMEOUT", "30"))
+
+T = TypeVar("T")
+
+
+class ServiceNotReadyError(Exception):
+    """元件尚未初始化完成"""
+
+
+class LazyComponent(Generic[T]):
+    """在背景執行緒建立的元件
+
+    API 程序啟動時只登記元件，不在匯入階段載入模型或向量索引；
+    start() 之後由背景執行緒呼叫 factory，完成前 get() 拋出 ServiceNotReadyError。
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self.factory = factory
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._instance: Optional[T] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        _components[name] = self
+
+    def start(self):
+        """在背景執行緒開始建立（重複呼叫無作用）"""
+        with self._lock:
+            if self.state != "pending":
+                return
+            self.state = "loading"
+            self.started_at = time.monotonic()
+        threading.Thread(target=self._build, name=f"init-{self.name}", daemon=True).start()
+
+    def _build(self):
+        try:
+            instance = self.factory()
+        except Exception as e:
+            logger.error(f"Failed to initialize {self.name}: {e}")
+            with self._lock:
+                self.state = "failed"
+                self.error = str(e)
+                self.finished_at = time.monotonic()
+            self._ready.set()
+            return
+        with self._lock:
+            self._instance = instance
+            self.state = "ready"
+            self.finished_at = time.monotonic()
+        logger.info(f"{self.name} ready in {self.finished_at - self.started_at:.2f}s")
+        self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def get(self) -> T:
+        """返回已建立的元件，尚未就緒時拋出 ServiceNotReadyError"""
+        if self.state != "ready":
+            raise ServiceNotReadyError(f"{self.name} is {self.state}")
+        return self._instance
+
+    async def wait(self, timeout: float = READINESS_WAIT_TIMEOUT) -> T:
+        """等待元件就緒（不阻塞事件迴圈）"""
+        self.start()
+        if not self._ready.is_set():
+            await asyncio.get_running_loop().run_in_executor(None, self._ready.wait, timeout)
+        return self.get()
+
+    def status(self) -> Dict[str, Any]:
+        status: Dict[str, Any] = {"state": self.state}
+        if self.started_at is not None:
+            status["seconds"] = round((self.finished_at or time.monotonic()) - self.started_at, 3)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+_components: Dict[str, LazyComponent] = {}
+
+
+def start_all():
+    """開始建立所有已登記的元件"""
+    for component in list(_components.values()):
+        component.start()
+
+
+def readiness_report() -> Dict[str, Any]:
+    """各元件的初始化進度"""
+    components = {name: component.status() for name, component in _components.items()}
+    return {
+        "ready": all(status["state"] == "ready" for status in components.values()),
+        "components": components
+    }
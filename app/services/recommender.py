@@ -0,0 +1,313 @@
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from collections import Counter
+import logging
+import os
+import re
+import threading
+import numpy as np
+from scipy import sparse
+from .catalog import CatalogStore, ProductCatalog, find_category, get_catalog_store
+from .inventory import InventoryStore, get_inventory_store
+from .lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# 語意相似度在推薦分數中的權重（其餘為關鍵詞 TF-IDF 餘弦相似度）
+RECOMMEND_SEMANTIC_WEIGHT = float(os.getenv("RECOMMEND_SEMANTIC_WEIGHT", "0.5"))
+
+# encoder(文字列表) -> 向量矩陣
+Encoder = Callable[[List[str]], np.ndarray]
+# product_vectors() -> (產品ID列表, 產品向量矩陣)
+ProductVectors = Callable[[], Tuple[List[str], np.ndarray]]
+
+CHINESE_DIGITS = {"一": 1, "二": 2, "兩": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+UNIT_MULTIPLIERS = {"萬": 10000, "千": 1000, "k": 1000}
+# 數字、單位與單位後的尾數（「兩萬五」為 25000、「3千5」為 3500）
+NUMBER = r"(\d+(?:\.\d+)?|[一二兩三四五六七八九十]+)\s*(?:(萬|千)([一二兩三四五六七八九]|\d(?![\d.]))?|(k))?"
+MAX_PRICE_PATTERNS = [
+    re.compile(r"(?:預算|不超過|低於|少於|under|below|budget)\s*(?:在|是|為|約|大約)?\s*(?:nt\$|\$)?\s*" + NUMBER),
+    re.compile(NUMBER + r"\s*(?:元|塊)?\s*(?:以內|以下|之內)")
+]
+MIN_PRICE_PATTERN = re.compile(NUMBER + r"\s*(?:元|塊)\s*以上")
+# 千分位逗號（30,000）
+THOUSANDS_SEPARATOR_PATTERN = re.compile(r"(?<=\d)[,，](?=\d{3}(?!\d))")
+CAPACITY_KEYWORDS = {
+    "min_ram_gb": ["記憶體", "內存", "ram"],
+    "min_storage_gb": ["儲存空間", "容量", "硬碟", "storage", "ssd"]
+}
+CAPACITY_KEYWORD = "|".join(keyword for keywords in CAPACITY_KEYWORDS.values() for keyword in keywords)
+# 每個容量只綁定緊鄰的關鍵詞：「記憶體 16GB」或「16GB 記憶體」，
+# 「16GB 記憶體 512GB 容量」的 512GB 屬於容量而不是記憶體
+CAPACITY_PATTERN = re.compile(
+    rf"(?P<before>{CAPACITY_KEYWORD})\s*(?:至少|要|需要|大於|超過)?\s*(?P<value_after>\d+(?:\.\d+)?)\s*(?P<unit_after>tb|t|gb|g)(?![a-z])"
+    rf"|(?P<value_before>\d+(?:\.\d+)?)\s*(?P<unit_before>tb|t|gb|g)\s*(?:以上)?\s*(?:的)?\s*(?P<after>{CAPACITY_KEYWORD})"
+)
+IN_STOCK_PATTERN = re.compile(r"有貨|現貨|有庫存")
+SPEC_CAPACITY_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(TB|GB)", re.IGNORECASE)
+
+
+def _chinese_number(digits: str) -> float:
+    if digits[0].isdigit():
+        return float(digits)
+    if digits.startswith("十"):
+        return 10 + CHINESE_DIGITS.get(digits[1:2], 0)
+    if "十" in digits:
+        return CHINESE_DIGITS.get(digits[0], 1) * 10 + CHINESE_DIGITS.get(digits[2:3], 0)
+    return CHINESE_DIGITS.get(digits[0], 0)
+
+
+def _parse_number(match: re.Match) -> float:
+    """NUMBER 的比對結果轉為數值"""
+    digits, unit, remainder, k = match.group(1, 2, 3, 4)
+    multiplier = UNIT_MULTIPLIERS.get(unit or k or "", 1)
+    value = _chinese_number(digits) * multiplier
+    if remainder:
+        # 尾數是下一位：萬 -> 千、千 -> 百
+        value += _chinese_number(remainder) * multiplier / 10
+    return value
+
+
+def _parse_capacity(value: str, unit: str) -> float:
+    """容量轉為 GB"""
+    return float(value) * (1024 if unit.startswith("t") else 1)
+
+
+def parse_constraints(requirements: str) -> Dict[str, Any]:
+    """從需求中解析預算、記憶體、儲存空間、類別與是否需要現貨"""
+    text = THOUSANDS_SEPARATOR_PATTERN.sub("", requirements.lower())
+    constraints: Dict[str, Any] = {}
+    for pattern in MAX_PRICE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            constraints["max_price"] = _parse_number(match)
+            break
+    match = MIN_PRICE_PATTERN.search(text)
+    if match:
+        constraints["min_price"] = _parse_number(match)
+    for match in CAPACITY_PATTERN.finditer(text):
+        keyword = match.group("before") or match.group("after")
+        key = next(key for key, keywords in CAPACITY_KEYWORDS.items() if keyword in keywords)
+        if key in constraints:
+            continue
+        if match.group("before"):
+            constraints[key] = _parse_capacity(match.group("value_after"), match.group("unit_after"))
+        else:
+            constraints[key] = _parse_capacity(match.group("value_before"), match.group("unit_before"))
+    category = find_category(requirements)
+    if category:
+        constraints["category"] = category
+    if IN_STOCK_PATTERN.search(text):
+        constraints["in_stock"] = True
+    return constraints
+
+
+def spec_capacity_gb(product: Dict[str, Any], key: str) -> float:
+    """規格中的容量（GB），沒有此規格時為 NaN"""
+    match = SPEC_CAPACITY_PATTERN.search(str(product.get("specs", {}).get(key, "")))
+    if match is None:
+        return np.nan
+    return _parse_capacity(match.group(1), match.group(2).lower())
+
+
+class RecommendationEngine:
+    """向量化的推薦評分
+
+    每個目錄快照建立一次：
+    - 產品 × 詞彙的 TF-IDF 稀疏矩陣（與 BM25 索引相同的 CJK bigram 分詞）
+    - 產品向量矩陣（由持有向量索引的服務提供，每個產品文檔向量的平均）
+    - 類別代碼、記憶體與儲存空間等數值欄位陣列
+
+    推薦時關鍵詞與語意相似度各為一次矩陣向量乘法，預算等條件以遮罩套用，
+    再以 argpartition 取前 k 個。
+    """
+
+    def __init__(
+        self,
+        catalog_store: Optional[CatalogStore] = None,
+        inventory: Optional[InventoryStore] = None,
+        semantic_weight: float = RECOMMEND_SEMANTIC_WEIGHT
+    ):
+        self.catalog_store = catalog_store or get_catalog_store()
+        self.inventory = inventory or get_inventory_store()
+        self.semantic_weight = semantic_weight
+        self.encoder: Optional[Encoder] = None
+        self.product_vectors: Optional[ProductVectors] = None
+        self._index: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def set_encoder(self, encoder: Optional[Encoder]):
+        """註冊查詢編碼器"""
+        self.encoder = encoder
+
+    def set_product_vectors(self, product_vectors: Optional[ProductVectors]):
+        """註冊產品向量來源，並在下次推薦時重建索引"""
+        self.product_vectors = product_vectors
+        self.invalidate()
+
+    def invalidate(self):
+        """向量索引更新後丟棄目前的推薦索引"""
+        self._index = None
+
+    def _build(self, catalog: ProductCatalog) -> Dict[str, Any]:
+        products = catalog.products
+        ids = [product["id"] for product in products]
+        vocabulary: Dict[str, int] = {}
+        rows, cols, values = [], [], []
+        for row, product in enumerate(products):
+            for term, frequency in Counter(catalog.lexical_tokens(product)).items():
+                col = vocabulary.setdefault(term, len(vocabulary))
+                rows.append(row)
+                cols.append(col)
+                values.append(1.0 + np.log(frequency))
+        terms = sparse.csr_matrix(
+            (np.asarray(values, dtype=np.float32), (rows, cols)),
+            shape=(len(products), len(vocabulary))
+        )
+        document_frequency = np.bincount(cols, minlength=len(vocabulary)) if cols else np.zeros(0)
+        idf = (np.log((1 + len(products)) / (1 + document_frequency)) + 1).astype(np.float32)
+        terms = terms.multiply(idf).tocsr()
+        norms = np.sqrt(np.asarray(terms.multiply(terms).sum(axis=1)).ravel())
+        terms = sparse.diags(1 / np.maximum(norms, 1e-12)).dot(terms).tocsc()
+
+        categories = sorted({product["category"] for product in products})
+        category_codes = {category: code for code, category in enumerate(categories)}
+        index = {
+            "catalog": catalog,
+            "ids": ids,
+            "vocabulary": vocabulary,
+            "idf": idf,
+            "terms": terms,
+            "category_codes": category_codes,
+            "categories": np.array([category_codes[product["category"]] for product in products], dtype=np.int32),
+            "ram_gb": np.array([spec_capacity_gb(product, "ram") for product in products], dtype=np.float32),
+            "storage_gb": np.array([spec_capacity_gb(product, "storage") for product in products], dtype=np.float32),
+            "inventory_rows": self.inventory.rows(ids),
+            "vectors": None
+        }
+        if self.product_vectors is not None:
+            try:
+                vector_ids, vectors = self.product_vectors()
+                if len(vector_ids):
+                    positions = {product_id: i for i, product_id in enumerate(vector_ids)}
+                    matrix = np.zeros((len(ids), vectors.shape[1]), dtype=np.float32)
+                    for row, product_id in enumerate(ids):
+                        if product_id in positions:
+                            matrix[row] = vectors[positions[product_id]]
+                    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                    index["vectors"] = matrix / np.maximum(norms, 1e-12)
+            except Exception as e:
+                logger.warning(f"Recommendation engine falling back to keyword scoring: {e}")
+        logger.info(
+            f"Built recommendation index: {len(ids)} products, {len(vocabulary)} terms, "
+            f"semantic={'yes' if index['vectors'] is not None else 'no'}"
+        )
+        return index
+
+    def _current_index(self, catalog: ProductCatalog) -> Dict[str, Any]:
+        index = self._index
+        if index is not None and index["catalog"] is catalog:
+            return index
+        with self._lock:
+            index = self._index
+            if index is None or index["catalog"] is not catalog:
+                index = self._build(catalog)
+                self._index = index
+        return index
+
+    def _keyword_scores(self, index: Dict[str, Any], requirements: str) -> np.ndarray:
+        """需求與每個產品的 TF-IDF 餘弦相似度（一次稀疏矩陣向量乘法）"""
+        counts = Counter(term for term in tokenize(requirements) if term in index["vocabulary"])
+        if not counts:
+            return np.zeros(len(index["ids"]), dtype=np.float32)
+        cols = np.array([index["vocabulary"][term] for term in counts], dtype=np.int64)
+        weights = (1.0 + np.log(np.array(list(counts.values()), dtype=np.float32))) * index["idf"][cols]
+        weights /= max(float(np.linalg.norm(weights)), 1e-12)
+        return np.asarray(index["terms"][:, cols] @ weights).ravel()
+
+    def _semantic_scores(self, index: Dict[str, Any], requirements: str) -> Optional[np.ndarray]:
+        """需求與每個產品向量的餘弦相似度"""
+        if index["vectors"] is None or self.encoder is None:
+            return None
+        query = np.asarray(self.encoder([requirements]), dtype=np.float32)[0]
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        return index["vectors"] @ query
+
+    def _mask(self, index: Dict[str, Any], constraints: Dict[str, Any]) -> np.ndarray:
+        """數值與類別條件的向量化遮罩"""
+        mask = np.ones(len(index["ids"]), dtype=bool)
+        if "category" in constraints:
+            code = index["category_codes"].get(constraints["category"], -1)
+            mask &= index["categories"] == code
+        if "min_ram_gb" in constraints:
+            mask &= index["ram_gb"] >= constraints["min_ram_gb"]
+        if "min_storage_gb" in constraints:
+            mask &= index["storage_gb"] >= constraints["min_storage_gb"]
+        if {"max_price", "min_price", "in_stock"} & constraints.keys():
+            prices, stock = self.inventory.arrays(index["inventory_rows"])
+            if "max_price" in constraints:
+                mask &= prices <= constraints["max_price"]
+            if "min_price" in constraints:
+                mask &= prices >= constraints["min_price"]
+            if constraints.get("in_stock"):
+                mask &= stock > 0
+        return mask
+
+    def recommend(
+        self,
+        requirements: str,
+        k: int = 3,
+        catalog: Optional[ProductCatalog] = None
+    ) -> List[Dict[str, Any]]:
+        """返回前 k 個推薦 {"product_id", "score", "keyword", "semantic", "relaxed"}，分數由高到低
+
+        relaxed 為 True 表示沒有產品符合解析出的條件，結果是不加篩選的排名。
+        """
+        catalog = catalog or self.catalog_store.catalog
+        index = self._current_index(catalog)
+        if not index["ids"] or k <= 0:
+            return []
+        constraints = parse_constraints(requirements)
+        keyword = self._keyword_scores(index, requirements)
+        semantic = self._semantic_scores(index, requirements)
+        if semantic is None:
+            scores = keyword
+            candidates = keyword > 0
+        else:
+            scores = (1 - self.semantic_weight) * keyword + self.semantic_weight * semantic
+            candidates = np.ones(len(scores), dtype=bool)
+
+        rows = np.flatnonzero(candidates & self._mask(index, constraints))
+        # 條件篩掉所有候選時（條件太嚴或解析有誤）改為不加篩選的排名，由呼叫端註明
+        relaxed = not len(rows) and bool(constraints)
+        if relaxed:
+            logger.info(f"No product satisfies {constraints}; ranking without constraints")
+            rows = np.flatnonzero(candidates)
+        if not len(rows):
+            return []
+        k = min(k, len(rows))
+        candidate_scores = scores[rows]
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = top[np.argsort(-candidate_scores[top])]
+        return [
+            {
+                "product_id": index["ids"][row],
+                "score": float(scores[row]),
+                "keyword": float(keyword[row]),
+                "semantic": None if semantic is None else float(semantic[row]),
+                "relaxed": relaxed
+            }
+            for row in rows[top]
+        ]
+
+
+_recommender: Optional[RecommendationEngine] = None
+_recommender_lock = threading.Lock()
+
+
+def get_recommender() -> RecommendationEngine:
+    """取得全域共用的 RecommendationEngine"""
+    global _recommender
+    with _recommender_lock:
+        if _recommender is None:
+            _recommender = RecommendationEngine()
+        return _recommender
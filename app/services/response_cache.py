@@ -0,0 +1,198 @@
+from typing import List, Dict, Any, Optional, Callable, Set
+from collections import OrderedDict
+import logging
+import os
+import re
+import threading
+import time
+import numpy as np
+from .catalog import CatalogStore, ProductCatalog, get_catalog_store
+from .inventory import InventoryStore, get_inventory_store
+
+logger = logging.getLogger(__name__)
+
+# 是否在 Agent 之前使用語意回應快取
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+# 命中所需的最低餘弦相似度
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "4096"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# 指涉前文的訊息答案取決於對話歷史，不查詢也不寫入快取
+CONTEXT_DEPENDENT_PATTERN = re.compile(r"它|這個|那個|這款|那款|上面|剛才|前面|剛剛|\b(?:it|this|that)\b", re.IGNORECASE)
+
+# encoder(文字列表) -> 向量矩陣
+Encoder = Callable[[List[str]], np.ndarray]
+
+
+class SemanticResponseCache:
+    """Agent 回答的語意快取
+
+    訊息編碼後與已快取的訊息比較餘弦相似度，超過閾值且提到的產品相同時
+    直接返回先前的回答。向量存放在預先配置的 float32 矩陣中，查詢為一次
+    矩陣向量乘法（快取容量內的精確最近鄰）；超過容量時依 LRU 淘汰並重用列。
+
+    每個回答以訊息與回答中提到的產品ID標記，這些產品的價格、庫存或目錄
+    內容變動時立即失效；目錄新增產品時，問題未指名產品的回答（列表、
+    推薦等）也一併失效，因為它們可能應該包含新產品。
+    """
+
+    def __init__(
+        self,
+        catalog_store: Optional[CatalogStore] = None,
+        inventory: Optional[InventoryStore] = None,
+        threshold: float = RESPONSE_CACHE_THRESHOLD,
+        max_entries: int = RESPONSE_CACHE_SIZE,
+        ttl: float = RESPONSE_CACHE_TTL
+    ):
+        self.catalog_store = catalog_store or get_catalog_store()
+        self.inventory = inventory or get_inventory_store()
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.encoder: Optional[Encoder] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._active = np.zeros(self.max_entries, dtype=bool)
+        # 列號 -> 快取項目，依最近使用排序
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._by_product: Dict[str, Set[int]] = {}
+        self._free: List[int] = list(range(self.max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._stats = {
+            "lookups": 0, "hits": 0, "misses": 0, "bypassed": 0,
+            "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0
+        }
+        self.inventory.subscribe(self.invalidate_products)
+        self.catalog_store.subscribe(self._on_catalog_change)
+
+    def set_encoder(self, encoder: Optional[Encoder]):
+        """註冊訊息編碼器（與檢索共用同一個嵌入模型）"""
+        self.encoder = encoder
+
+    def _mentioned_products(self, text: str, catalog: Optional[ProductCatalog] = None) -> Set[str]:
+        catalog = catalog or self.catalog_store.catalog
+        return {product["id"] for product in catalog.find_products_in_text(text)}
+
+    def cacheable(self, message: str) -> bool:
+        """已註冊編碼器且訊息不指涉前文"""
+        return self.encoder is not None and not CONTEXT_DEPENDENT_PATTERN.search(message)
+
+    def encode(self, message: str) -> np.ndarray:
+        """編碼並正規化訊息"""
+        vector = np.asarray(self.encoder([message]), dtype=np.float32)[0]
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, message: str, vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        """返回相似度最高且超過閾值、提到相同產品的快取回答 {"response", "similarity", "message"}"""
+        products = self._mentioned_products(message)
+        now = time.monotonic()
+        with self._lock:
+            self._stats["lookups"] += 1
+            if self._matrix is None or not self._entries:
+                self._stats["misses"] += 1
+                return None
+            similarities = self._matrix @ vector
+            similarities[~self._active] = -np.inf
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            for row in candidates[np.argsort(-similarities[candidates])]:
+                entry = self._entries[int(row)]
+                if entry["expires_at"] < now:
+                    self._remove(int(row))
+                    self._stats["expirations"] += 1
+                    continue
+                # 語意相近但問的是不同產品（例如只有型號不同）時不命中
+                if entry["query_products"] != products:
+                    continue
+                self._entries.move_to_end(int(row))
+                self._stats["hits"] += 1
+                return {"response": entry["response"], "similarity": float(similarities[row]), "message": entry["message"]}
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, message: str, vector: np.ndarray, response: str):
+        """寫入回答，以訊息與回答中提到的產品標記"""
+        catalog = self.catalog_store.catalog
+        query_products = self._mentioned_products(message, catalog)
+        products = query_products | self._mentioned_products(response, catalog)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            if not self._free:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+            row = self._free.pop()
+            self._matrix[row] = vector
+            self._active[row] = True
+            self._entries[row] = {
+                "message": message,
+                "response": response,
+                "query_products": query_products,
+                "products": products,
+                "expires_at": time.monotonic() + self.ttl
+            }
+            for product_id in products:
+                self._by_product.setdefault(product_id, set()).add(row)
+            self._stats["stores"] += 1
+
+    def _remove(self, row: int):
+        """移除快取項目並釋放其列（呼叫時需持有鎖）"""
+        entry = self._entries.pop(row)
+        self._active[row] = False
+        for product_id in entry["products"]:
+            rows = self._by_product.get(product_id)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self._by_product[product_id]
+        self._free.append(row)
+
+    def invalidate_products(self, product_ids: Set[str]):
+        """價格或庫存變動時，移除提到這些產品的回答"""
+        with self._lock:
+            rows = set()
+            for product_id in product_ids:
+                rows |= self._by_product.get(product_id, set())
+            for row in rows:
+                self._remove(row)
+            self._stats["invalidations"] += len(rows)
+
+    def invalidate_listings(self):
+        """移除問題未指名產品的回答（答案可能因目錄新增產品而不完整）"""
+        with self._lock:
+            rows = [row for row, entry in self._entries.items() if not entry["query_products"]]
+            for row in rows:
+                self._remove(row)
+            self._stats["invalidations"] += len(rows)
+
+    def _on_catalog_change(self, old: ProductCatalog, new: ProductCatalog, changed: Set[str]):
+        self.invalidate_products(changed)
+        # 新產品不會出現在任何既有回答的標記中
+        if any(old.get(product_id) is None for product_id in changed):
+            self.invalidate_listings()
+
+    def record_bypass(self):
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率與快取大小"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["threshold"] = self.threshold
+        stats["max_entries"] = self.max_entries
+        return stats
+
+
+_response_cache: Optional[SemanticResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> SemanticResponseCache:
+    """取得全域共用的 SemanticResponseCache"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = SemanticResponseCache()
+        return _response_cache
@@ -0,0 +1,207 @@
+from typing import List, Dict, Any, Optional, Callable, Set, Tuple
+import os
+import re
+import threading
+from langchain.schema import Document
+from .catalog import CatalogStore, ProductCatalog, get_catalog_store, normalize_name
+
+# RRF 常數：排名 r 的得分為 1 / (RRF_K + r)
+RRF_K = int(os.getenv("RRF_K", "60"))
+# 每個查詢從 BM25 索引取出的候選產品數
+LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", "20"))
+# 同一產品多個文檔命中時的分數聚合方式："max"（最相似的文檔）或 "sum"（相似度加總）
+RETRIEVAL_AGGREGATION = os.getenv("RETRIEVAL_AGGREGATION", "max")
+# 查詢中的英數詞（例如 "m3"、"wh-1000xm5"、"256gb"），不跨越空白
+MODEL_TOKEN_PATTERN = re.compile(r"[a-z0-9](?:[a-z0-9\-.]*[a-z0-9])?")
+# 以空白相連的英數詞最多組成幾個詞的型號（例如 "m3 pro"）
+MODEL_MAX_TOKENS = int(os.getenv("MODEL_MAX_TOKENS", "3"))
+
+# vector_search(查詢列表, k, 各查詢允許的產品ID) -> 每個查詢的產品層級結果（見 group_by_product）
+VectorSearch = Callable[[List[str], int, List[Optional[Set[str]]]], List[List[Dict[str, Any]]]]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """以倒數排名融合多個排名列表，返回 (ID, 分數) 由高到低"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def group_by_product(
+    docs: List[Tuple[Document, float]],
+    max_distance: Optional[float] = None,
+    aggregation: str = RETRIEVAL_AGGREGATION
+) -> List[Dict[str, Any]]:
+    """將文檔層級的向量結果依產品分組，依聚合分數由高到低排列
+
+    每個結果為 {"product_id", "score", "document", "distance"}，document 為距離
+    最近的文檔；分數以相似度 1 - 距離/2 計算（正規化向量的平方 L2 距離）。
+    超過 max_distance 的文檔不計入。
+    """
+    groups: Dict[str, Dict[str, Any]] = {}
+    for doc, distance in docs:
+        if max_distance is not None and distance > max_distance:
+            continue
+        product_id = doc.metadata.get("id")
+        if product_id is None:
+            continue
+        similarity = 1.0 - distance / 2
+        group = groups.get(product_id)
+        if group is None:
+            groups[product_id] = {"product_id": product_id, "score": similarity, "document": doc, "distance": distance}
+            continue
+        group["score"] = group["score"] + similarity if aggregation == "sum" else max(group["score"], similarity)
+        if distance < group["distance"]:
+            group["document"], group["distance"] = doc, distance
+    return sorted(groups.values(), key=lambda group: group["score"], reverse=True)
+
+
+class HybridRetriever:
+    """混合檢索引擎：BM25 詞彙索引 + 向量索引，以 RRF 融合
+
+    查詢中出現完整產品名稱或型號時直接由詞彙索引回答，不需要編碼查詢；
+    其餘查詢同時取 BM25 與向量最近鄰的產品排名再融合。向量搜索由
+    ProductService 註冊，未註冊時只使用詞彙索引。
+    """
+
+    def __init__(
+        self,
+        catalog_store: Optional[CatalogStore] = None,
+        vector_search: Optional[VectorSearch] = None,
+        rrf_k: int = RRF_K
+    ):
+        self.catalog_store = catalog_store or get_catalog_store()
+        self.vector_search = vector_search
+        self.rrf_k = rrf_k
+
+    def set_vector_search(self, vector_search: Optional[VectorSearch]):
+        """註冊產品層級的向量搜索（由持有向量索引的服務呼叫）"""
+        self.vector_search = vector_search
+
+    @property
+    def vector_ready(self) -> bool:
+        """是否已註冊向量搜索；未註冊時結果只來自詞彙索引"""
+        return self.vector_search is not None
+
+    @staticmethod
+    def exact_product_ids(query: str, catalog: ProductCatalog) -> List[str]:
+        """查詢中完整出現的產品名稱或型號所對應的產品
+
+        型號以英數詞的 n-gram 比對：每個起點先試以空白相連的最長詞組，
+        沒有命中再逐步縮短，因此 "m3 pro laptop" 會以 "m3 pro" 命中。
+        只有同時含英文字母與數字的詞組視為型號。
+        """
+        product_ids = catalog.name_matcher.product_ids(normalize_name(query))
+        if product_ids:
+            return product_ids
+        text = query.lower()
+        tokens = list(MODEL_TOKEN_PATTERN.finditer(text))
+        i = 0
+        while i < len(tokens):
+            end = i + 1
+            while (
+                end < len(tokens) and end - i < MODEL_MAX_TOKENS
+                and not text[tokens[end - 1].end():tokens[end].start()].strip()
+            ):
+                end += 1
+            for j in range(end, i, -1):
+                span = " ".join(token.group() for token in tokens[i:j])
+                if not (re.search(r"[a-z]", span) and re.search(r"[0-9]", span)):
+                    continue
+                matches = catalog.find_field_matches(span)
+                if matches:
+                    for product_id, _ in sorted(matches):
+                        if product_id not in product_ids:
+                            product_ids.append(product_id)
+                    i = j
+                    break
+            else:
+                i += 1
+        return product_ids
+
+    def lexical_ranking(
+        self,
+        query: str,
+        catalog: ProductCatalog,
+        allowed: Optional[Set[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """BM25 候選產品排名，只保留 allowed 中的產品"""
+        if allowed is None:
+            return catalog.lexical_search(query, LEXICAL_TOP_K)
+        ranking = catalog.lexical_search(query, len(catalog))
+        return [(product_id, score) for product_id, score in ranking if product_id in allowed][:LEXICAL_TOP_K]
+
+    def fuse(
+        self,
+        lexical: List[Tuple[str, float]],
+        vector_hits: List[Dict[str, Any]],
+        k: int
+    ) -> List[Dict[str, Any]]:
+        """融合詞彙排名與產品層級的向量結果，返回前 k 個產品
+
+        每個結果為 {"product_id", "score", "document", "distance"}，score 為融合分數。
+        """
+        by_product = {hit["product_id"]: hit for hit in vector_hits}
+        fused = reciprocal_rank_fusion(
+            [[product_id for product_id, _ in lexical], [hit["product_id"] for hit in vector_hits]],
+            self.rrf_k
+        )
+        hits = []
+        for product_id, score in fused[:k]:
+            vector_hit = by_product.get(product_id, {})
+            hits.append({
+                "product_id": product_id,
+                "score": score,
+                "document": vector_hit.get("document"),
+                "distance": vector_hit.get("distance")
+            })
+        return hits
+
+    def exact_hits(
+        self,
+        query: str,
+        catalog: ProductCatalog,
+        k: int,
+        allowed: Optional[Set[str]] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """完整名稱或型號命中時返回結果（依 BM25 分數排序），否則返回 None"""
+        product_ids = self.exact_product_ids(query, catalog)
+        if not product_ids:
+            return None
+        if allowed is not None:
+            # 命中的產品不符合篩選條件時結果為空，不再退回向量搜索
+            product_ids = [product_id for product_id in product_ids if product_id in allowed]
+        ranked = [product_id for product_id, _ in self.lexical_ranking(query, catalog, allowed) if product_id in product_ids]
+        # BM25 沒有命中的精確匹配排在最後
+        ranked += [product_id for product_id in product_ids if product_id not in ranked]
+        return self.fuse([(product_id, 0.0) for product_id in ranked], [], k)
+
+    def search(
+        self,
+        query: str,
+        k: int = 3,
+        catalog: Optional[ProductCatalog] = None,
+        allowed: Optional[Set[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """同步混合檢索（可指定呼叫端已取得的目錄快照與允許的產品ID）"""
+        catalog = catalog or self.catalog_store.catalog
+        hits = self.exact_hits(query, catalog, k, allowed)
+        if hits is not None:
+            return hits
+        vector_hits = self.vector_search([query], k, [allowed])[0] if self.vector_ready else []
+        return self.fuse(self.lexical_ranking(query, catalog, allowed), vector_hits, k)
+
+
+_retriever: Optional[HybridRetriever] = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever() -> HybridRetriever:
+    """取得全域共用的 HybridRetriever"""
+    global _retriever
+    with _retriever_lock:
+        if _retriever is None:
+            _retriever = HybridRetriever()
+        return _retriever
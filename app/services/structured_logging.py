@@ -0,0 +1,115 @@
+from typing import Dict, Any, Optional
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+from .metrics import TRACE_SAMPLE_RATE, get_metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# 日誌格式："json"（每行一個 JSON 物件）或 "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# 寫入執行緒的佇列上限，佇列滿時丟棄新的紀錄而不是阻塞請求
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# 抽樣的對話日誌是否包含訊息與回答全文（預設只記錄長度）
+LOG_BODIES = os.getenv("LOG_BODIES", "0") == "1"
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆紀錄輸出一行 JSON，log_event 的欄位放在最上層"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        payload.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """一般文字格式，log_event 的欄位以 key=value 接在訊息後"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            text += " " + " ".join(f"{key}={json.dumps(value, ensure_ascii=False, default=str)}" for key, value in fields.items())
+        return text
+
+
+class DroppingQueueHandler(QueueHandler):
+    """非阻塞的佇列處理器：格式化與 I/O 在背景執行緒進行"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            get_metrics().increment("log_records_dropped_total")
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只先合併訊息參數，JSON 序列化留給寫入執行緒
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging():
+    """以背景執行緒寫入日誌（重複呼叫無作用）"""
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler()
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+    _listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def log_event(
+    logger: logging.Logger,
+    event: str,
+    bodies: Optional[Dict[str, Any]] = None,
+    sampled: Optional[bool] = None,
+    **fields: Any
+):
+    """抽樣的結構化事件日誌
+
+    未指定 sampled 時以 TRACE_SAMPLE_RATE 抽樣；bodies（訊息、回答等全文）
+    只在 LOG_BODIES=1 時寫入，否則只記錄字元數。
+    """
+    if sampled is None:
+        sampled = random.random() < TRACE_SAMPLE_RATE
+    if not sampled or not logger.isEnabledFor(logging.INFO):
+        return
+    for key, value in (bodies or {}).items():
+        text = "" if value is None else str(value)
+        if LOG_BODIES:
+            fields[key] = text
+        else:
+            fields[f"{key}_chars"] = len(text)
+    fields["event"] = event
+    logger.info(event, extra={"fields": fields})
@@ -0,0 +1,555 @@
+from typing import List, Dict, Any, Optional, Set, Tuple
+from abc import ABC, abstractmethod
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+import numpy as np
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+# 向量索引後端："chroma"（SQLite + HNSW）或 "numpy"（記憶體映射的精確平面索引）
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# NumPy 平面索引的儲存目錄
+VECTOR_FLAT_DIR = os.getenv("VECTOR_FLAT_DIR", "chroma_db/flat")
+# 平面索引目前世代的指標檔（內容為世代目錄名稱）
+FLAT_CURRENT_FILENAME = "CURRENT"
+# 平面索引的增量段檔案：新增的向量與依序的新增/刪除記錄
+FLAT_DELTA_VECTORS = "delta.f32"
+FLAT_DELTA_LOG = "delta.jsonl"
+# 增量段列數與刪除標記數合計超過基底列數的這個比例時壓縮成新世代
+VECTOR_FLAT_COMPACT_RATIO = float(os.getenv("VECTOR_FLAT_COMPACT_RATIO", "0.25"))
+# 無法取得 Chroma 客戶端的上限時，單次寫入或刪除的最大筆數
+CHROMA_MAX_BATCH_SIZE = 5000
+
+# (文檔, 平方 L2 距離)，距離由小到大
+ScoredDocuments = List[Tuple[Document, float]]
+
+
+def squared_norms(vectors: np.ndarray) -> np.ndarray:
+    """每列的平方範數"""
+    return np.einsum("ij,ij->i", vectors, vectors)
+
+
+def flat_search(
+    vectors: np.ndarray,
+    norms: np.ndarray,
+    query_vectors: np.ndarray,
+    k: int,
+    rows: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """批次精確最近鄰查詢，返回 (列索引, 平方 L2 距離)，形狀皆為 (查詢數, k)
+
+    整批查詢以一次矩陣乘法計算距離，再以 argpartition 取前 k 個並只排序這 k 個。
+    指定 rows 時只在這些列中查詢（篩選條件下推）。
+    """
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    if rows is not None:
+        vectors, norms = vectors[rows], norms[rows]
+    k = min(k, len(vectors))
+    if k <= 0 or not len(query_vectors):
+        empty = np.zeros((len(query_vectors), 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    # ||q - v||² = ||q||² + ||v||² - 2 q·v，與 Chroma 的 l2 距離相同
+    distances = squared_norms(query_vectors)[:, None] + norms[None, :] - 2.0 * (query_vectors @ vectors.T)
+    np.maximum(distances, 0.0, out=distances)
+    if k < distances.shape[1]:
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(distances.shape[1]), distances.shape).copy()
+    top_distances = np.take_along_axis(distances, top, axis=1)
+    order = np.argsort(top_distances, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_distances = np.take_along_axis(top_distances, order, axis=1)
+    if rows is not None:
+        top = rows[top]
+    return top, top_distances
+
+
+class ReadOnlyIndexError(RuntimeError):
+    """對唯讀的向量索引寫入"""
+
+
+class VectorBackend(ABC):
+    """ProductService 使用的向量索引介面
+
+    文檔以 ID 寫入（向量由呼叫端編碼），查詢返回每個查詢的 (文檔, 平方 L2 距離)，
+    allowed 限定產品ID範圍並下推到索引查詢中。
+    """
+
+    name = "base"
+    # 索引清單與向量存放的目錄
+    directory: Path
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def ids(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def add(self, ids: List[str], documents: List[Document], vectors: np.ndarray):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        ...
+
+    def clear(self):
+        """刪除所有文檔"""
+        existing = self.ids()
+        if existing:
+            self.delete(existing)
+
+    @abstractmethod
+    def query(self, query_vectors: np.ndarray, n: int, allowed: Optional[Set[str]] = None) -> List[ScoredDocuments]:
+        ...
+
+    @abstractmethod
+    def export(self) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """依 ID 排序匯出所有文檔 ({"id", "content", "metadata"}) 與向量矩陣"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "count": self.count()}
+
+
+class ChromaBackend(VectorBackend):
+    """Chroma 持久化集合（HNSW 近似索引）"""
+
+    name = "chroma"
+
+    def __init__(self, persist_directory: str, embeddings):
+        from langchain_community.vectorstores import Chroma
+
+        self.directory = Path(persist_directory)
+        # 重新開啟已持久化的向量集合，而不是每次啟動都重建
+        self.vector_store = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=embeddings
+        )
+        self.collection = self.vector_store._collection
+        # Chroma 單次 upsert/delete 有筆數上限，大型目錄需分批寫入
+        client = getattr(self.vector_store, "_client", None)
+        get_max_batch_size = getattr(client, "get_max_batch_size", None)
+        self.max_batch_size = get_max_batch_size() if callable(get_max_batch_size) else CHROMA_MAX_BATCH_SIZE
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def ids(self) -> List[str]:
+        return self.collection.get(include=[])["ids"]
+
+    def add(self, ids: List[str], documents: List[Document], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for start in range(0, len(ids), self.max_batch_size):
+            end = start + self.max_batch_size
+            self.collection.upsert(
+                ids=ids[start:end],
+                embeddings=vectors[start:end].tolist(),
+                documents=[document.page_content for document in documents[start:end]],
+                metadatas=[document.metadata for document in documents[start:end]]
+            )
+
+    def delete(self, ids: List[str]):
+        for start in range(0, len(ids), self.max_batch_size):
+            self.collection.delete(ids=ids[start:start + self.max_batch_size])
+
+    def query(self, query_vectors: np.ndarray, n: int, allowed: Optional[Set[str]] = None) -> List[ScoredDocuments]:
+        response = self.collection.query(
+            query_embeddings=np.asarray(query_vectors, dtype=np.float32).tolist(),
+            n_results=n,
+            where={"id": {"$in": sorted(allowed)}} if allowed is not None else None,
+            include=["documents", "metadatas", "distances"]
+        )
+        results = []
+        for documents, metadatas, distances in zip(
+            response["documents"], response["metadatas"], response["distances"]
+        ):
+            results.append([
+                (Document(page_content=content, metadata=metadata or {}), distance)
+                for content, metadata, distance in zip(documents, metadatas, distances)
+            ])
+        return results
+
+    def export(self) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        data = self.collection.get(include=["embeddings", "documents", "metadatas"])
+        order = sorted(range(len(data["ids"])), key=lambda i: data["ids"][i])
+        chunks = [
+            {"id": data["ids"][i], "content": data["documents"][i], "metadata": data["metadatas"][i] or {}}
+            for i in order
+        ]
+        if not order:
+            return chunks, np.zeros((0, 0), dtype=np.float32)
+        return chunks, np.asarray(data["embeddings"], dtype=np.float32)[order]
+
+
+def flat_generations(directory: Path) -> List[Path]:
+    """平面索引已發布的世代目錄，由舊到新"""
+    if not directory.exists():
+        return []
+    return sorted(path for path in directory.glob("gen-*") if path.is_dir() and path.suffix != ".tmp")
+
+
+def new_flat_generation(directory: Path) -> Path:
+    """建立尚未發布的世代暫存目錄，寫入 vectors.f32 與 rows.json 後以 publish_flat_generation 發布"""
+    directory.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix="gen-", suffix=".tmp", dir=directory))
+
+
+def publish_flat_generation(directory: Path, tmp_dir: Path) -> Path:
+    """把暫存目錄發布為新世代，以原子替換 CURRENT 切換，再刪除舊世代
+
+    向量與列資料在同一個世代目錄中，一次切換，崩潰時不會出現兩者不一致的索引。
+    """
+    existing = flat_generations(directory)
+    generation = int(existing[-1].name.split("-")[1]) + 1 if existing else 1
+    generation_dir = directory / f"gen-{generation:06d}"
+    os.rename(tmp_dir, generation_dir)
+    current_tmp = directory / f"{FLAT_CURRENT_FILENAME}.tmp"
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(generation_dir.name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, directory / FLAT_CURRENT_FILENAME)
+    # 已映射的舊矩陣在檔案刪除後仍可讀取
+    for old in existing:
+        shutil.rmtree(old, ignore_errors=True)
+    for legacy in ("vectors.f32", "rows.json"):
+        (directory / legacy).unlink(missing_ok=True)
+    return generation_dir
+
+
+class NumpyFlatBackend(VectorBackend):
+    """記憶體映射的 float32 矩陣，以精確的暴力搜索查詢
+
+    幾千個產品規模的目錄只需一次矩陣乘法，沒有 SQLite 與 HNSW 的每次查詢開銷，
+    啟動時也只需映射檔案。
+
+    每個世代目錄（gen-NNNNNN）包含唯讀的基底 vectors.f32（形狀 (count, dim)）與
+    rows.json（每列的 ID、內容與元數據），CURRENT 指向目前的世代。之後的寫入
+    附加到同一世代的增量段：delta.f32 存放新增的向量，delta.jsonl 依序記錄新增
+    與刪除；被取代或刪除的列只加上刪除標記。增量段與刪除標記超過基底列數的
+    VECTOR_FLAT_COMPACT_RATIO 時，把存活的列壓縮成新的世代再切換。
+    """
+
+    name = "numpy"
+
+    def __init__(self, directory: str = VECTOR_FLAT_DIR, compact_ratio: float = VECTOR_FLAT_COMPACT_RATIO):
+        self.directory = Path(directory)
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._load()
+
+    def _current_dir(self) -> Path:
+        """目前世代的目錄；沒有 CURRENT 時為舊版直接寫在根目錄的格式"""
+        current_file = self.directory / FLAT_CURRENT_FILENAME
+        if current_file.exists():
+            return self.directory / current_file.read_text(encoding="utf-8").strip()
+        return self.directory
+
+    @staticmethod
+    def _segment(rows: List[Dict[str, Any]], vectors: np.ndarray) -> Dict[str, Any]:
+        return {
+            "rows": rows,
+            "vectors": vectors,
+            "norms": squared_norms(vectors) if len(vectors) else np.zeros(0, dtype=np.float32),
+            "row_products": np.array([row["metadata"].get("id", "") for row in rows], dtype=object),
+            "live": np.ones(len(rows), dtype=bool)
+        }
+
+    def _load(self):
+        data_dir = self._current_dir()
+        rows_file = data_dir / "rows.json"
+        rows: List[Dict[str, Any]] = []
+        dim = 0
+        if rows_file.exists():
+            with open(rows_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            rows, dim = data["rows"], int(data["dim"])
+        if rows:
+            vectors_file = data_dir / "vectors.f32"
+            expected = len(rows) * dim * 4
+            actual = vectors_file.stat().st_size if vectors_file.exists() else 0
+            if actual != expected:
+                # 矩陣與列資料不一致時不能映射，否則會返回錯位的向量
+                raise ValueError(
+                    f"Flat index at {data_dir} is inconsistent: {vectors_file.name} has {actual} bytes, "
+                    f"expected {expected} for {len(rows)} rows of dimension {dim}"
+                )
+            vectors = np.memmap(vectors_file, dtype=np.float32, mode="r", shape=(len(rows), dim))
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+        state = {
+            "data_dir": data_dir,
+            "dim": dim,
+            "segments": [self._segment(rows, vectors), self._segment([], np.zeros((0, dim), dtype=np.float32))],
+            "row_ids": {row["id"]: (0, i) for i, row in enumerate(rows)},
+            "dead": 0
+        }
+        # 重播增量段（新世代沒有增量段）
+        records, delta_vectors = self._read_delta(data_dir, dim)
+        offset = 0
+        for record in records:
+            if record["op"] == "add":
+                count = len(record["rows"])
+                self._apply_add(state, record["rows"], delta_vectors[offset:offset + count])
+                offset += count
+            else:
+                self._apply_delete(state, record["ids"])
+        self._state = state
+
+    @staticmethod
+    def _read_delta(data_dir: Path, dim: int) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """讀取增量記錄與向量，截掉崩潰時寫到一半的尾端"""
+        log_file = data_dir / FLAT_DELTA_LOG
+        vectors_file = data_dir / FLAT_DELTA_VECTORS
+        if not log_file.exists():
+            return [], np.zeros((0, dim), dtype=np.float32)
+        records = []
+        valid_bytes = 0
+        with open(log_file, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+        if log_file.stat().st_size > valid_bytes:
+            logger.warning(f"Truncating incomplete flat index delta log in {data_dir}")
+            os.truncate(log_file, valid_bytes)
+        added = sum(len(record["rows"]) for record in records if record["op"] == "add")
+        expected = added * dim * 4
+        actual = vectors_file.stat().st_size if vectors_file.exists() else 0
+        if actual < expected:
+            raise ValueError(
+                f"Flat index delta at {data_dir} is inconsistent: {vectors_file.name} has {actual} bytes, "
+                f"expected {expected} for {added} rows of dimension {dim}"
+            )
+        if actual > expected:
+            # 向量已附加但記錄尚未寫入時崩潰，這些向量不屬於任何列
+            os.truncate(vectors_file, expected)
+        if not added:
+            return records, np.zeros((0, dim), dtype=np.float32)
+        return records, np.fromfile(vectors_file, dtype=np.float32, count=added * dim).reshape(added, dim)
+
+    @staticmethod
+    def _apply_delete(state: Dict[str, Any], ids: List[str]):
+        """為這些 ID 目前的列加上刪除標記（修改傳入的狀態）"""
+        for chunk_id in ids:
+            location = state["row_ids"].pop(chunk_id, None)
+            if location is not None:
+                segment, i = location
+                state["segments"][segment]["live"][i] = False
+                state["dead"] += 1
+
+    @classmethod
+    def _apply_add(cls, state: Dict[str, Any], rows: List[Dict[str, Any]], vectors: np.ndarray):
+        """取代同 ID 的舊列並把新列附加到增量段（修改傳入的狀態）"""
+        cls._apply_delete(state, [row["id"] for row in rows])
+        delta = state["segments"][1]
+        start = len(delta["rows"])
+        added = cls._segment(rows, vectors)
+        state["segments"][1] = {
+            "rows": delta["rows"] + rows,
+            **{
+                key: np.concatenate([delta[key], added[key]])
+                for key in ("vectors", "norms", "row_products", "live")
+            }
+        }
+        for i, row in enumerate(rows):
+            previous = state["row_ids"].get(row["id"])
+            if previous is not None:
+                # 同一批中重複的 ID 以最後一筆為準
+                state["segments"][previous[0]]["live"][previous[1]] = False
+                state["dead"] += 1
+            state["row_ids"][row["id"]] = (1, start + i)
+
+    def _working_copy(self) -> Dict[str, Any]:
+        """寫入用的狀態副本：基底矩陣共用，只複製刪除標記與索引（查詢讀取的是切換前或切換後的完整狀態）"""
+        state = self._state
+        return {
+            **state,
+            "segments": [dict(segment, live=segment["live"].copy()) for segment in state["segments"]],
+            "row_ids": dict(state["row_ids"])
+        }
+
+    def _needs_compaction(self, state: Dict[str, Any]) -> bool:
+        base_rows = len(state["segments"][0]["rows"])
+        # 舊版根目錄格式與空索引沒有可附加的基底，直接寫成新世代
+        if state["data_dir"] == self.directory or not base_rows:
+            return True
+        return state["dead"] + len(state["segments"][1]["rows"]) > self.compact_ratio * base_rows
+
+    def _append_delta(self, data_dir: Path, record: Dict[str, Any], vectors: Optional[np.ndarray] = None):
+        """先寫入向量再寫入記錄，崩潰時最多留下沒有記錄的向量（載入時截掉）"""
+        if vectors is not None and len(vectors):
+            with open(data_dir / FLAT_DELTA_VECTORS, "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        with open(data_dir / FLAT_DELTA_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _compact(self, state: Dict[str, Any]):
+        """把存活的列寫成新世代（依 ID 排序）並重新映射"""
+        chunks, vectors = self._live(state)
+        self._persist(chunks, vectors if len(chunks) else np.zeros((0, state["dim"]), dtype=np.float32))
+
+    def _persist(self, rows: List[Dict[str, Any]], vectors: np.ndarray):
+        """把矩陣與列資料寫成新世代並切換，再重新映射"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        tmp_dir = new_flat_generation(self.directory)
+        vectors.tofile(tmp_dir / "vectors.f32")
+        with open(tmp_dir / "rows.json", "w", encoding="utf-8") as f:
+            json.dump({"dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0, "rows": rows}, f, ensure_ascii=False)
+        publish_flat_generation(self.directory, tmp_dir)
+        self._load()
+
+    @staticmethod
+    def _live(state: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """依 ID 排序的存活列與向量"""
+        located = sorted(state["row_ids"].items())
+        rows = [dict(state["segments"][segment]["rows"][i]) for _, (segment, i) in located]
+        if not located:
+            return rows, np.zeros((0, 0), dtype=np.float32)
+        vectors = np.stack([np.asarray(state["segments"][segment]["vectors"][i]) for _, (segment, i) in located])
+        return rows, vectors
+
+    def count(self) -> int:
+        return len(self._state["row_ids"])
+
+    def ids(self) -> List[str]:
+        return list(self._state["row_ids"])
+
+    def add(self, ids: List[str], documents: List[Document], vectors: np.ndarray):
+        if not ids:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rows = [
+            {"id": chunk_id, "content": document.page_content, "metadata": document.metadata}
+            for chunk_id, document in zip(ids, documents)
+        ]
+        with self._lock:
+            if self._state["dim"] and vectors.shape[1] != self._state["dim"]:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match the index ({self._state['dim']})")
+            state = self._working_copy()
+            if not state["dim"]:
+                state["dim"] = int(vectors.shape[1])
+                state["segments"][1] = self._segment([], np.zeros((0, state["dim"]), dtype=np.float32))
+            self._apply_add(state, rows, vectors)
+            if self._needs_compaction(state):
+                self._compact(state)
+                return
+            self._append_delta(state["data_dir"], {"op": "add", "rows": rows}, vectors)
+            self._state = state
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            ids = [chunk_id for chunk_id in ids if chunk_id in self._state["row_ids"]]
+            if not ids:
+                return
+            state = self._working_copy()
+            self._apply_delete(state, ids)
+            if self._needs_compaction(state):
+                self._compact(state)
+                return
+            self._append_delta(state["data_dir"], {"op": "delete", "ids": ids})
+            self._state = state
+
+    def query(self, query_vectors: np.ndarray, n: int, allowed: Optional[Set[str]] = None) -> List[ScoredDocuments]:
+        state = self._state
+        candidates: List[List[Tuple[float, Dict[str, Any]]]] = [[] for _ in range(len(query_vectors))]
+        for segment in state["segments"]:
+            if not len(segment["rows"]):
+                continue
+            live = segment["live"]
+            rows = None
+            extra = 0
+            if allowed is not None:
+                rows = np.flatnonzero(live & np.isin(segment["row_products"], list(allowed)))
+            else:
+                # 不複製矩陣：多取刪除標記的列數，再濾掉已刪除的列
+                extra = len(live) - int(np.count_nonzero(live))
+            top, distances = flat_search(segment["vectors"], segment["norms"], query_vectors, n + extra, rows)
+            for results, indices, row_distances in zip(candidates, top, distances):
+                results.extend(
+                    (float(distance), segment["rows"][i])
+                    for i, distance in zip(indices, row_distances) if live[i]
+                )
+        return [
+            [
+                (Document(page_content=row["content"], metadata=row["metadata"]), distance)
+                for distance, row in sorted(results, key=lambda item: item[0])[:n]
+            ]
+            for results in candidates
+        ]
+
+    def export(self) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        return self._live(self._state)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        state = self._state
+        stats["dim"] = state["dim"]
+        stats["delta_rows"] = len(state["segments"][1]["rows"])
+        stats["tombstones"] = state["dead"]
+        return stats
+
+
+class SharedIndexBackend(VectorBackend):
+    """共享模式的唯讀後端：查詢建置程序發布的目前世代"""
+
+    name = "shared"
+
+    def __init__(self, shared_index):
+        self.shared_index = shared_index
+        self.directory = shared_index.directory
+
+    def count(self) -> int:
+        return len(self.shared_index)
+
+    def ids(self) -> List[str]:
+        generation = self.shared_index.current
+        return [chunk["id"] for chunk in generation.chunks] if generation is not None else []
+
+    def add(self, ids: List[str], documents: List[Document], vectors: np.ndarray):
+        raise ReadOnlyIndexError("The shared index is read-only; update it through the index builder")
+
+    def delete(self, ids: List[str]):
+        raise ReadOnlyIndexError("The shared index is read-only; update it through the index builder")
+
+    def clear(self):
+        raise ReadOnlyIndexError("The shared index is read-only; update it through the index builder")
+
+    def query(self, query_vectors: np.ndarray, n: int, allowed: Optional[Set[str]] = None) -> List[ScoredDocuments]:
+        return self.shared_index.search(query_vectors, n, allowed)
+
+    def export(self) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        generation = self.shared_index.current
+        if generation is None:
+            return [], np.zeros((0, 0), dtype=np.float32)
+        return generation.chunks, np.asarray(generation.vectors)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update(self.shared_index.stats())
+        return stats
+
+
+def create_vector_backend(name: str, embeddings, persist_directory: str) -> VectorBackend:
+    """依設定建立向量索引後端"""
+    if name == "chroma":
+        return ChromaBackend(persist_directory, embeddings)
+    if name == "numpy":
+        return NumpyFlatBackend(VECTOR_FLAT_DIR)
+    raise ValueError(f"Unknown vector backend: {name!r} (expected 'chroma' or 'numpy')")
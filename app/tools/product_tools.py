@@ -1,158 +1,122 @@
-from typing import Dict, List, Any
+from typing import Any, Dict
 from langchain.tools import BaseTool
-import json
-from pathlib import Path
+import os
 from pydantic import Field
+from ..services.catalog import CatalogStore, ProductCatalog, find_category, get_catalog_store
+from ..services.inventory import InventoryStore, get_inventory_store
+from ..services.query_cache import QueryCache, get_query_cache
+from ..services.recommender import RecommendationEngine, get_recommender
+from ..services.retrieval import HybridRetriever, get_retriever
+from .tool_output import parse_cursor, project_product, render_page
+
+# 一般搜索返回的產品數
+SEARCH_TOOL_TOP_K = int(os.getenv("SEARCH_TOOL_TOP_K", "5"))
 
 class ProductSearchTool(BaseTool):
     name: str = "product_search"
     description: str = "搜索產品信息，可以根據產品名稱、類別或規格進行搜索"
-    products: List[Dict[str, Any]] = Field(default_factory=list)
-    
-    def __init__(self, **data):
-        super().__init__(**data)
-        self.products = self._load_products()
+    # 與 ProductService 共用同一份可熱更新的產品目錄
+    catalog_store: CatalogStore = Field(default_factory=get_catalog_store)
+    # 價格與庫存從即時庫存層讀取
+    inventory: InventoryStore = Field(default_factory=get_inventory_store)
+    query_cache: QueryCache = Field(default_factory=get_query_cache)
+    # 與 REST API 共用的混合檢索引擎
+    retriever: HybridRetriever = Field(default_factory=get_retriever)
     
-    def _load_products(self) -> List[Dict[str, Any]]:
-        """加載產品數據"""
-        products_file = Path(__file__).parent.parent / "data" / "documents" / "products.json"
-        with open(products_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data["products"]
+    @property
+    def catalog(self) -> ProductCatalog:
+        """目前的產品目錄快照"""
+        return self.catalog_store.catalog
     
     def _run(self, query: str) -> str:
+        """執行產品搜索（結果依目錄與庫存版本快取）
+
+        輸出受 token 預算限制並分頁，query 結尾的 "#more=N" 為下一頁的游標。
+        """
+        query, offset = parse_cursor(query)
+        if not self.retriever.vector_ready:
+            # 向量索引尚未載入時只有詞彙結果，不寫入快取，避免就緒後仍返回降級的結果
+            return self._search(query, offset)
+        return self.query_cache.get_or_compute("tool:product_search", query, offset, lambda: self._search(query, offset))
+    
+    def _search(self, query: str, offset: int = 0) -> str:
         """執行產品搜索"""
+        catalog = self.catalog  # 整個請求使用同一份快照
+        original_query = query
         query = query.lower()
         results = []
         
         # 處理特殊查詢
         if "有哪些" in query or "列出" in query or "所有" in query:
             # 提取類別關鍵詞
-            category_keywords = {
-                "耳機": "耳機",
-                "手機": "手機",
-                "筆記本": "筆記型電腦",
-                "筆電": "筆記型電腦",
-                "電腦": "筆記型電腦",
-                "筆記型電腦": "筆記型電腦"
-            }
-            
-            # 檢查是否包含類別關鍵詞
-            found_category = False
-            target_category = None
+            target_category = find_category(query)
             
-            # 首先檢查是否包含類別關鍵詞
-            for keyword, category in category_keywords.items():
-                if keyword in query:
-                    target_category = category
-                    found_category = True
-                    break
-            
-            # 如果找到類別關鍵詞，搜索該類別的所有產品
-            if found_category and target_category:
-                print(f"Searching for category: {target_category}")  # 調試輸出
-                for product in self.products:
-                    print(f"Checking product: {product['name']}, category: {product['category']}")  # 調試輸出
-                    if product["category"] == target_category:
-                        results.append(product)
+            # 如果找到類別關鍵詞，從類別索引取得該類別的所有產品
+            if target_category:
+                results = catalog.in_category(target_category)
             else:
                 # 如果沒有找到特定類別關鍵詞，返回所有產品
-                results = self.products
+                results = catalog.products
         else:
-            # 常規搜索邏輯
-            for product in self.products:
-                # 搜索產品名稱
-                if query in product["name"].lower():
-                    results.append(product)
-                    continue
-                
-                # 搜索產品類別
-                if query in product["category"].lower():
-                    results.append(product)
-                    continue
-                
-                # 搜索產品描述
-                if query in product["description"].lower():
-                    results.append(product)
-                    continue
-                
-                # 搜索產品規格
-                for spec_key, spec_value in product["specs"].items():
-                    if isinstance(spec_value, str) and query in spec_value.lower():
-                        results.append(product)
-                        break
+            # 常規搜索邏輯：BM25 與向量結果融合排名
+            hits = self.retriever.search(query, SEARCH_TOOL_TOP_K, catalog)
+            results = [catalog.get(hit["product_id"]) for hit in hits if catalog.get(hit["product_id"])]
         
         if not results:
             return "未找到相關產品"
         
-        # 格式化結果
-        formatted_results = []
-        for product in results:
-            formatted_result = f"""
-產品名稱: {product['name']}
-類別: {product['category']}
-價格: NT${product['price']}
-描述: {product['description']}
-規格:
-"""
-            for key, value in product["specs"].items():
-                formatted_result += f"- {key}: {value}\n"
-            
-            formatted_results.append(formatted_result)
-        
-        return "\n".join(formatted_results)
+        # 先分頁，只對本頁的產品讀取庫存並精簡欄位，再依 token 預算輸出
+        return render_page(results, original_query, offset, project=self._project)
+
+    def _project(self, product: Dict[str, Any]) -> Dict[str, str]:
+        """精簡欄位並附上即時價格與庫存"""
+        return project_product(product, self.inventory.price(product["id"]), self.inventory.stock(product["id"]))
 
 class ProductRecommendationTool(BaseTool):
     name: str = "product_recommendation"
     description: str = "根據用戶需求推薦合適的產品"
-    products: List[Dict[str, Any]] = Field(default_factory=list)
+    # 與 ProductService 共用同一份可熱更新的產品目錄
+    catalog_store: CatalogStore = Field(default_factory=get_catalog_store)
+    # 價格與庫存從即時庫存層讀取
+    inventory: InventoryStore = Field(default_factory=get_inventory_store)
+    # 向量化推薦引擎：關鍵詞與語意相似度加權，預算與規格條件以遮罩篩選
+    recommender: RecommendationEngine = Field(default_factory=get_recommender)
     
-    def __init__(self, **data):
-        super().__init__(**data)
-        self.products = self._load_products()
-    
-    def _load_products(self) -> List[Dict[str, Any]]:
-        """加載產品數據"""
-        products_file = Path(__file__).parent.parent / "data" / "documents" / "products.json"
-        with open(products_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data["products"]
+    @property
+    def catalog(self) -> ProductCatalog:
+        """目前的產品目錄快照"""
+        return self.catalog_store.catalog
     
     def _run(self, requirements: str) -> str:
-        """執行產品推薦"""
-        requirements = requirements.lower()
-        recommendations = []
+        """執行產品推薦（輸出受 token 預算限制）
+
+        預算不足以列出全部推薦時分頁，requirements 結尾的 "#more=N" 為下一頁的游標。
+        """
+        requirements, offset = parse_cursor(requirements)
+        catalog = self.catalog  # 整個請求使用同一份快照
         
-        # 根據需求匹配產品
-        for product in self.products:
-            score = 0
-            
-            # 檢查產品描述
-            if any(keyword in product["description"].lower() for keyword in requirements.split()):
-                score += 2
-            
-            # 檢查產品規格
-            for spec_key, spec_value in product["specs"].items():
-                if isinstance(spec_value, str) and any(keyword in spec_value.lower() for keyword in requirements.split()):
-                    score += 1
-            
-            if score > 0:
-                recommendations.append((product, score))
+        # 根據需求評分（中文需求以 bigram 比對，不依賴空白分詞），取前3個
+        hits = self.recommender.recommend(requirements, 3, catalog)
+        top_recommendations = [catalog.get(hit["product_id"]) for hit in hits if catalog.get(hit["product_id"])]
         
-        if not recommendations:
+        if not top_recommendations:
             return "抱歉，沒有找到符合您需求的產品"
         
-        # 按匹配分數排序
-        recommendations.sort(key=lambda x: x[1], reverse=True)
-        
-        # 格式化推薦結果
-        formatted_recommendations = ["根據您的需求，我推薦以下產品："]
-        for product, score in recommendations[:3]:  # 只推薦前3個
-            formatted_recommendations.append(f"""
-產品名稱: {product['name']}
-類別: {product['category']}
-價格: NT${product['price']}
-描述: {product['description']}
-""")
-        
-        return "\n".join(formatted_recommendations) 
\ No newline at end of file
+        if any(hit["relaxed"] for hit in hits):
+            header = "沒有完全符合您條件的產品，以下是最接近您需求的產品："
+        else:
+            header = "根據您的需求，我推薦以下產品："
+        return render_page(
+            top_recommendations,
+            requirements,
+            offset,
+            header=header,
+            tool_name=self.name,
+            project=self._project
+        )
+
+    def _project(self, product: Dict[str, Any]) -> Dict[str, str]:
+        """推薦結果不列出完整規格"""
+        record = project_product(product, self.inventory.price(product["id"]), self.inventory.stock(product["id"]))
+        record.pop("specs")
+        return record
\ No newline at end of file
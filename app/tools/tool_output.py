@@ -0,0 +1,108 @@
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple
+import os
+import re
+from ..agents.session_memory import count_tokens
+
+# 單次工具輸出的 token 上限（結果會放進 LLM prompt）
+TOOL_OUTPUT_MAX_TOKENS = int(os.getenv("TOOL_OUTPUT_MAX_TOKENS", "600"))
+# 每頁最多列出的產品數
+TOOL_PAGE_SIZE = int(os.getenv("TOOL_PAGE_SIZE", "5"))
+# 描述欄位最多保留的字元數
+TOOL_DESCRIPTION_MAX_CHARS = int(os.getenv("TOOL_DESCRIPTION_MAX_CHARS", "80"))
+# 超過預算時依序捨棄的欄位（名稱與價格一定保留）
+DROP_PRIORITY = ["specs", "description", "stock", "category"]
+# 查詢中的分頁游標，例如 "列出所有產品 #more=5"
+CURSOR_PATTERN = re.compile(r"\s*#more=(\d+)\s*$")
+
+FIELD_LABELS = {
+    "category": "類別",
+    "price": "價格",
+    "stock": "庫存",
+    "description": "描述",
+    "specs": "規格"
+}
+
+
+def parse_cursor(query: str) -> Tuple[str, int]:
+    """拆出查詢與分頁游標（起始位置）"""
+    match = CURSOR_PATTERN.search(query)
+    if match is None:
+        return query, 0
+    return query[:match.start()], int(match.group(1))
+
+
+def make_cursor(query: str, offset: int) -> str:
+    return f"{query} #more={offset}"
+
+
+def project_product(product: Dict[str, Any], price: int, stock: Optional[int] = None) -> Dict[str, str]:
+    """精簡欄位投影：規格壓成一行、描述截斷"""
+    description = product.get("description", "")
+    if len(description) > TOOL_DESCRIPTION_MAX_CHARS:
+        description = description[:TOOL_DESCRIPTION_MAX_CHARS] + "…"
+    record = {
+        "name": product["name"],
+        "category": product.get("category", ""),
+        "price": f"NT${price}",
+        "description": description,
+        "specs": "; ".join(f"{key}: {value}" for key, value in product.get("specs", {}).items())
+    }
+    if stock is not None:
+        record["stock"] = f"{stock}台"
+    return record
+
+
+def _render_record(record: Dict[str, str], dropped: List[str]) -> str:
+    parts = [record["name"]]
+    for field in ("category", "price", "stock", "description", "specs"):
+        if field in record and field not in dropped and record[field]:
+            parts.append(f"{FIELD_LABELS[field]}: {record[field]}")
+    return "- " + " | ".join(parts)
+
+
+def render_page(
+    records: Sequence[Any],
+    query: str,
+    offset: int = 0,
+    header: str = "",
+    page_size: int = TOOL_PAGE_SIZE,
+    max_tokens: int = TOOL_OUTPUT_MAX_TOKENS,
+    tool_name: str = "product_search",
+    project: Optional[Callable[[Any], Dict[str, str]]] = None
+) -> str:
+    """依 token 預算輸出一頁結果
+
+    先取 offset 起的 page_size 筆；超過預算時依 DROP_PRIORITY 逐一捨棄欄位，
+    仍超過時減少本頁筆數。還有剩餘結果時附上下一頁的呼叫方式。
+    指定 project 時 records 為原始候選，只投影本頁的筆數。
+    """
+    total = len(records)
+    page = records[offset:offset + max(1, page_size)]
+    if project is not None:
+        page = [project(record) for record in page]
+    dropped: List[str] = []
+    name_chars: Optional[int] = None
+    while True:
+        lines = [_render_record(record, dropped) for record in page]
+        end = offset + len(page)
+        summary = f"共 {total} 項，第 {offset + 1}-{end} 項" if page else f"共 {total} 項"
+        footer = f"還有 {total - end} 項，查看更多請呼叫 {tool_name}(\"{make_cursor(query, end)}\")" if end < total else ""
+        text = "\n".join(part for part in [header, summary, *lines, footer] if part)
+        if count_tokens(text) <= max_tokens:
+            return text
+        if name_chars is not None:
+            # 單筆最精簡的結果仍超過預算時截斷名稱，保留價格、摘要與游標
+            if name_chars <= 1:
+                return text
+            name_chars = int(name_chars * 0.8)
+            page = [{"name": full_name[:name_chars] + "…", "price": price}]
+            continue
+        remaining = [field for field in DROP_PRIORITY if field not in dropped]
+        if remaining:
+            dropped.append(remaining[0])
+        elif len(page) > 1:
+            page = page[:-1]
+        else:
+            full_name = page[0]["name"]
+            price = page[0]["price"]
+            name_chars = len(full_name)
@@ -0,0 +1,128 @@
+"""比較向量索引後端的召回率與延遲
+
+以合成的正規化向量（模擬 sentence-transformers 輸出）分別建立 Chroma 與 NumPy
+平面索引，以精確的暴力搜索結果為基準計算 recall@k，並量測單一查詢與批次查詢延遲、
+重新開啟索引（冷啟動）的時間。
+
+    python -m benchmarks.compare_vector_backends --docs 5000 --queries 200 --k 10
+"""
+from typing import List, Dict, Any
+import argparse
+import json
+import tempfile
+import time
+import numpy as np
+from langchain.schema import Document
+from app.services.vector_backends import ChromaBackend, NumpyFlatBackend, VectorBackend
+
+# 每個合成產品的文檔數（與 ProductService 的基本信息、規格、描述三種文檔相同）
+DOCS_PER_PRODUCT = 3
+# 寫入 Chroma 的批次大小（低於其單次寫入上限）
+ADD_BATCH_SIZE = 1000
+
+
+def synthetic_corpus(count: int, dim: int, seed: int) -> np.ndarray:
+    """產生分群的正規化向量：同一產品的文檔彼此相近，與真實目錄的分佈類似"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // DOCS_PER_PRODUCT), dim)).astype(np.float32)
+    vectors = centers[np.arange(count) // DOCS_PER_PRODUCT % len(centers)]
+    vectors = vectors + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def synthetic_queries(corpus: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """以語料中的向量加上雜訊作為查詢"""
+    rng = np.random.default_rng(seed + 1)
+    queries = corpus[rng.integers(0, len(corpus), count)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def fill(backend: VectorBackend, vectors: np.ndarray) -> float:
+    """寫入所有文檔，返回耗時秒數"""
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), ADD_BATCH_SIZE):
+        batch = range(offset, min(offset + ADD_BATCH_SIZE, len(vectors)))
+        ids = [f"doc-{i:07d}" for i in batch]
+        documents = [
+            Document(page_content=f"document {i}", metadata={"id": f"P{i // DOCS_PER_PRODUCT:06d}", "type": "synthetic"})
+            for i in batch
+        ]
+        backend.add(ids, documents, vectors[offset:offset + len(ids)])
+    return time.perf_counter() - start
+
+
+def doc_ids(results) -> List[List[str]]:
+    return [[doc.page_content for doc, _ in docs] for docs in results]
+
+
+def percentile_ms(samples: List[float], q: float) -> float:
+    return float(np.percentile(samples, q) * 1000) if samples else 0.0
+
+
+def measure(backend: VectorBackend, queries: np.ndarray, k: int, batch_size: int, truth: List[List[str]]) -> Dict[str, Any]:
+    """量測單一查詢延遲、批次吞吐量與 recall@k"""
+    backend.query(queries[:1], k)  # 暖機
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        results = backend.query(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.extend(doc_ids(results))
+
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        backend.query(queries[offset:offset + batch_size], k)
+    batch_seconds = time.perf_counter() - start
+
+    recall = np.mean([len(set(a) & set(b)) / max(1, len(b)) for a, b in zip(found, truth)])
+    return {
+        "recall_at_k": round(float(recall), 4),
+        "p50_ms": round(percentile_ms(latencies, 50), 3),
+        "p95_ms": round(percentile_ms(latencies, 95), 3),
+        "batched_qps": round(len(queries) / batch_seconds, 1) if batch_seconds else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall and latency of the vector backends")
+    parser.add_argument("--docs", type=int, default=5000, help="文檔數（產品數 × 3）")
+    parser.add_argument("--dim", type=int, default=384, help="向量維度（paraphrase-multilingual-MiniLM-L12-v2 為 384）")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32, help="批次查詢大小（與 QUERY_BATCH_MAX_SIZE 相同）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.docs, args.dim, args.seed)
+    queries = synthetic_queries(corpus, args.queries, args.seed)
+    report: Dict[str, Any] = {"docs": args.docs, "dim": args.dim, "queries": args.queries, "k": args.k}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        flat = NumpyFlatBackend(f"{workdir}/flat")
+        flat_build = fill(flat, corpus)
+        # NumPy 平面索引為精確搜索，作為召回率的基準
+        truth = doc_ids(flat.query(queries, args.k))
+
+        chroma = ChromaBackend(f"{workdir}/chroma", None)
+        chroma_build = fill(chroma, corpus)
+
+        for name, backend, build_seconds, factory in (
+            ("numpy", flat, flat_build, lambda: NumpyFlatBackend(f"{workdir}/flat")),
+            ("chroma", chroma, chroma_build, lambda: ChromaBackend(f"{workdir}/chroma", None))
+        ):
+            result = measure(backend, queries, args.k, args.batch_size, truth)
+            result["build_s"] = round(build_seconds, 3)
+            # 重新開啟索引並完成第一個查詢的時間
+            start = time.perf_counter()
+            factory().query(queries[:1], args.k)
+            result["reopen_first_query_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            report[name] = result
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
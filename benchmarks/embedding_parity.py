@@ -0,0 +1,105 @@
+"""比較 ONNX int8 與 torch 編碼後端的向量一致性與延遲
+
+以產品文檔與常見查詢分別經兩種後端編碼，計算每筆文字的餘弦相似度，並檢查
+每個查詢在產品文檔中的最近鄰是否一致。最低餘弦相似度低於 --min-cosine 時以
+非零狀態碼結束，可在部署前或 CI 中執行；匯出模型後 tests/test_embedding_parity.py
+也會在測試中自動執行：
+
+    python -m app.services.onnx_embeddings            # 先匯出模型
+    python -m benchmarks.embedding_parity --min-cosine 0.98
+"""
+from typing import List, Dict, Any
+import argparse
+import json
+import sys
+import time
+import numpy as np
+from app.services.catalog import PRODUCTS_FILE
+from app.services.embedding_service import CachedEmbeddings
+from app.services.product_service import EMBEDDING_MODEL_NAME
+
+SAMPLE_QUERIES = [
+    "推薦一台適合工作的筆電",
+    "降噪耳機",
+    "iPhone 15 Pro 規格",
+    "MacBook Pro 還有庫存嗎",
+    "預算三萬以內的手機",
+    "wireless headphones with long battery life",
+    "M3 Pro 晶片",
+    "拍照好的手機有哪些"
+]
+
+
+def product_texts(products_file: str) -> List[str]:
+    with open(products_file, "r", encoding="utf-8") as f:
+        products = json.load(f)["products"]
+    texts = []
+    for product in products:
+        specs = "\n".join(f"{key}: {value}" for key, value in product["specs"].items())
+        texts.append(f"產品名稱: {product['name']}\n類別: {product['category']}")
+        texts.append(f"產品名稱: {product['name']}\n完整規格:\n{specs}")
+        texts.append(f"產品名稱: {product['name']}\n產品描述: {product['description']}")
+    return texts
+
+
+def encode_timed(embeddings: CachedEmbeddings, texts: List[str], queries: List[str]) -> Dict[str, Any]:
+    """編碼文檔與查詢，並量測單一查詢延遲（模型載入不計入）"""
+    embeddings.warm_up()
+    start = time.perf_counter()
+    documents = embeddings.embed_array(texts)
+    batch_seconds = time.perf_counter() - start
+    latencies = []
+    vectors = []
+    for query in queries:
+        start = time.perf_counter()
+        vectors.append(embeddings.embed_array([query])[0])
+        latencies.append(time.perf_counter() - start)
+    return {
+        "documents": documents,
+        "queries": np.vstack(vectors),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "docs_per_sec": round(len(texts) / batch_seconds, 1) if batch_seconds else None
+    }
+
+
+def parity_report(products_file: str = str(PRODUCTS_FILE)) -> Dict[str, Any]:
+    """以兩種後端編碼產品文檔與查詢，返回餘弦相似度、最近鄰一致率與延遲"""
+    texts = product_texts(products_file)
+    results = {}
+    for backend in ("torch", "onnx"):
+        # 不使用磁碟快取，兩者都實際編碼
+        embeddings = CachedEmbeddings(EMBEDDING_MODEL_NAME, cache_dir=None, backend=backend)
+        results[backend] = encode_timed(embeddings, texts, SAMPLE_QUERIES)
+
+    reference = np.vstack([results["torch"]["documents"], results["torch"]["queries"]])
+    candidate = np.vstack([results["onnx"]["documents"], results["onnx"]["queries"]])
+    # 兩種後端的輸出皆已正規化，內積即餘弦相似度
+    cosines = np.einsum("ij,ij->i", reference, candidate)
+    nearest_torch = np.argmax(results["torch"]["queries"] @ results["torch"]["documents"].T, axis=1)
+    nearest_onnx = np.argmax(results["onnx"]["queries"] @ results["onnx"]["documents"].T, axis=1)
+
+    return {
+        "texts": len(cosines),
+        "cosine_min": round(float(cosines.min()), 5),
+        "cosine_mean": round(float(cosines.mean()), 5),
+        "top1_agreement": round(float(np.mean(nearest_torch == nearest_onnx)), 3),
+        "query_p50_ms": {backend: results[backend]["query_p50_ms"] for backend in results},
+        "docs_per_sec": {backend: results[backend]["docs_per_sec"] for backend in results}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check ONNX int8 embeddings against the torch backend")
+    parser.add_argument("--products", default=str(PRODUCTS_FILE))
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="允許的最低餘弦相似度")
+    args = parser.parse_args()
+
+    report = parity_report(args.products)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report["cosine_min"] < args.min_cosine:
+        print(f"FAIL: minimum cosine {report['cosine_min']} < {args.min_cosine}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""模擬 Ollama /api/generate 的伺服器
+
+以固定的首個 token 延遲與每個 token 的間隔串流回答，讓負載測試不受 GPU 與模型
+影響，只量測服務本身（排隊、連線池、串流轉送）的延遲與吞吐量。
+
+    python -m benchmarks.fake_ollama --port 11500 --first-token-ms 200 --token-ms 20 --tokens 40
+    OLLAMA_BASE_URL=http://127.0.0.1:11500 uvicorn app.main:app
+"""
+from typing import Dict, Any
+import argparse
+import asyncio
+import json
+import os
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# 延遲設定以環境變量傳給 uvicorn 程序
+FIRST_TOKEN_MS = float(os.getenv("FAKE_OLLAMA_FIRST_TOKEN_MS", "200"))
+TOKEN_MS = float(os.getenv("FAKE_OLLAMA_TOKEN_MS", "20"))
+TOKENS = int(os.getenv("FAKE_OLLAMA_TOKENS", "40"))
+ANSWER_TOKENS = ["這", "款", "產", "品", "符", "合", "您", "的", "需", "求", "。"]
+
+app = FastAPI()
+state: Dict[str, Any] = {"requests": 0, "active": 0, "max_active": 0, "cancelled": 0}
+
+
+def _token(i: int) -> str:
+    return ANSWER_TOKENS[i % len(ANSWER_TOKENS)]
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    body = await request.json()
+    state["requests"] += 1
+
+    if not body.get("stream", True):
+        await asyncio.sleep((FIRST_TOKEN_MS + TOKEN_MS * max(0, TOKENS - 1)) / 1000)
+        return {"model": body.get("model"), "response": "".join(_token(i) for i in range(TOKENS)), "done": True}
+
+    async def stream():
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        try:
+            await asyncio.sleep(FIRST_TOKEN_MS / 1000)
+            for i in range(TOKENS):
+                if i:
+                    await asyncio.sleep(TOKEN_MS / 1000)
+                yield json.dumps({"model": body.get("model"), "response": _token(i), "done": False}) + "\n"
+            yield json.dumps({"model": body.get("model"), "response": "", "done": True}) + "\n"
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        finally:
+            state["active"] -= 1
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/api/tags")
+async def tags():
+    return {"models": [{"name": "mistral"}]}
+
+
+@app.get("/state")
+async def get_state():
+    """請求數、最大同時生成數與取消數"""
+    return state
+
+
+def main():
+    import uvicorn
+
+    global FIRST_TOKEN_MS, TOKEN_MS, TOKENS
+    parser = argparse.ArgumentParser(description="Fake Ollama server with configurable latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--first-token-ms", type=float, default=FIRST_TOKEN_MS)
+    parser.add_argument("--token-ms", type=float, default=TOKEN_MS)
+    parser.add_argument("--tokens", type=int, default=TOKENS)
+    args = parser.parse_args()
+
+    FIRST_TOKEN_MS, TOKEN_MS, TOKENS = args.first_token_ms, args.token_ms, args.tokens
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
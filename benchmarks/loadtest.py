@@ -0,0 +1,224 @@
+"""REST 搜索與 WebSocket 對話的負載測試
+
+以固定的併發數持續送出請求，輸出吞吐量與 p50/p95/p99 延遲（JSON）：
+
+- search：GET /api/products/search
+- ws：每個虛擬使用者一條 /ws/{client_id} 連線，依序發送對話訊息，分別統計
+  快速路徑與 Agent 路徑的完整回覆延遲，以及第一個串流事件的延遲
+
+對已在執行的伺服器測試：
+
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --concurrency 32 --duration 30
+
+或以 --spawn 自動啟動模擬 Ollama 與使用合成目錄的 API 伺服器（結果可重現）：
+
+    python -m benchmarks.loadtest --spawn --products 10000 --concurrency 64 --duration 30 --output load.json
+"""
+from typing import List, Dict, Any, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from .report import environment, latency_summary, write_report
+from .synthetic_catalog import generate_products, generate_queries, write_catalog
+
+
+class Recorder:
+    """依類別收集延遲樣本與錯誤數"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, name: str, seconds: float):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def error(self, name: str):
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        names = sorted(set(self.samples) | set(self.errors))
+        return {
+            name: {**latency_summary(self.samples.get(name, []), elapsed), "errors": self.errors.get(name, 0)}
+            for name in names
+        }
+
+
+async def search_user(client: httpx.AsyncClient, queries: List[str], deadline: float, recorder: Recorder, seed: int):
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        query = rng.choice(queries)
+        start = time.perf_counter()
+        try:
+            response = await client.get("/api/products/search", params={"query": query, "k": 3})
+            if response.status_code == 200:
+                recorder.add("search", time.perf_counter() - start)
+            else:
+                recorder.error("search")
+        except httpx.HTTPError:
+            recorder.error("search")
+
+
+async def ws_user(url: str, client_id: str, queries: List[str], deadline: float, recorder: Recorder, seed: int):
+    import websockets
+
+    rng = random.Random(seed)
+    try:
+        async with websockets.connect(f"{url}/ws/{client_id}", max_size=None) as websocket:
+            sequence = 0
+            while time.perf_counter() < deadline:
+                sequence += 1
+                request_id = f"{client_id}-{sequence}"
+                start = time.perf_counter()
+                first_event: Optional[float] = None
+                await websocket.send(json.dumps({"type": "chat", "content": rng.choice(queries), "request_id": request_id}))
+                while True:
+                    message = json.loads(await websocket.recv())
+                    if message.get("request_id") != request_id:
+                        continue
+                    if first_event is None:
+                        first_event = time.perf_counter() - start
+                    if message["type"] in ("response", "error"):
+                        break
+                route = message.get("route", "error")
+                if message["type"] == "error" or message.get("status") != "success":
+                    recorder.error(f"ws_{route}")
+                    continue
+                recorder.add(f"ws_{route}", time.perf_counter() - start)
+                recorder.add("ws_first_event", first_event)
+    except Exception:
+        recorder.error("ws_connection")
+
+
+async def run_load(args, queries: List[str]) -> Dict[str, Any]:
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.duration
+    tasks = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        start = time.perf_counter()
+        for i in range(args.concurrency):
+            if args.scenario in ("search", "all"):
+                tasks.append(search_user(client, queries, deadline, recorder, args.seed + i))
+            if args.scenario in ("ws", "all"):
+                ws_url = args.url.replace("http://", "ws://").replace("https://", "wss://")
+                tasks.append(ws_user(ws_url, f"load-{i}", queries, deadline, recorder, args.seed + i))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        stats = {}
+        for path in ("/metrics/summary", "/llm/stats", "/ws/stats"):
+            try:
+                stats[path] = (await client.get(path)).json()
+            except (httpx.HTTPError, ValueError):
+                pass
+    return {"elapsed_s": round(elapsed, 3), "results": recorder.report(elapsed), "server_stats": stats}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url: str, timeout: float):
+    """等待伺服器所有元件就緒"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/ready", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} was not ready within {timeout}s")
+
+
+def spawn(args, workdir: str) -> List[subprocess.Popen]:
+    """啟動模擬 Ollama 與使用合成目錄的 API 伺服器"""
+    ollama_port, api_port = free_port(), free_port()
+    products_file = write_catalog(os.path.join(workdir, "products.json"), args.products, args.seed)
+    ollama = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(ollama_port),
+        "--first-token-ms", str(args.first_token_ms), "--token-ms", str(args.token_ms), "--tokens", str(args.tokens)
+    ], stdout=subprocess.DEVNULL)
+    env = dict(
+        os.environ,
+        PRODUCTS_FILE=products_file,
+        OLLAMA_BASE_URL=f"http://127.0.0.1:{ollama_port}",
+        CHROMA_PERSIST_DIR=os.path.join(workdir, "chroma"),
+        VECTOR_FLAT_DIR=os.path.join(workdir, "flat"),
+        EMBEDDING_CACHE_DIR=os.path.join(workdir, "embedding_cache"),
+        INDEX_MODE="local",
+        CATALOG_POLL_INTERVAL="0",
+        LOG_LEVEL="WARNING"
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.serve", "--port", str(api_port), "--encoder", args.encoder],
+        env=env,
+        # Agent 的 verbose 輸出不混入報告
+        stdout=subprocess.DEVNULL
+    )
+    args.url = f"http://127.0.0.1:{api_port}"
+    try:
+        wait_ready(args.url, args.startup_timeout)
+    except Exception:
+        for process in (server, ollama):
+            process.terminate()
+        raise
+    return [server, ollama]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/products/search and /ws/{client_id}")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenario", choices=["search", "ws", "all"], default="all")
+    parser.add_argument("--concurrency", type=int, default=16, help="每種情境的虛擬使用者數")
+    parser.add_argument("--duration", type=float, default=20, help="秒")
+    parser.add_argument("--products", type=int, default=1000, help="合成目錄的產品數（查詢依此產生）")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="同時寫入 JSON 檔案")
+    spawn_group = parser.add_argument_group("--spawn 選項")
+    spawn_group.add_argument("--spawn", action="store_true", help="自動啟動模擬 Ollama 與 API 伺服器")
+    spawn_group.add_argument("--encoder", choices=["hashing", "model"], default="hashing")
+    spawn_group.add_argument("--first-token-ms", type=float, default=200)
+    spawn_group.add_argument("--token-ms", type=float, default=20)
+    spawn_group.add_argument("--tokens", type=int, default=40)
+    spawn_group.add_argument("--startup-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    # 與伺服器的合成目錄使用相同的種子，查詢中的產品名稱都存在
+    queries = generate_queries(generate_products(args.products, args.seed), args.queries, args.seed)
+    processes: List[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+        try:
+            if args.spawn:
+                processes = spawn(args, workdir)
+            result = asyncio.run(run_load(args, queries))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    report: Dict[str, Any] = {
+        "benchmark": "loadtest",
+        "environment": environment(),
+        "config": {
+            key: getattr(args, key) for key in
+            ("url", "scenario", "concurrency", "duration", "products", "seed", "spawn", "encoder",
+             "first_token_ms", "token_ms", "tokens")
+        },
+        **result
+    }
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""檢索、工具與索引建置的微基準測試
+
+每個目錄規模在獨立的子程序中執行（全新的單例、暫存的向量索引與嵌入快取），
+量測 ProductService 建置與重新開啟索引的時間、search_products（快取未命中與
+命中）、ProductSearchTool._run 與 ProductRecommendationTool._run 的延遲分佈，
+結果以 JSON 輸出，可與先前版本的結果比較：
+
+    python -m benchmarks.microbench --sizes 10,1000,100000 --encoder hashing --output bench.json
+
+--encoder hashing 以字元 n-gram 雜湊代替 transformer，只量測檢索管線；
+--encoder model 使用設定的嵌入模型（EMBEDDING_BACKEND），包含編碼成本。
+"""
+from typing import List, Dict, Any, Callable
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from .report import environment, latency_summary, write_report
+from .synthetic_catalog import HashingEmbeddings, generate_queries, write_catalog
+
+
+def timed(fn: Callable[[str], Any], queries: List[str], before: Callable[[], None] = None) -> Dict[str, Any]:
+    """依序執行每個查詢，返回延遲分佈與吞吐量"""
+    samples = []
+    for query in queries:
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        fn(query)
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples, sum(samples))
+
+
+def build_service(encoder: str):
+    from app.services.embedding_service import CachedEmbeddings
+    from app.services.product_service import EMBEDDING_MODEL_NAME, ProductService
+
+    embeddings = None
+    if encoder == "hashing":
+        embeddings = CachedEmbeddings(EMBEDDING_MODEL_NAME, cache_dir=None, encoder=HashingEmbeddings())
+    return ProductService(embeddings=embeddings)
+
+
+def run_worker(args) -> Dict[str, Any]:
+    """在目前程序中量測（環境變量已指向暫存目錄）"""
+    from app.tools.product_tools import ProductRecommendationTool, ProductSearchTool
+
+    start = time.perf_counter()
+    service = build_service(args.encoder)
+    index_build = time.perf_counter() - start
+    # 索引清單與向量已存在：只比對雜湊，不重新嵌入
+    start = time.perf_counter()
+    service = build_service(args.encoder)
+    reopen = time.perf_counter() - start
+
+    queries = generate_queries(service.catalog.products, args.iterations, args.seed)
+    result: Dict[str, Any] = {
+        "products": len(service.catalog),
+        "vector_docs": service.vector_backend.count(),
+        "index_build_s": round(index_build, 3),
+        "index_reopen_s": round(reopen, 3)
+    }
+
+    # 第一個查詢包含詞彙索引與推薦索引的延遲建置
+    start = time.perf_counter()
+    service.search_products(queries[0])
+    result["first_search_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    recommend_tool = ProductRecommendationTool()
+    start = time.perf_counter()
+    recommend_tool._run(queries[0])
+    result["first_recommend_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+    invalidate = service.query_cache.invalidate
+    result["search_products"] = timed(service.search_products, queries, invalidate)
+    for query in queries:
+        service.search_products(query)
+    result["search_products_cached"] = timed(service.search_products, queries)
+    result["product_search_tool"] = timed(ProductSearchTool()._run, queries, invalidate)
+    result["product_recommendation_tool"] = timed(recommend_tool._run, queries)
+    return result
+
+
+def run_size(size: int, args) -> Dict[str, Any]:
+    """在子程序中量測一個目錄規模"""
+    with tempfile.TemporaryDirectory(prefix=f"bench-{size}-") as workdir:
+        products_file = write_catalog(os.path.join(workdir, "products.json"), size, args.seed)
+        env = dict(
+            os.environ,
+            PRODUCTS_FILE=products_file,
+            CHROMA_PERSIST_DIR=os.path.join(workdir, "chroma"),
+            VECTOR_FLAT_DIR=os.path.join(workdir, "flat"),
+            EMBEDDING_CACHE_DIR=os.path.join(workdir, "embedding_cache"),
+            VECTOR_BACKEND=args.vector_backend,
+            INDEX_MODE="local",
+            CATALOG_POLL_INTERVAL="0"
+        )
+        command = [
+            sys.executable, "-m", "benchmarks.microbench", "--worker",
+            "--encoder", args.encoder, "--iterations", str(args.iterations), "--seed", str(args.seed)
+        ]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            return {"products": size, "error": completed.stderr.strip().splitlines()[-1:]}
+        # 子程序的最後一行是結果 JSON
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for retrieval, tools and index build")
+    parser.add_argument("--sizes", default="10,1000,10000", help="以逗號分隔的產品數")
+    parser.add_argument("--iterations", type=int, default=200, help="每項量測的查詢數")
+    parser.add_argument("--encoder", choices=["hashing", "model"], default="hashing")
+    parser.add_argument("--vector-backend", choices=["chroma", "numpy"], default=os.getenv("VECTOR_BACKEND", "chroma"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="同時寫入 JSON 檔案")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args), ensure_ascii=False))
+        return
+
+    report: Dict[str, Any] = {
+        "benchmark": "microbench",
+        "environment": environment(),
+        "config": {
+            "encoder": args.encoder,
+            "vector_backend": args.vector_backend,
+            "iterations": args.iterations,
+            "seed": args.seed
+        },
+        "results": [run_size(int(size), args) for size in args.sizes.split(",") if size.strip()]
+    }
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
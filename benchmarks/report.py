@@ -0,0 +1,49 @@
+"""量測結果的統計與輸出"""
+from typing import List, Dict, Any, Optional
+import json
+import os
+import platform
+import subprocess
+import numpy as np
+
+
+def latency_summary(samples: List[float], elapsed: Optional[float] = None) -> Dict[str, Any]:
+    """延遲樣本（秒）的百分位數（毫秒）；指定總耗時時附上吞吐量"""
+    summary: Dict[str, Any] = {"count": len(samples)}
+    if samples:
+        values = np.asarray(samples) * 1000
+        summary.update({
+            "mean_ms": round(float(values.mean()), 3),
+            "p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p95_ms": round(float(np.percentile(values, 95)), 3),
+            "p99_ms": round(float(np.percentile(values, 99)), 3),
+            "max_ms": round(float(values.max()), 3)
+        })
+    if elapsed:
+        summary["throughput_per_s"] = round(len(samples) / elapsed, 1)
+    return summary
+
+
+def environment() -> Dict[str, Any]:
+    """硬體與版本資訊，比較不同版本或機器的結果時一併記錄"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+
+def write_report(report: Dict[str, Any], output: Optional[str] = None):
+    """輸出 JSON 到標準輸出，指定 output 時同時寫入檔案"""
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
@@ -0,0 +1,34 @@
+"""以效能測試設定啟動 API 伺服器
+
+與 `uvicorn app.main:app` 相同，但可以用雜湊編碼器代替 transformer（只量測
+服務與檢索管線），通常由 benchmarks.loadtest --spawn 啟動：
+
+    PRODUCTS_FILE=/tmp/products_10k.json OLLAMA_BASE_URL=http://127.0.0.1:11500 \\
+        python -m benchmarks.serve --port 8100 --encoder hashing
+"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--encoder", choices=["hashing", "model"], default="hashing")
+    args = parser.parse_args()
+
+    import uvicorn
+    from app.api.endpoints import products
+
+    if args.encoder == "hashing":
+        from .microbench import build_service
+
+        # 在背景載入前替換 ProductService 的建立方式
+        products.product_service.factory = lambda: build_service("hashing")
+
+    from app.main import app
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""合成產品目錄與編碼器
+
+以 products.json 的產品為範本放大到任意產品數（10 到 10 萬以上），每個產品的
+名稱、型號、價格、庫存、記憶體、儲存空間與描述用詞依種子決定，相同參數產生
+相同的目錄，不同版本之間的量測結果可以直接比較。
+
+    python -m benchmarks.synthetic_catalog --products 100000 --output /tmp/products_100k.json
+    python -m benchmarks.synthetic_catalog --products 1000000 --format jsonl --output /tmp/feed_1m.jsonl
+"""
+from typing import List, Dict, Any, Iterator
+import argparse
+import copy
+import hashlib
+import json
+import random
+import re
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.services.catalog import PRODUCTS_FILE
+
+FEATURE_WORDS = [
+    "輕薄", "電競", "降噪", "長續航", "旗艦", "入門", "防水", "快充", "高刷新率", "大螢幕",
+    "商務", "創作", "學生", "無線", "藍牙", "觸控", "OLED", "5G", "Wi-Fi 7", "AI"
+]
+SERIES = ["Pro", "Max", "Air", "Lite", "Ultra", "Plus", "mini", "SE", "X", "S"]
+RAM_CHOICES = [4, 8, 12, 16, 24, 32, 64]
+STORAGE_CHOICES = ["128GB", "256GB", "512GB", "1TB", "2TB"]
+# 常見的查詢類型：名稱、規格、庫存、推薦與預算條件
+QUERY_TEMPLATES = [
+    "{name} 規格",
+    "{name} 多少錢",
+    "{name} 還有庫存嗎",
+    "推薦{feature}的{category}",
+    "預算{budget}以內的{category}",
+    "{feature} {category} {ram}GB記憶體",
+    "有哪些{category}",
+    "{feature}{category}推薦"
+]
+
+
+def load_templates(path: str = str(PRODUCTS_FILE)) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["products"]
+
+
+def iter_products(count: int, seed: int = 0, templates: List[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """逐一產生 count 個產品，前幾個與範本完全相同（真實產品名稱仍可查到）"""
+    templates = templates or load_templates()
+    rng = random.Random(seed)
+    for i in range(count):
+        template = templates[i % len(templates)]
+        if i < len(templates):
+            yield copy.deepcopy(template)
+            continue
+        product = copy.deepcopy(template)
+        series = rng.choice(SERIES)
+        product["id"] = f"S{i:07d}"
+        product["name"] = f"{template['name']} {series} {i}"
+        product["price"] = int(round(template["price"] * rng.uniform(0.4, 2.0), -2))
+        product["stock"] = rng.choice([0, 0, 3, 10, 25, 50, 120])
+        specs = product.get("specs", {})
+        if "ram" in specs:
+            specs["ram"] = f"{rng.choice(RAM_CHOICES)}GB"
+        if "storage" in specs:
+            specs["storage"] = rng.choice(STORAGE_CHOICES)
+        features = rng.sample(FEATURE_WORDS, 3)
+        product["description"] = f"{product['name']}，{'、'.join(features)}。{template['description']}"
+        yield product
+
+
+def generate_products(count: int, seed: int = 0, templates: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    return list(iter_products(count, seed, templates))
+
+
+def write_catalog(path: str, count: int, seed: int = 0) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"products": generate_products(count, seed)}, f, ensure_ascii=False)
+    return path
+
+
+def write_feed(path: str, count: int, seed: int = 0) -> str:
+    """以 JSONL 逐行寫入（app.services.ingest 的輸入格式），不在記憶體中保留整個目錄"""
+    with open(path, "w", encoding="utf-8") as f:
+        for product in iter_products(count, seed):
+            f.write(json.dumps(product, ensure_ascii=False) + "\n")
+    return path
+
+
+def generate_queries(products: List[Dict[str, Any]], count: int, seed: int = 0) -> List[str]:
+    """依目錄產生可重現的查詢集合"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for i in range(count):
+        product = rng.choice(products)
+        queries.append(QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)].format(
+            name=product["name"],
+            category=product["category"],
+            feature=rng.choice(FEATURE_WORDS),
+            budget=rng.choice(["一萬", "兩萬", "三萬", "5萬"]),
+            ram=rng.choice(RAM_CHOICES)
+        ))
+    return queries
+
+
+class HashingEmbeddings(Embeddings):
+    """以字元 n-gram 雜湊產生的正規化向量
+
+    不需要下載模型，編碼成本遠低於 transformer，用來單獨量測檢索管線
+    （索引、最近鄰查詢、融合排名與工具輸出）的效能；語意品質不具參考價值。
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _encode(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = re.sub(r"\s+", " ", text.lower())
+        for n in (1, 2, 3):
+            for i in range(max(0, len(text) - n + 1)):
+                digest = hashlib.blake2b(text[i:i + n].encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._encode(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode(text).tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic product catalog")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=["json", "jsonl"], default="json", help="jsonl 為匯入用的產品資料")
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+    if args.format == "jsonl":
+        write_feed(args.output, args.products, args.seed)
+    else:
+        write_catalog(args.output, args.products, args.seed)
+    print(args.output)
+
+
+if __name__ == "__main__":
+    main()
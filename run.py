@@ -1,14 +1,72 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
 import uvicorn
-from fastapi.staticfiles import StaticFiles
-from app.main import app
 
-# 掛載靜態文件
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+
+def create_app():
+    """建立應用並掛載靜態文件（每個工作程序各自呼叫）"""
+    from fastapi.staticfiles import StaticFiles
+    from app.main import app
+
+    # 掛載靜態文件
+    app.mount("/static", StaticFiles(directory="app/static"), name="static")
+    return app
+
+
+def start_index_builder(snapshot_dir: str, timeout: float) -> subprocess.Popen:
+    """啟動索引建置程序，等待第一個世代發布後返回"""
+    builder = subprocess.Popen(
+        [sys.executable, "-m", "app.services.index_builder", "--watch", "--output", snapshot_dir]
+    )
+    current = Path(snapshot_dir) / "CURRENT"
+    # 先前發布的世代仍可使用，但等待本次建置完成以免工作程序讀到過期索引
+    started = time.time()
+    previous = current.stat().st_mtime if current.exists() else None
+    while time.time() - started < timeout:
+        if builder.poll() is not None:
+            raise SystemExit(f"Index builder exited with code {builder.returncode}")
+        if current.exists() and current.stat().st_mtime != previous:
+            return builder
+        time.sleep(0.5)
+    builder.terminate()
+    raise SystemExit(f"Index builder did not publish a generation within {timeout:.0f}s")
+
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    ) 
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")),
+                        help="工作程序數，大於 0 時以生產模式啟動（預設為單一程序的開發模式）")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--builder-timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    if args.workers <= 0:
+        uvicorn.run(
+            "run:create_app",
+            factory=True,
+            host=args.host,
+            port=args.port,
+            reload=True
+        )
+    else:
+        # 生產模式：單一建置程序維護 Chroma 並發布索引世代，工作程序只映射唯讀世代
+        from app.services.index_snapshot import INDEX_SNAPSHOT_DIR
+
+        builder = start_index_builder(INDEX_SNAPSHOT_DIR, args.builder_timeout)
+        os.environ["INDEX_MODE"] = "shared"
+        try:
+            uvicorn.run(
+                "run:create_app",
+                factory=True,
+                host=args.host,
+                port=args.port,
+                workers=args.workers
+            )
+        finally:
+            builder.terminate()
+            builder.wait()
@@ -0,0 +1,37 @@
+import os
+import shutil
+import sys
+from pathlib import Path
+import pytest
+
+# 測試不啟動背景監看執行緒
+os.environ.setdefault("CATALOG_POLL_INTERVAL", "0")
+os.environ.setdefault("INDEX_SNAPSHOT_POLL_INTERVAL", "0")
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# 範例目錄：iPhone 15 Pro (P001)、MacBook Pro (P002)、Sony WH-1000XM5 (P003)
+SAMPLE_PRODUCTS = ROOT / "app" / "data" / "documents" / "products.json"
+
+
+@pytest.fixture
+def products_file(tmp_path):
+    """可修改的範例目錄副本"""
+    path = tmp_path / "products.json"
+    shutil.copy(SAMPLE_PRODUCTS, path)
+    return path
+
+
+@pytest.fixture
+def catalog_store(products_file):
+    from app.services.catalog import CatalogStore
+
+    return CatalogStore(products_file, poll_interval=0)
+
+
+@pytest.fixture
+def inventory(catalog_store):
+    from app.services.inventory import InventoryStore
+
+    return InventoryStore(catalog_store)
@@ -0,0 +1,25 @@
+from pathlib import Path
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnxruntime")
+
+from app.services.onnx_embeddings import MODEL_FILENAME, ONNX_MODEL_DIR
+
+# 需要先以 `python -m app.services.onnx_embeddings` 匯出模型（匯出時已下載 torch 模型）
+pytestmark = pytest.mark.skipif(
+    not (Path(ONNX_MODEL_DIR) / MODEL_FILENAME).exists(),
+    reason=f"ONNX model not exported to {ONNX_MODEL_DIR}"
+)
+
+MIN_COSINE = 0.98
+
+
+def test_onnx_embeddings_match_torch():
+    from benchmarks.embedding_parity import parity_report
+
+    report = parity_report()
+
+    assert report["cosine_min"] >= MIN_COSINE, report
+    assert report["top1_agreement"] == 1.0, report
@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from app import main
+
+
+class FakeConnection:
+    client_id = "client"
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, payload):
+        self.sent.append(payload)
+
+
+class FakeAgent:
+    def __init__(self, events):
+        self.events = events
+
+    async def astream(self, message, session_id=None):
+        for event in self.events:
+            yield event
+
+
+class ReadyAgent:
+    def __init__(self, agent):
+        self.agent = agent
+
+    async def wait(self):
+        return self.agent
+
+
+def _handle(monkeypatch, events):
+    monkeypatch.setattr(main, "product_agent", ReadyAgent(FakeAgent(events)))
+    connection = FakeConnection()
+    asyncio.run(main.handle_message(connection, "r1", {"type": "chat", "content": "推薦筆電"}))
+    return connection.sent
+
+
+def test_final_event_is_sent_as_response(monkeypatch):
+    sent = _handle(monkeypatch, [
+        {"type": "token", "delta": "好"},
+        {"type": "final", "status": "success", "response": "好的"}
+    ])
+
+    assert sent[0] == {"type": "token", "delta": "好", "request_id": "r1"}
+    assert sent[-1]["content"] == "好的" and sent[-1]["status"] == "success"
+
+
+def test_stream_without_final_event_returns_error(monkeypatch):
+    sent = _handle(monkeypatch, [{"type": "token", "delta": "好"}])
+
+    assert sent[-1]["type"] == "response"
+    assert sent[-1]["request_id"] == "r1"
+    assert sent[-1]["status"] == "error"
+    assert sent[-1]["route"] == "agent"
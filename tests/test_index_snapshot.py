@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from app.services.index_snapshot import IndexModelMismatchError, IndexPublisher, SharedIndex
+
+CHUNKS = [
+    {"id": "P001:basic_info:0", "content": "iPhone", "metadata": {"id": "P001"}},
+    {"id": "P002:basic_info:0", "content": "MacBook", "metadata": {"id": "P002"}}
+]
+VECTORS = np.eye(2, 4, dtype=np.float32)
+
+
+@pytest.fixture
+def publisher(tmp_path):
+    return IndexPublisher(str(tmp_path / "snapshots"), keep=2)
+
+
+def _shared(publisher):
+    index = SharedIndex(str(publisher.directory), poll_interval=0)
+    index.refresh()
+    return index
+
+
+def test_refresh_switches_to_published_generation(publisher):
+    index = _shared(publisher)
+    assert index.current is None
+
+    publisher.publish([], CHUNKS, VECTORS, "model-a")
+    assert index.refresh()
+    assert index.current.generation == 1
+    assert not index.refresh()
+
+    results = index.search(np.array([[1, 0, 0, 0]], dtype=np.float32), 2)
+    assert [doc.metadata["id"] for doc, _ in results[0]] == ["P001", "P002"]
+    assert results[0][0][1] == pytest.approx(0.0)
+    filtered = index.search(np.array([[1, 0, 0, 0]], dtype=np.float32), 2, allowed={"P002"})
+    assert [doc.metadata["id"] for doc, _ in filtered[0]] == ["P002"]
+
+
+def test_publish_keeps_only_recent_generations(publisher):
+    for _ in range(3):
+        publisher.publish([], CHUNKS, VECTORS, "model-a")
+    assert [path.name for path in publisher._generations()] == ["gen-000002", "gen-000003"]
+
+
+def test_require_model_rejects_mismatched_current_generation(publisher):
+    publisher.publish([], CHUNKS, VECTORS, "model-a")
+    index = _shared(publisher)
+
+    with pytest.raises(IndexModelMismatchError):
+        index.require_model("model-b")
+    index.require_model("model-a")
+
+
+def test_require_model_ignores_later_mismatched_generations(publisher):
+    publisher.publish([], CHUNKS, VECTORS, "model-a")
+    index = _shared(publisher)
+    index.require_model("model-a")
+
+    publisher.publish([], CHUNKS, VECTORS, "model-b")
+    assert not index.refresh()
+    assert index.current.generation == 1
+
+    publisher.publish([], CHUNKS, VECTORS, "model-a")
+    assert index.refresh()
+    assert index.current.generation == 3
+
+
+def test_generation_listener_receives_new_generation(publisher):
+    index = _shared(publisher)
+    seen = []
+    index.subscribe(lambda generation: seen.append(generation.generation))
+    publisher.publish([{"id": "P001"}], CHUNKS, VECTORS, "model-a")
+    index.refresh()
+    assert seen == [1]
+    assert index.current.products_file.exists()
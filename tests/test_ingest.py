@@ -0,0 +1,100 @@
+import hashlib
+import json
+import pytest
+from benchmarks.synthetic_catalog import HashingEmbeddings, write_feed
+from app.services import ingest
+from app.services.embedding_service import CachedEmbeddings
+from app.services.vector_backends import FLAT_CURRENT_FILENAME, NumpyFlatBackend
+
+
+class FlakyEmbeddings(HashingEmbeddings):
+    """第 fail_at 次編碼時失敗，模擬匯入中斷"""
+
+    def __init__(self, fail_at=None):
+        super().__init__(dim=32)
+        self.fail_at = fail_at
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise RuntimeError("encoder crashed")
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "VECTOR_FLAT_DIR", str(tmp_path / "flat"))
+    feed = write_feed(str(tmp_path / "feed.jsonl"), 300, seed=0)
+    with open(feed, "a", encoding="utf-8") as f:
+        f.write("{not json\n")
+        f.write(json.dumps({"id": "X1", "name": "missing fields"}) + "\n")
+    return tmp_path
+
+
+def _ingestor(workdir, fail_at=None):
+    embeddings = CachedEmbeddings("hashing", cache_dir=None, encoder=FlakyEmbeddings(fail_at))
+    return ingest.CatalogIngestor(
+        embeddings=embeddings,
+        backend="numpy",
+        catalog_path=workdir / "products.json",
+        batch_size=20
+    )
+
+
+def _outputs(workdir):
+    flat = workdir / "flat"
+    generation = flat / (flat / FLAT_CURRENT_FILENAME).read_text().strip()
+    files = [
+        workdir / "products.json",
+        workdir / "rejects.jsonl",
+        flat / "index_manifest.json",
+        generation / "rows.json",
+        generation / "vectors.f32"
+    ]
+    return {path.name: hashlib.sha256(path.read_bytes()).hexdigest() for path in files}
+
+
+def test_ingest_validates_and_writes_index(workdir):
+    stats = _ingestor(workdir).run(workdir / "feed.jsonl", rejects=workdir / "rejects.jsonl")
+
+    assert stats["products"] == 300
+    assert stats["rejected"] == 2
+    catalog = json.loads((workdir / "products.json").read_text(encoding="utf-8"))
+    assert len(catalog["products"]) == 300
+    assert NumpyFlatBackend(str(workdir / "flat")).count() == stats["chunks"]
+    manifest = json.loads((workdir / "flat" / "index_manifest.json").read_text(encoding="utf-8"))
+    assert len(manifest["documents"]) == 900
+
+
+def test_resume_after_failure_matches_uninterrupted_run(workdir):
+    feed = workdir / "feed.jsonl"
+    full = _ingestor(workdir)
+    full.run(feed, rejects=workdir / "rejects.jsonl")
+    expected = _outputs(workdir)
+
+    with pytest.raises(RuntimeError):
+        _ingestor(workdir, fail_at=8).run(feed, rejects=workdir / "rejects.jsonl", restart=True)
+    checkpoint = json.loads((workdir / "feed.jsonl.checkpoint.json").read_text(encoding="utf-8"))
+    assert 0 < checkpoint["stats"]["products"] < 300
+
+    resumed = _ingestor(workdir)
+    stats = resumed.run(feed, rejects=workdir / "rejects.jsonl")
+
+    assert stats["resumed"]
+    assert stats["products"] == 300
+    assert _outputs(workdir) == expected
+    assert not (workdir / "feed.jsonl.checkpoint.json").exists()
+    # 續傳只嵌入檢查點之後的產品
+    assert resumed.embeddings.encoder.calls < full.embeddings.encoder.calls
+
+
+def test_checkpoint_for_another_feed_is_rejected(workdir):
+    feed = workdir / "feed.jsonl"
+    with pytest.raises(RuntimeError):
+        _ingestor(workdir, fail_at=8).run(feed)
+    assert (workdir / "feed.jsonl.checkpoint.json").exists()
+    with open(feed, "a", encoding="utf-8") as f:
+        f.write("\n")
+    with pytest.raises(ValueError):
+        _ingestor(workdir).run(feed)
@@ -0,0 +1,64 @@
+import json
+import pytest
+from app.services.inventory import InventoryReadOnlyError, InventoryStore
+
+
+def test_seeded_from_catalog(inventory):
+    assert inventory.price("P001") == 35900
+    assert inventory.stock("P002") == 30
+    assert inventory.price("missing") is None
+
+
+def test_apply_updates_absolute_and_delta(inventory):
+    notified = []
+    inventory.subscribe(notified.append)
+
+    result = inventory.apply_updates([
+        {"product_id": "P001", "price": 33900},
+        {"product_id": "P002", "stock_delta": -5},
+        {"product_id": "P003", "stock": 7, "stock_delta": 1}
+    ])
+
+    assert result == {"applied": 3, "errors": [], "version": 1}
+    assert inventory.price("P001") == 33900
+    assert inventory.stock("P002") == 25
+    assert inventory.stock("P003") == 8
+    assert notified == [{"P001", "P002", "P003"}]
+
+
+def test_apply_updates_rejects_invalid_items(inventory):
+    result = inventory.apply_updates([
+        {"product_id": "missing", "stock": 1},
+        {"product_id": "P001", "stock_delta": -51},
+        {"product_id": "P002", "price": -1}
+    ])
+
+    assert result["applied"] == 0
+    assert [error["error"] for error in result["errors"]] == ["unknown product", "insufficient stock", "invalid price"]
+    # 沒有套用任何項目時版本不變
+    assert result["version"] == 0
+    assert inventory.stock("P001") == 50
+
+
+def test_select_filters_by_live_values(inventory):
+    inventory.apply_updates([{"product_id": "P003", "stock": 0}])
+    assert inventory.select(min_price=20000, max_price=40000) == {"P001"}
+    assert inventory.select(min_price=10000, in_stock=True) == {"P001", "P002"}
+
+
+def test_catalog_file_values_override(inventory, catalog_store, products_file):
+    inventory.apply_updates([{"product_id": "P001", "stock": 1}])
+    data = json.loads(products_file.read_text(encoding="utf-8"))
+    data["products"][0]["stock"] = 80
+    products_file.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    catalog_store.reload()
+
+    assert inventory.stock("P001") == 80
+
+
+def test_read_only_store_rejects_updates(catalog_store):
+    store = InventoryStore(catalog_store, read_only=True)
+    with pytest.raises(InventoryReadOnlyError):
+        store.apply_updates([{"product_id": "P001", "stock": 1}])
+    assert store.stock("P001") == 50
@@ -0,0 +1,42 @@
+import pytest
+from langchain.schema import Document
+from benchmarks.synthetic_catalog import HashingEmbeddings
+from app.services.embedding_service import CachedEmbeddings
+from app.services.product_service import ProductService
+from app.services.query_cache import QueryCache
+from app.services.recommender import RecommendationEngine
+from app.services.retrieval import HybridRetriever
+from app.services.vector_backends import NumpyFlatBackend
+
+
+def _vector_hit(document, distance):
+    return {"product_id": document.metadata["id"], "score": 1.0 - distance / 2, "document": document, "distance": distance}
+
+
+@pytest.fixture
+def service(tmp_path, catalog_store, inventory):
+    service = ProductService(
+        catalog_store=catalog_store,
+        inventory=inventory,
+        query_cache=QueryCache(lambda: "v"),
+        retriever=HybridRetriever(catalog_store),
+        vector_backend=NumpyFlatBackend(str(tmp_path / "flat")),
+        recommender=RecommendationEngine(catalog_store, inventory),
+        embeddings=CachedEmbeddings("hashing", cache_dir=None, encoder=HashingEmbeddings(dim=32))
+    )
+    yield service
+    service._search_executor.shutdown()
+
+
+def test_hits_report_vector_distance_and_fusion_score(service):
+    document = Document(page_content="Sony WH-1000XM5", metadata={"id": "P003", "name": "Sony WH-1000XM5", "type": "description"})
+    hits = service.retriever.fuse([("P001", 2.0)], [_vector_hit(document, 0.3)], k=2)
+
+    results = {result["metadata"]["id"]: result for result in service._format_hits("降噪耳機", hits)}
+
+    # relevance_score 維持向量距離（越低越相關），排序依 fusion_score
+    assert results["P003"]["relevance_score"] == pytest.approx(0.3)
+    assert results["P003"]["fusion_score"] == pytest.approx(hits[1]["score"])
+    # 只由詞彙索引命中的產品沒有向量距離
+    assert results["P001"]["relevance_score"] is None
+    assert results["P001"]["fusion_score"] == pytest.approx(hits[0]["score"])
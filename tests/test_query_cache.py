@@ -0,0 +1,56 @@
+import pytest
+from app.services.query_cache import CacheBackend, LocalCacheBackend, QueryCache
+
+
+@pytest.fixture
+def version():
+    return {"value": "1.0"}
+
+
+def test_cache_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_key_includes_version_and_normalized_query(version):
+    cache = QueryCache(lambda: version["value"])
+    key = cache.make_key("search", "iPhone  15", 3)
+    assert key == cache.make_key("search", "iphone 15", 3)
+    version["value"] = "2.0"
+    assert cache.make_key("search", "iPhone 15", 3) != key
+
+
+def test_get_or_compute_computes_once(version):
+    cache = QueryCache(lambda: version["value"])
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return ["result"]
+
+    assert cache.get_or_compute("search", "q", 3, compute) == ["result"]
+    assert cache.get_or_compute("search", "q", 3, compute) == ["result"]
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_lru_eviction(version):
+    cache = QueryCache(lambda: version["value"], max_entries=2)
+    for query in ("a", "b", "c"):
+        cache.set(cache.make_key("search", query), query)
+    assert cache.get(cache.make_key("search", "a")) is None
+    assert cache.get(cache.make_key("search", "c")) == "c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_shared_backend_fills_local_tier(version):
+    backend = LocalCacheBackend()
+    writer = QueryCache(lambda: version["value"], backend=backend)
+    reader = QueryCache(lambda: version["value"], backend=backend)
+    key = writer.make_key("search", "q")
+    writer.set(key, ["shared"])
+
+    assert reader.get(key) == ["shared"]
+    assert reader.stats()["backend_hits"] == 1
+    assert reader.get(key) == ["shared"]
+    assert reader.stats()["hits"] == 1
@@ -0,0 +1,85 @@
+import pytest
+from langchain.schema import Document
+from app.services.retrieval import HybridRetriever, group_by_product, reciprocal_rank_fusion
+
+
+@pytest.fixture
+def retriever(catalog_store):
+    return HybridRetriever(catalog_store, rrf_k=60)
+
+
+def _vector_hit(product_id, distance):
+    return {
+        "product_id": product_id,
+        "score": 1.0 - distance / 2,
+        "document": Document(page_content=product_id, metadata={"id": product_id}),
+        "distance": distance
+    }
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]], k=60)
+    assert [item for item, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_fuse_orders_by_fusion_score_and_keeps_vector_documents(retriever):
+    lexical = [("P001", 3.0), ("P002", 2.0)]
+    vector_hits = [_vector_hit("P002", 0.1), _vector_hit("P003", 0.4)]
+
+    hits = retriever.fuse(lexical, vector_hits, k=3)
+
+    assert [hit["product_id"] for hit in hits] == ["P002", "P001", "P003"]
+    assert hits[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert hits[0]["document"].metadata["id"] == "P002"
+    # 只出現在詞彙排名的產品沒有向量文檔
+    assert hits[1]["document"] is None and hits[1]["distance"] is None
+
+
+def test_fuse_truncates_to_k(retriever):
+    hits = retriever.fuse([("P001", 1.0), ("P002", 1.0), ("P003", 1.0)], [], k=2)
+    assert [hit["product_id"] for hit in hits] == ["P001", "P002"]
+
+
+def test_group_by_product_keeps_nearest_document():
+    docs = [
+        (Document(page_content="a1", metadata={"id": "A"}), 0.2),
+        (Document(page_content="b1", metadata={"id": "B"}), 0.1),
+        (Document(page_content="a2", metadata={"id": "A"}), 0.05),
+        (Document(page_content="c1", metadata={"id": "C"}), 1.5)
+    ]
+    groups = group_by_product(docs, max_distance=1.0)
+    assert [group["product_id"] for group in groups] == ["A", "B"]
+    assert groups[0]["document"].page_content == "a2"
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("iPhone 15 Pro 規格", ["P001"]),
+    ("m3 pro laptop", ["P002"]),
+    ("有 M3 Pro 的筆電嗎", ["P002"]),
+    ("wh-1000xm5 耳機", ["P003"]),
+    ("pro laptop", [])
+])
+def test_exact_product_ids_matches_names_and_model_ngrams(catalog_store, query, expected):
+    assert HybridRetriever.exact_product_ids(query, catalog_store.catalog) == expected
+
+
+def test_search_without_vector_index_is_lexical_only(retriever):
+    assert not retriever.vector_ready
+    hits = retriever.search("降噪耳機", k=1)
+    assert [hit["product_id"] for hit in hits] == ["P003"]
+
+
+def test_search_fuses_registered_vector_search(retriever):
+    calls = []
+
+    def vector_search(queries, k, allowed):
+        calls.append((queries, k, allowed))
+        return [[_vector_hit("P002", 0.1)] for _ in queries]
+
+    retriever.set_vector_search(vector_search)
+    hits = retriever.search("適合工作的電腦", k=2, allowed={"P002", "P003"})
+
+    assert calls == [(["適合工作的電腦"], 2, [{"P002", "P003"}])]
+    assert hits[0]["product_id"] == "P002"
+    assert all(hit["product_id"] in {"P002", "P003"} for hit in hits)
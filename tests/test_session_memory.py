@@ -0,0 +1,39 @@
+from langchain.schema import AIMessage, HumanMessage
+from app.agents.session_memory import SessionMemoryStore, count_tokens
+
+
+def _turn_tokens(user_input, output):
+    return count_tokens(user_input) + count_tokens(output)
+
+
+def test_history_window_keeps_whole_turns():
+    store = SessionMemoryStore(max_tokens=10_000)
+    store.save_turn("s", "第一個問題" * 20, "短")
+    store.save_turn("s", "問", "第二個回覆")
+
+    # 預算只夠最後一輪的回覆加上前一輪的回覆時，也不會以回覆開頭
+    budget = _turn_tokens("問", "第二個回覆") + count_tokens("短")
+    history = store.history("s", max_tokens=budget)
+
+    assert [type(message) for message in history] == [HumanMessage, AIMessage]
+    assert history[0].content == "問"
+
+
+def test_session_limit_drops_oldest_turns():
+    limit = _turn_tokens("問題二", "回覆二") + 2
+    store = SessionMemoryStore(max_tokens=limit)
+    store.save_turn("s", "問題一", "回覆一")
+    store.save_turn("s", "問題二", "回覆二")
+
+    history = store.history("s")
+
+    assert [message.content for message in history] == ["問題二", "回覆二"]
+    assert store.stats()["total_tokens"] == _turn_tokens("問題二", "回覆二")
+
+
+def test_drop_releases_tokens():
+    store = SessionMemoryStore()
+    store.save_turn("s", "問", "答")
+    store.drop("s")
+    assert store.history("s") == []
+    assert store.stats()["total_tokens"] == 0
@@ -0,0 +1,79 @@
+from app.tools.tool_output import make_cursor, parse_cursor, project_product, render_page
+
+
+def _records(count, description="", specs=None):
+    return [
+        project_product(
+            {"name": f"產品 {i}", "category": "手機", "description": description, "specs": specs or {}},
+            price=1000 + i,
+            stock=i
+        )
+        for i in range(count)
+    ]
+
+
+def test_parse_cursor_splits_offset():
+    assert parse_cursor("列出所有產品 #more=5") == ("列出所有產品", 5)
+    assert parse_cursor("列出所有產品") == ("列出所有產品", 0)
+    # 游標只認結尾的 #more=N
+    assert parse_cursor("#more=5 列出所有產品") == ("#more=5 列出所有產品", 0)
+
+
+def test_cursor_round_trip():
+    assert parse_cursor(make_cursor("有哪些耳機", 10)) == ("有哪些耳機", 10)
+
+
+def test_project_product_truncates_description_and_keeps_stock():
+    record = project_product(
+        {"name": "A", "category": "手機", "description": "很" * 200, "specs": {"ram": "8GB", "storage": "256GB"}},
+        price=100,
+        stock=0
+    )
+    assert record["price"] == "NT$100"
+    assert record["stock"] == "0台"
+    assert record["specs"] == "ram: 8GB; storage: 256GB"
+    assert record["description"].endswith("…")
+    assert "stock" not in project_product({"name": "A"}, price=100)
+
+
+def test_render_page_paginates_with_cursor_footer():
+    text = render_page(_records(7), "列出所有產品", page_size=5, tool_name="product_search")
+    assert "共 7 項，第 1-5 項" in text
+    assert "產品 4" in text and "產品 5" not in text
+    assert 'product_search("列出所有產品 #more=5")' in text
+
+    last = render_page(_records(7), "列出所有產品", offset=5, page_size=5)
+    assert "第 6-7 項" in last
+    assert "#more=" not in last
+
+
+def test_render_page_projects_only_the_page():
+    projected = []
+
+    def project(i):
+        projected.append(i)
+        return project_product({"name": f"產品 {i}"}, price=1000 + i)
+
+    text = render_page(list(range(50)), "列出所有產品", offset=10, page_size=5, project=project)
+
+    assert projected == [10, 11, 12, 13, 14]
+    assert "共 50 項，第 11-15 項" in text
+    assert "#more=15" in text
+
+
+def test_render_page_drops_fields_in_priority_order():
+    records = _records(3, description="描述" * 30, specs={"processor": "A17 Pro", "ram": "8GB"})
+    full = render_page(records, "q", max_tokens=10_000)
+    assert "規格" in full and "描述" in full
+
+    trimmed = render_page(records, "q", max_tokens=len(full) // 2)
+    # 規格最先被捨棄，名稱與價格保留
+    assert "規格" not in trimmed
+    assert all(f"產品 {i}" in trimmed and f"NT${1000 + i}" in trimmed for i in range(3))
+
+
+def test_render_page_last_resort_keeps_price():
+    record = project_product({"name": "超長名稱" * 200, "category": "手機"}, price=35900, stock=3)
+    text = render_page([record], "q", max_tokens=60)
+    assert "NT$35900" in text
+    assert "…" in text
@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+from langchain.schema import Document
+from app.services.vector_backends import (
+    FLAT_CURRENT_FILENAME,
+    FLAT_DELTA_LOG,
+    FLAT_DELTA_VECTORS,
+    NumpyFlatBackend,
+    ReadOnlyIndexError,
+    SharedIndexBackend,
+    VectorBackend,
+    flat_generations
+)
+
+DIM = 8
+
+
+class Reference:
+    """以字典保存的預期內容，逐筆暴力計算最近鄰"""
+
+    def __init__(self, backend: NumpyFlatBackend, seed: int = 0):
+        self.backend = backend
+        self.vectors = {}
+        self.rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def product(chunk_id: str) -> str:
+        return f"P{int(chunk_id.split('-')[1]) % 5}"
+
+    def add(self, ids):
+        vectors = self.rng.standard_normal((len(ids), DIM)).astype(np.float32)
+        documents = [Document(page_content=chunk_id, metadata={"id": self.product(chunk_id)}) for chunk_id in ids]
+        self.backend.add(ids, documents, vectors)
+        self.vectors.update(zip(ids, vectors))
+
+    def delete(self, ids):
+        self.backend.delete(ids)
+        for chunk_id in ids:
+            self.vectors.pop(chunk_id, None)
+
+    def check(self, backend=None):
+        backend = backend or self.backend
+        assert sorted(backend.ids()) == sorted(self.vectors)
+        queries = self.rng.standard_normal((3, DIM)).astype(np.float32)
+        for allowed in (None, {"P1", "P3"}):
+            ids = [chunk_id for chunk_id in sorted(self.vectors) if allowed is None or self.product(chunk_id) in allowed]
+            matrix = np.stack([self.vectors[chunk_id] for chunk_id in ids])
+            for query, results in zip(queries, backend.query(queries, 5, allowed)):
+                expected = np.sort(((matrix - query) ** 2).sum(axis=1))[:5]
+                assert np.allclose([distance for _, distance in results], expected, atol=1e-4)
+                assert all(doc.page_content in self.vectors for doc, _ in results)
+        chunks, vectors = backend.export()
+        assert [chunk["id"] for chunk in chunks] == sorted(self.vectors)
+        assert np.allclose(vectors, np.stack([self.vectors[chunk["id"]] for chunk in chunks]))
+
+
+@pytest.fixture
+def reference(tmp_path):
+    reference = Reference(NumpyFlatBackend(str(tmp_path / "flat"), compact_ratio=0.25))
+    reference.add([f"d-{i}" for i in range(100)])
+    return reference
+
+
+def _generations(reference):
+    return [path.name for path in flat_generations(reference.backend.directory)]
+
+
+def test_small_updates_append_to_delta_segment(reference):
+    assert _generations(reference) == ["gen-000001"]
+    for i in range(5):
+        reference.add([f"d-{i}"])
+        reference.delete([f"d-{50 + i}"])
+
+    assert _generations(reference) == ["gen-000001"]
+    stats = reference.backend.stats()
+    assert stats["delta_rows"] == 5 and stats["tombstones"] == 10
+    reference.check()
+
+
+def test_delta_is_replayed_on_reload(reference):
+    reference.add(["d-1", "d-200"])
+    reference.delete(["d-2"])
+    reference.check(NumpyFlatBackend(str(reference.backend.directory)))
+
+
+def test_compacts_into_new_generation(reference):
+    for i in range(30):
+        reference.add([f"d-{300 + i}"])
+    assert len(_generations(reference)) == 1
+    assert _generations(reference) != ["gen-000001"]
+    generation = reference.backend.directory / (reference.backend.directory / FLAT_CURRENT_FILENAME).read_text()
+    assert reference.backend.stats()["delta_rows"] < 30
+    assert (generation / "vectors.f32").exists()
+    reference.check()
+
+
+def test_torn_delta_tail_is_truncated(reference):
+    reference.add(["d-7"])
+    generation = flat_generations(reference.backend.directory)[-1]
+    with open(generation / FLAT_DELTA_VECTORS, "ab") as f:
+        f.write(b"\0" * DIM * 4)
+    with open(generation / FLAT_DELTA_LOG, "a", encoding="utf-8") as f:
+        f.write('{"op": "del')
+
+    reference.check(NumpyFlatBackend(str(reference.backend.directory)))
+
+
+def test_inconsistent_generation_is_rejected(reference):
+    generation = flat_generations(reference.backend.directory)[-1]
+    with open(generation / "vectors.f32", "ab") as f:
+        f.write(b"\0" * 4)
+    with pytest.raises(ValueError):
+        NumpyFlatBackend(str(reference.backend.directory))
+
+
+def test_clear_and_duplicate_ids(reference):
+    reference.backend.clear()
+    reference.vectors.clear()
+    assert reference.backend.count() == 0
+    reference.add(["d-1", "d-1"])
+    assert reference.backend.count() == 1
+    reference.check()
+
+
+def test_vector_backend_is_abstract():
+    with pytest.raises(TypeError):
+        VectorBackend()
+
+
+def test_shared_backend_is_read_only(tmp_path):
+    from app.services.index_snapshot import SharedIndex
+
+    backend = SharedIndexBackend(SharedIndex(str(tmp_path), poll_interval=0))
+    with pytest.raises(ReadOnlyIndexError):
+        backend.add([], [], np.zeros((0, DIM), dtype=np.float32))
+    with pytest.raises(ReadOnlyIndexError):
+        backend.delete(["x"])